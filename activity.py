@@ -0,0 +1,140 @@
+import math
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Busy hours of each facility: a 7×24 matrix (Monday first, hours 0-23 in the
+# server's local time) of time-decayed counts of activity events, such as reviews
+# and bed-count updates. Each facility has one document in `activity`:
+#
+#   {_id: facility_id, events: <raw count>, landmark: <datetime>, half_life: <seconds>,
+#    cells: {'<day * 24 + hour>': <weight>}}
+#
+# Counters use forward decay. An event at time t adds 2 ** ((t - landmark) / half_life)
+# to its cell rather than 1, so recording it is a single $inc and older cells never
+# need rewriting. Dividing by the same factor for the current time when the matrix
+# is read leaves counts in which an event one half-life old counts 1/2.
+#
+# Weights grow with time since the landmark, so the landmark moves forward every
+# REBASE_HALF_LIVES half-lives. The first write after that scales the document's
+# cells down to the new landmark, and weights stay below 2 ** REBASE_HALF_LIVES.
+# The rescaled cells replace the old ones only if no event was added in between
+# (`events` is unchanged); otherwise the write is retried from a fresh read.
+# Events from the future count as now. A document keeps the half-life its
+# weights were written with. Weights from different half-lives cannot be
+# converted, so a document written under another one starts over, cells and
+# event count alike, when ACTIVITY_HALF_LIFE_DAYS changes.
+
+EPOCH = datetime(2024, 1, 1)  # Landmarks are EPOCH plus whole rebase periods
+REBASE_HALF_LIVES = 32
+# Rounds of writes retried after another process moved a document's landmark
+ATTEMPTS = 3
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+def naive_local(timestamp):
+    return timestamp.astimezone().replace(tzinfo=None) if timestamp.tzinfo else timestamp
+
+# Landmark for weights written at `now`; whole seconds, so it compares equal
+# once stored in MongoDB
+def current_landmark(now, half_life):
+    period = REBASE_HALF_LIVES * half_life.total_seconds()
+    return EPOCH + timedelta(seconds=int(math.floor((now - EPOCH).total_seconds() / period) * period))
+
+def weight(timestamp, landmark, half_life_seconds):
+    return 2.0 ** ((timestamp - landmark).total_seconds() / half_life_seconds)
+
+def cell(timestamp):
+    timestamp = naive_local(timestamp)
+    return timestamp.weekday() * 24 + timestamp.hour
+
+# Add (facility_id, timestamp) events to the counters, with one upsert per facility
+def record_events(db, events, half_life, now=None):
+    now = naive_local(now or datetime.now())
+    seconds = half_life.total_seconds()
+    landmark = current_landmark(now, half_life)
+    pending = {}
+    for facility_id, timestamp in events:
+        pending.setdefault(str(facility_id), []).append(min(naive_local(timestamp), now))
+    facilities = len(pending)
+
+    # The first round assumes every document is already at this landmark and
+    # half-life, as nearly all are, and reads only the ones whose upsert collides
+    for attempt in range(ATTEMPTS + 1):
+        if not pending:
+            break
+        stored = {}
+        if attempt:
+            stored = {document['_id']: document for document in db.activity.find({'_id': {'$in': list(pending)}})}
+        facility_ids = list(pending)
+        requests = []
+        for facility_id in facility_ids:
+            document = stored.get(facility_id)
+            target = landmark if document is None else rebase(db, document, landmark, seconds)
+            inc = {'events': len(pending[facility_id])}
+            for timestamp in pending[facility_id]:
+                key = f'cells.{cell(timestamp)}'
+                inc[key] = inc.get(key, 0) + weight(timestamp, target, seconds)
+            # Matches only while the document is at this landmark and half-life
+            requests.append(UpdateOne({'_id': facility_id, 'landmark': target, 'half_life': seconds}, {'$inc': inc}, upsert=True))
+        try:
+            db.activity.bulk_write(requests, ordered=False)
+            pending = {}
+        except BulkWriteError as e:
+            # The upsert collides with a document that is at another landmark
+            errors = e.details['writeErrors']
+            if any(error['code'] != 11000 for error in errors):
+                raise
+            pending = {facility_ids[error['index']]: pending[facility_ids[error['index']]] for error in errors}
+    if pending:
+        print(f"Activity of {len(pending)} facilities not recorded: their counters kept moving.")
+    return facilities
+
+# Bring a document to `landmark` at this half-life and return the landmark its
+# new weights go against. A process whose clock runs ahead may have moved it
+# further already, which is as good. If the document changed since it was read,
+# nothing is written and the caller's $inc misses and is retried.
+def rebase(db, document, landmark, seconds):
+    # Documents from before landmarks were stored used EPOCH and the configured half-life
+    stored_landmark = document.get('landmark') or EPOCH
+    stored_seconds = document.get('half_life') or seconds
+    match = {'_id': document['_id'], 'landmark': document.get('landmark'),
+             'half_life': document.get('half_life'), 'events': document.get('events')}
+    if stored_seconds != seconds:
+        db.activity.update_one(match, {'$set': {'cells': {}, 'events': 0, 'landmark': landmark, 'half_life': seconds}})
+        return landmark
+    if stored_landmark >= landmark:
+        if document.get('half_life') is None:
+            db.activity.update_one(match, {'$set': {'landmark': stored_landmark, 'half_life': seconds}})
+        return stored_landmark
+    factor = weight(stored_landmark, landmark, seconds)
+    cells = {key: value * factor for key, value in (document.get('cells') or {}).items()}
+    db.activity.update_one(match, {'$set': {'cells': cells, 'landmark': landmark, 'half_life': seconds}})
+    return landmark
+
+# (decayed counts as 7 rows of 24, raw event count); the matrix is None if the
+# facility has no events yet
+def activity_matrix(db, facility_id, half_life, now=None):
+    document = db.activity.find_one({'_id': str(facility_id)})
+    if not document:
+        return None, 0
+    # Multiplying by the inverse factor can only underflow, for activity long gone
+    seconds = document.get('half_life') or half_life.total_seconds()
+    scale = weight(document.get('landmark') or EPOCH, naive_local(now or datetime.now()), seconds)
+    cells = document.get('cells', {})
+    values = [cells.get(str(i), 0) * scale for i in range(7 * 24)]
+    return [values[day * 24:(day + 1) * 24] for day in range(7)], document.get('events', 0)
+
+# Compact form for the hospital page: each cell as 0-100 of the busiest one, plus
+# the decayed count at that peak and the raw number of events behind the matrix
+def busy_hours(db, facility_id, half_life, now=None):
+    matrix, events = activity_matrix(db, facility_id, half_life, now)
+    if matrix is None:
+        return {'facility_id': str(facility_id), 'events': 0, 'peak': 0, 'days': DAYS, 'matrix': None}
+    peak = max(max(row) for row in matrix)
+    return {
+        'facility_id': str(facility_id),
+        'events': events,
+        'peak': round(peak, 3),
+        'days': DAYS,
+        'matrix': [[round(100 * value / peak) if peak else 0 for value in row] for row in matrix],
+    }
@@ -1,55 +1,365 @@
+if __name__ == '__main__':
+    # Make sockets, locks and sleeps cooperative before anything else is imported,
+    # so MongoDB, Redis and Nominatim calls no longer block the whole server
+    from gevent import monkey
+    monkey.patch_all()
+
 from flask_caching import Cache
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, session, jsonify, stream_with_context, send_from_directory
 from flask_pymongo import PyMongo
-from werkzeug.security import generate_password_hash, check_password_hash
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score
-from datetime import datetime
+from datetime import datetime, timedelta
+import csv
 import os
-from functools import wraps
-from geopy.geocoders import Nominatim
-import folium
+from functools import lru_cache, wraps
+import pymongo
+from pymongo.read_preferences import SecondaryPreferred
+from realtime import init_realtime, publish_bed_status, publish_bed_statuses
+from ingest import IngestError, is_valid_api_key, parse_updates, group_updates, write_updates
+from instrumentation import init_instrumentation, memoize, mongo_listener, timed, timer
+from passwords import init_passwords, hash_password, verify_password
+from gazetteer import Gazetteer
+from assets import init_assets
+from registry import hospital_registry, affects_snapshot, bump_version
+from watcher import ChangeWatcher
+from export import DEFAULT_CHUNK_SIZE, ExportError, build_query, export_chunks, get_format
+from tasks import JOBS, init_celery, enqueue_job, job_summary
+from activity import busy_hours, record_events
+from review_analysis import review_insights
+from traffic import coalesced, rate_limited
+from delta_sync import change_version, changes_since, encode, record_statuses, same
+from profiling import init_profiling, list_profiles
+from breakers import CircuitOpen, LastGood, MONGO_ERRORS, geocoder_breaker, init_breakers, mark_stale, mongo_breaker
 
 # Configuration
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'a_random_secret_key'
     MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/oxyleap'
-    CACHE_TYPE = "RedisCache"
-    CACHE_REDIS_URL = "redis://localhost:6379/0"  # Default Redis URL
-
-# Initialize Flask app, MongoDB connection, and Cache
-app = Flask(__name__)
-app.config.from_object(Config)
-mongo = PyMongo(app)
-cache = Cache(app)
-
-# Load the india_cities.csv data
-city_data = pd.read_csv('data/india_cities.csv')
-
-# Function to find lat/lon based on city, state, country
+    # MongoDB pool and timeouts. Under gevent each greenlet checks out its own
+    # connection; past maxPoolSize they queue for at most waitQueueTimeoutMS, and
+    # timeoutMS bounds every operation.
+    MONGO_CLIENT_OPTIONS = {
+        'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+        'waitQueueTimeoutMS': 2000,
+        'connectTimeoutMS': 2000,
+        'serverSelectionTimeoutMS': 3000,
+        'timeoutMS': int(os.environ.get('MONGO_TIMEOUT_MS', 5000)),
+        # Acknowledged by a majority, so users, reviews and bed counts survive a failover
+        'w': 'majority',
+        'retryWrites': True,
+        'retryReads': True,
+    }
+    # Listing and prediction reads go to secondaries that lag the primary by at
+    # most this many seconds (90 is the smallest MongoDB accepts). They fall back
+    # to the primary when no secondary qualifies, or on a standalone server.
+    MONGO_READ_MAX_STALENESS = int(os.environ.get('MONGO_READ_MAX_STALENESS', 90))
+    # Bed status reads for a list page give up after this many seconds, and the
+    # page falls back to the statuses this process last loaded (see breakers.py)
+    MONGO_REQUEST_TIMEOUT = float(os.environ.get('MONGO_REQUEST_TIMEOUT', 1))
+    # Seconds between checks of the hospitals version behind the in-process registry
+    REGISTRY_CHECK_INTERVAL = float(os.environ.get('REGISTRY_CHECK_INTERVAL', 30))
+    # Follow MongoDB change streams to refresh caches as soon as the data changes
+    # (needs a replica set). While a process follows them, the entries it caches
+    # live CHANGE_STREAM_CACHE_TTL, only a backstop for missed events; otherwise
+    # (a standalone server, Celery workers) the shorter TTLs below apply.
+    CHANGE_STREAMS = os.environ.get('CHANGE_STREAMS', '1') == '1'
+    CHANGE_STREAM_CACHE_TTL = int(os.environ.get('CHANGE_STREAM_CACHE_TTL', 24 * 3600))
+    PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+    REVIEWS_CACHE_TTL = int(os.environ.get('REVIEWS_CACHE_TTL', 300))
+    REDIS_URL = os.environ.get('REDIS_URL') or "redis://localhost:6379/0"  # Default Redis URL
+    # Cache lookups give up quickly rather than hold a request on a slow Redis,
+    # and count as misses while Redis is failing
+    CACHE_TYPE = "breakers.GuardedRedisCache"
+    CACHE_REDIS_URL = REDIS_URL + "?socket_timeout=0.5&socket_connect_timeout=0.5"
+    # Redis pub/sub channel used to fan bed status pushes out across workers
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', REDIS_URL)
+    # /navigate places hospitals at their ZIP code centroid from the offline gazetteer.
+    # Set GEOCODE_ADDRESSES=1 to refine that to the street address through Nominatim,
+    # keeping the centroid when the lookup fails or takes longer than GEOCODER_TIMEOUT.
+    GEOCODE_ADDRESSES = os.environ.get('GEOCODE_ADDRESSES', '') == '1'
+    NOMINATIM_DOMAIN = os.environ.get('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')
+    NOMINATIM_SCHEME = os.environ.get('NOMINATIM_SCHEME', 'https')
+    GEOCODER_TIMEOUT = float(os.environ.get('GEOCODER_TIMEOUT', 3))
+    # Consecutive timeouts or connection errors after which calls to MongoDB, Redis
+    # or Nominatim fail fast, and seconds before one trial call is let through
+    CIRCUIT_BREAKER_FAILURES = int(os.environ.get('CIRCUIT_BREAKER_FAILURES', 3))
+    CIRCUIT_BREAKER_RESET_SECONDS = float(os.environ.get('CIRCUIT_BREAKER_RESET_SECONDS', 15))
+    # Concurrent identical requests to /emergency and /health_centers share one render
+    COALESCE_REQUESTS = os.environ.get('COALESCE_REQUESTS', '1') == '1'
+    # Token buckets on those pages as (requests per second, burst) per signed-in
+    # user and per client IP; the IP allowance is larger since NAT puts many users
+    # behind one address
+    RATE_LIMITING = os.environ.get('RATE_LIMITING', '1') == '1'
+    RATE_LIMIT_USER = (float(os.environ.get('RATE_LIMIT_USER_RATE', 2)), int(os.environ.get('RATE_LIMIT_USER_BURST', 20)))
+    RATE_LIMIT_IP = (float(os.environ.get('RATE_LIMIT_IP_RATE', 20)), int(os.environ.get('RATE_LIMIT_IP_BURST', 100)))
+    # Comma-separated keys allowed to push bed counts to /api/bed_stats
+    INGEST_API_KEYS = [key for key in os.environ.get('INGEST_API_KEYS', '').split(',') if key]
+    # Comma-separated keys allowed to download /api/export/hospitals without signing in
+    EXPORT_API_KEYS = [key for key in os.environ.get('EXPORT_API_KEYS', '').split(',') if key]
+    # Comma-separated keys allowed to call /api/distance_matrix without signing in
+    DISPATCH_API_KEYS = [key for key in os.environ.get('DISPATCH_API_KEYS', '').split(',') if key]
+    # Comma-separated keys allowed to start maintenance jobs through /api/jobs
+    ADMIN_API_KEYS = [key for key in os.environ.get('ADMIN_API_KEYS', '').split(',') if key]
+    INGEST_MAX_BATCH = int(os.environ.get('INGEST_MAX_BATCH', 10000))
+    # Number of most recent entries kept in each facility's bed_stats series
+    BED_STATS_WINDOW = int(os.environ.get('BED_STATS_WINDOW', 365))
+    # bcrypt cost for new password hashes and the native threads that compute them.
+    # One core is left for the event loop so logins cannot starve other requests.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_POOL_SIZE = int(os.environ.get('PASSWORD_HASH_POOL_SIZE', max(1, (os.cpu_count() or 2) - 1)))
+    # Celery settings for the maintenance jobs in tasks.py. Each worker process runs
+    # one job at a time and takes no more until it is done, so at most
+    # MAINTENANCE_CONCURRENCY heavy jobs run at once per worker.
+    CELERY = {
+        'broker_url': os.environ.get('CELERY_BROKER_URL') or REDIS_URL,
+        'task_ignore_result': True,  # Job state is kept in the jobs collection
+        'task_default_queue': 'maintenance',
+        'worker_concurrency': int(os.environ.get('MAINTENANCE_CONCURRENCY', 2)),
+        'worker_prefetch_multiplier': 1,
+        'task_acks_late': True,
+        'broker_connection_retry_on_startup': True,
+    }
+    # Seconds between scheduled runs of each job; SCHEDULE_<JOB>=0 turns one off
+    MAINTENANCE_SCHEDULE = {
+        name: int(os.environ.get(f'SCHEDULE_{name.upper()}', seconds)) for name, seconds in {
+            'preprocess_bed_stats': 6 * 3600,
+            'busy_hour_charts': 24 * 3600,
+            'sync_hospital_dataset': 24 * 3600,
+            'refresh_bed_statuses': 6 * 3600,
+            'warm_caches': 1800,
+            'analyze_reviews': 60,
+        }.items()
+    }
+    HOSPITAL_DATASET = os.environ.get('HOSPITAL_DATASET', 'data/hospital_dataset.csv')
+    BED_STATS_DIR = os.environ.get('BED_STATS_DIR', 'data/bed_stats')
+    BUSY_HOUR_CHARTS_DIR = os.environ.get('BUSY_HOUR_CHARTS_DIR', 'hospital_busy_hours')
+    # Days after which an event counts half as much in a hospital's busy hours (see
+    # activity.py). Changing it starts each hospital's counts over on its next event.
+    ACTIVITY_HALF_LIFE_DAYS = float(os.environ.get('ACTIVITY_HALF_LIFE_DAYS', 28))
+    # Distance matrix limits and the average road speed its ETAs assume
+    DISTANCE_MATRIX_MAX_ORIGINS = int(os.environ.get('DISTANCE_MATRIX_MAX_ORIGINS', 1000))
+    DISTANCE_MATRIX_MEMORY_MB = int(os.environ.get('DISTANCE_MATRIX_MEMORY_MB', 32))
+    ETA_SPEED_KMH = float(os.environ.get('ETA_SPEED_KMH', 50))
+    # Reviews per nlp.pipe batch in the analyze_reviews job (see review_analysis.py)
+    REVIEW_ANALYSIS_BATCH_SIZE = int(os.environ.get('REVIEW_ANALYSIS_BATCH_SIZE', 64))
+    # Request profiles (see profiling.py): where they are kept and how many, the
+    # sampling interval in seconds, and the fraction of all requests profiled
+    # without being asked (0.001 is one in a thousand)
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+    PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+# MongoDB connection and Cache, bound to an app in create_app()
+mongo = PyMongo()
+cache = Cache()
+
+# All page and API routes
+main = Blueprint('main', __name__)
+
+# Application factory. Nothing here connects to MongoDB or Redis or loads
+# pandas, geopy or folium; each of those waits for the first request that needs it.
+# Pass connect=False when the app is built before forking workers and call
+# connect_datastores() in each worker instead (see gunicorn.conf.py).
+def create_app(config=Config, connect=True):
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if connect:
+        connect_datastores(app)
+    init_realtime(app)  # Real-time bed status push channel
+    init_instrumentation(app)  # Server-Timing header and /metrics
+    init_passwords(app)
+    init_assets(app)  # asset_url() and picture() for the files built by build_assets.py
+    init_celery(app)  # Maintenance jobs (see tasks.py and worker.py)
+    init_breakers(app)  # Degraded mode while a dependency is failing
+    init_profiling(app, request_api_key)  # X-Profile: 1 with an admin API key
+    app.register_blueprint(main)
+    return app
+
+# Create the MongoDB and Redis clients. They hold sockets and background threads,
+# so each process must create its own rather than inherit them across a fork.
+# Celery workers pass watch=False: they serve no cached pages of their own.
+def connect_datastores(app, watch=True):
+    mongo.init_app(app, event_listeners=[mongo_listener], **app.config['MONGO_CLIENT_OPTIONS'])
+    cache.init_app(app)
+    _redis[0] = None
+    app.extensions.pop('change_watcher', None)
+    if watch and app.config['CHANGE_STREAMS'] and not app.testing:
+        app.extensions['change_watcher'] = start_change_watcher(app)
+
+# TTL for cache entries under the config key `name`, longer while this process
+# follows change streams, which refresh the entries as the data changes
+def cache_ttl(name):
+    watcher = current_app.extensions.get('change_watcher')
+    if watcher is not None and watcher.following:
+        return max(current_app.config[name], current_app.config['CHANGE_STREAM_CACHE_TTL'])
+    return current_app.config[name]
+
+# Redis client for leases and counters, created on first use in each process
+_redis = [None]
+
+def get_redis():
+    if _redis[0] is None:
+        import redis
+        _redis[0] = redis.Redis.from_url(current_app.config['REDIS_URL'], socket_timeout=1, socket_connect_timeout=1)
+    return _redis[0]
+
+# Load read-only reference data up front. Under gunicorn's preload_app this runs
+# once in the master, and the forked workers share the pages copy-on-write.
+# `modules` lists deferred imports worth paying for once before forking.
+def warm_reference_data(app, modules=('folium', 'geopy.geocoders')):
+    import importlib
+    load_city_index()
+    load_gazetteer()
+    for module in modules:
+        importlib.import_module(module)
+    load_hospital_registry(app)
+
+# Load the hospital registry with a short-lived client, since MongoClient must not
+# be shared across a fork. If MongoDB is unreachable now, each process loads the
+# registry on its first request instead.
+def load_hospital_registry(app):
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    options = dict(app.config['MONGO_CLIENT_OPTIONS'], serverSelectionTimeoutMS=2000)
+    try:
+        with MongoClient(app.config['MONGO_URI'], **options) as client:
+            hospital_registry.load(client.get_default_database())
+    except PyMongoError as e:
+        print(f"Hospital registry not preloaded: {e}")
+
+# The india_cities.csv data, loaded on first use and indexed by (city, state, country)
+@lru_cache(maxsize=None)
+def load_city_index(csv_path='data/india_cities.csv'):
+    index = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            key = (row['city'].strip().lower(), row['state'].strip().lower(), row['country'].strip().lower())
+            index.setdefault(key, (float(row['latitude']), float(row['longitude'])))
+    return index
+
+# The offline US gazetteer of ZIP code, city and state centroids
+@lru_cache(maxsize=None)
+def load_gazetteer(csv_path='data/us_zip_centroids.csv'):
+    return Gazetteer(csv_path)
+
+US_COUNTRY_NAMES = {'', 'us', 'usa', 'u.s.', 'u.s.a.', 'united states', 'united states of america'}
+
+# Function to find lat/lon based on city, state, country. US locations are looked up
+# in the gazetteer and the city field may also hold a ZIP code.
 def find_lat_lon(city, state, country):
-    result = city_data[
-        (city_data['city'].str.strip().str.lower() == city.strip().lower()) &
-        (city_data['state'].str.strip().str.lower() == state.strip().lower()) &
-        (city_data['country'].str.strip().str.lower() == country.strip().lower())
-    ]
-    print(f"Filtered result for city: {city}, state: {state}, country: {country} - Found rows: {len(result)}")
-    
-    if not result.empty:
-        return result.iloc[0]['latitude'], result.iloc[0]['longitude']
+    if country.strip().lower() in US_COUNTRY_NAMES:
+        gazetteer = load_gazetteer()
+        location = gazetteer.by_zip(city) if city.strip().isdigit() else gazetteer.by_city(city, state)
+    else:
+        location = load_city_index().get((city.strip().lower(), state.strip().lower(), country.strip().lower()))
+    if location:
+        return location
     return None, None
 
+# Approximate coordinates of a hospital: stored at import, otherwise the centroid
+# of its ZIP code, city or state
+def hospital_coordinates(hospital):
+    if hospital.get('latitude') is not None and hospital.get('longitude') is not None:
+        return hospital['latitude'], hospital['longitude']
+    return load_gazetteer().locate(hospital.get('zip_code'), hospital.get('city'), hospital.get('state'))
+
+# Geocoder used by navigate() when GEOCODE_ADDRESSES is on; geopy is only imported
+# when a map is requested
+def get_geocoder():
+    from geopy.geocoders import Nominatim
+    return Nominatim(
+        user_agent="oxyleap",
+        domain=current_app.config['NOMINATIM_DOMAIN'],
+        scheme=current_app.config['NOMINATIM_SCHEME'],
+        timeout=current_app.config['GEOCODER_TIMEOUT']
+    )
+
+# Hospital rows of the dataset CSV, placed at their gazetteer coordinates
+def read_hospital_dataset(csv_path):
+    import pandas as pd
+    df = pd.read_csv(csv_path, dtype={'facility_id': str, 'zip_code': str})
+    df['zip_code'] = df['zip_code'].str.zfill(5)
+    gazetteer = load_gazetteer()
+    df['latitude'], df['longitude'] = zip(*(
+        gazetteer.locate(zip_code, city, state) for zip_code, city, state in zip(df['zip_code'], df['city'], df['state'])
+    ))
+    return df.to_dict('records')
+
 # Data Import Function
-def import_hospital_dataset(csv_path):
-    if mongo.db.hospitals.count_documents({}) == 0:  # Check if the collection is empty
-        df = pd.read_csv(csv_path)
-        mongo.db.hospitals.insert_many(df.to_dict('records'))
+def import_hospital_dataset(csv_path, db=None):
+    db = mongo.db if db is None else db
+    if db.hospitals.count_documents({}) == 0:  # Check if the collection is empty
+        records = read_hospital_dataset(csv_path)
+        with change_version(db) as version:  # For the delta sync API (see delta_sync.py)
+            db.hospitals.insert_many([dict(record, _v=version) for record in records])
+        bump_version(db)  # Processes reload their hospital registry
         print("Hospital data imported successfully.")
     else:
         print("Hospital data already exists in the database.")
 
+# Bring the hospitals collection in line with the dataset CSV after it changed:
+# rows are matched on facility_id, new ones added and changed ones updated.
+# Only rows that differ are written, stamped with a sync version.
+def sync_hospital_dataset(csv_path, progress=None, batch_size=500):
+    from pymongo import UpdateOne
+    normalize_facility_ids(mongo.db)
+    records = read_hospital_dataset(csv_path)
+    added = updated = 0
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        stored = {document['facility_id']: document for document in mongo.db.hospitals.find(
+            {'facility_id': {'$in': [record['facility_id'] for record in batch]}}, {'_id': 0, '_v': 0}
+        )}
+        changed = [record for record in batch if record['facility_id'] not in stored
+                   or not all(same(stored[record['facility_id']].get(field), value) for field, value in record.items())]
+        if changed:
+            with change_version(mongo.db) as version:
+                result = mongo.db.hospitals.bulk_write([
+                    UpdateOne({'facility_id': record['facility_id']}, {'$set': dict(record, _v=version)}, upsert=True)
+                    for record in changed
+                ], ordered=False)
+            added += result.upserted_count
+            updated += result.modified_count
+        if progress:
+            progress(start + len(batch), len(records))
+    if added or updated:
+        bump_version(mongo.db)
+    return {'rows': len(records), 'added': added, 'updated': updated}
+
+# Databases imported before facility_id was read as text store it as a number,
+# which matches neither the dataset's ids nor the ones in URLs and bed_stats.
+# Rewrite those ids as strings. Returns the number of hospitals fixed.
+def normalize_facility_ids(db):
+    from pymongo import UpdateOne
+    documents = list(db.hospitals.find({'facility_id': {'$exists': True, '$not': {'$type': 'string'}}}, {'facility_id': 1}))
+    if not documents:
+        return 0
+    with change_version(db) as version:
+        db.hospitals.bulk_write([
+            UpdateOne({'_id': document['_id']}, {'$set': {'facility_id': facility_id_text(document['facility_id']), '_v': version}})
+            for document in documents
+        ], ordered=False)
+    bump_version(db)
+    print(f"Stored {len(documents)} numeric facility ids as strings.")
+    return len(documents)
+
+def facility_id_text(facility_id):
+    if isinstance(facility_id, float) and facility_id.is_integer():
+        facility_id = int(facility_id)
+    return str(facility_id)
+
+# Database handle for reads that tolerate bounded staleness: hospital listings,
+# facets and bed predictions. Users, reviews and ingestion keep using mongo.db,
+# which reads from and writes to the primary.
+_read_db = [None, None]  # (primary database, secondary-preferred view of it)
+
+def read_db():
+    db = mongo.db
+    if _read_db[0] is not db:
+        staleness = current_app.config['MONGO_READ_MAX_STALENESS']
+        _read_db[:] = [db, db.with_options(read_preference=SecondaryPreferred(max_staleness=staleness))]
+    return _read_db[1]
+
 # Models
 def get_user_by_username(username):
     return mongo.db.users.find_one({'username': username})
@@ -61,59 +371,89 @@ def create_user(email, username, password_hash):
         'password': password_hash
     })
 
+def update_password_hash(username, password_hash):
+    mongo.db.users.update_one({'username': username}, {'$set': {'password': password_hash}})
+
+# Hospitals are read from the in-process registry snapshot (see registry.py).
+# The page is marked stale while the snapshot cannot be refreshed.
+def hospitals_snapshot():
+    snapshot = hospital_registry.get(read_db(), current_app.config['REGISTRY_CHECK_INTERVAL'], mongo_breaker.call)
+    stale_since = hospital_registry.stale_since()
+    if stale_since:
+        mark_stale(stale_since)
+    return snapshot
+
 def get_hospitals(query=None):
     if query:
-        return mongo.db.hospitals.find(query)
-    return mongo.db.hospitals.find()
+        return hospitals_snapshot().where(query)
+    return hospitals_snapshot().records
 
 def get_hospitals_by_type(hospital_type):
-    return mongo.db.hospitals.find({'hospital_type': hospital_type})
+    return hospitals_snapshot().by_type(hospital_type)
 
 def get_hospitals_with_emergency_services():
-    return mongo.db.hospitals.find({'emergency_services': 'Yes'})
+    return hospitals_snapshot().with_emergency_services()
 
+# Falls back to MongoDB for a hospital added since the snapshot was taken
 def get_hospital_by_id(facility_id):
-    return mongo.db.hospitals.find_one({'facility_id': facility_id})
+    hospital = hospitals_snapshot().get(facility_id)
+    if hospital is None:
+        hospital = read_db().hospitals.find_one({'facility_id': facility_id})
+    return hospital
 
 def add_review(hospital_id, review, rating):
+    timestamp = datetime.now()
     mongo.db.reviews.insert_one({
         'hospital_id': hospital_id,
         'review': review,
         'rating': rating,
-        'timestamp': datetime.now()
+        'timestamp': timestamp
     })
+    cache.delete_memoized(get_reviews)
+    record_activity([(hospital_id, timestamp)])
+
+# Count (facility_id, timestamp) events towards the facilities' busy hours
+def record_activity(events):
+    return record_events(mongo.db, events, activity_half_life())
 
+def activity_half_life():
+    return timedelta(days=current_app.config['ACTIVITY_HALF_LIFE_DAYS'])
+
+# Cached until the reviews change. add_review() drops the entry itself, so the
+# writer sees their review on the next page; the watcher covers other writers.
+@memoize(cache, timeout=lambda: cache_ttl('REVIEWS_CACHE_TTL'))
 def get_reviews():
-    return mongo.db.reviews.find().sort('timestamp', -1)
+    # From the primary, so a review shows up on the page the writer is sent to
+    return list(mongo.db.reviews.find().sort('timestamp', -1))
 
-def update_bed_status(hospital_id, status):
-    mongo.db.hospitals.update_one(
+def update_bed_status(hospital_id, status, inactive_beds='N/A'):
+    hospital = mongo.db.hospitals.find_one_and_update(
         {'facility_id': hospital_id},
-        {'$set': {'bed_status': status}}
+        {'$set': {'bed_status': status}},
+        projection={'facility_id': 1, 'hospital_type': 1, 'state': 1}
     )
+    # Push the change to clients following this facility
+    if hospital:
+        publish_bed_status(hospital, {'status': status, 'inactive_beds': inactive_beds})
 
-@cache.memoize(timeout=3600)  # Cache results for 1 hour
-def predict_bed_availability(facility_id):
-    bed_stat = mongo.db.bed_stats.find_one({"facility_id": facility_id})
-    
-    if not bed_stat:
-        return {"status": "Unknown", "inactive_beds": "N/A"}  # Return a dictionary with default values
-
-    # Convert the 'bed_stats' document to a DataFrame
-    df = pd.DataFrame(bed_stat["data"])
-    
+# Work out a facility's bed status from its bed_stats series
+def compute_bed_status(data):
     # Ensure the dataset contains the necessary columns
-    if 'Active Beds' not in df.columns or 'Inactive Beds' not in df.columns:
+    if not any('Active Beds' in row for row in data) or not any('Inactive Beds' in row for row in data):
         return {"status": "Unknown", "inactive_beds": "N/A"}
-    
-    # Calculate the average active beds
-    avg_active_beds = df['Active Beds'].mean()
-    
+
+    # Calculate the average active beds, skipping missing values
+    active_beds = [row.get('Active Beds') for row in data]
+    known = [value for value in active_beds if value is not None and value == value]
+    avg_active_beds = sum(known) / len(known) if known else float('nan')
+
     # Use the last entry of Active Beds as a simple prediction
-    next_month_prediction = df['Active Beds'].iloc[-1]
-    
+    next_month_prediction = active_beds[-1]
+    if next_month_prediction is None:
+        next_month_prediction = float('nan')
+
     # Get the most recent inactive beds count
-    inactive_beds = df['Inactive Beds'].iloc[-1] if 'Inactive Beds' in df.columns else 'N/A'
+    inactive_beds = data[-1].get('Inactive Beds', 'N/A')
 
     # Determine the status based on the predicted value
     if next_month_prediction > avg_active_beds:
@@ -123,6 +463,121 @@ def predict_bed_availability(facility_id):
     else:
         return {"status": "green", "inactive_beds": inactive_beds}  # More vacant beds
 
+@timed('predict')
+@memoize(cache, timeout=lambda: cache_ttl('PREDICTION_CACHE_TTL'))  # Refreshed by ingestion and the change watcher
+def predict_bed_availability(facility_id):
+    bed_stat = read_db().bed_stats.find_one({"facility_id": facility_id})
+    
+    if not bed_stat or not bed_stat.get("data"):
+        return {"status": "Unknown", "inactive_beds": "N/A"}  # Return a dictionary with default values
+
+    return compute_bed_status(bed_stat["data"])
+
+# Append a batch of bed updates and refresh the status of every facility it touched
+def ingest_bed_updates(grouped):
+    windows = write_updates(mongo.db, grouped, current_app.config['BED_STATS_WINDOW'])
+    # Rooms come from the registry snapshot rather than another query
+    snapshot = hospitals_snapshot()
+
+    # Only statuses that differ from the recorded ones are pushed
+    changed = record_statuses(mongo.db, cache_bed_statuses(windows))
+    record_activity((facility_id, row['Date']) for facility_id, rows in grouped.items() for row in rows)
+    updates = [(snapshot.get(facility_id) or {'facility_id': facility_id}, status) for facility_id, status in changed.items()]
+    return publish_bed_statuses(updates)
+
+# Compute statuses from fresh bed_stats series and store them as the memoized
+# predictions instead of just dropping them, so the next read cannot re-cache
+# data from a lagging secondary
+def cache_bed_statuses(windows):
+    statuses = {facility_id: compute_bed_status(data) for facility_id, data in windows.items()}
+    cache.set_many({
+        predict_bed_availability.make_cache_key(predict_bed_availability.uncached, facility_id): status
+        for facility_id, status in statuses.items()
+    }, timeout=cache_ttl('PREDICTION_CACHE_TTL'))
+    return statuses
+
+# Bed status of many facilities with one cache round trip. Misses are computed
+# from a single bed_stats query and cached like any prediction.
+def bed_statuses(facility_ids):
+    keys = [predict_bed_availability.make_cache_key(predict_bed_availability.uncached, facility_id) for facility_id in facility_ids]
+    statuses = {facility_id: status for facility_id, status in zip(facility_ids, cache.get_many(*keys)) if status is not None}
+    missing = [facility_id for facility_id in facility_ids if facility_id not in statuses]
+    if missing:
+        windows = {facility_id: [] for facility_id in missing}
+        for bed_stat in mongo_breaker.call(find_bed_stats, missing):
+            windows[bed_stat['facility_id']] = bed_stat.get('data') or []
+        statuses.update(cache_bed_statuses(windows))
+    return statuses
+
+def find_bed_stats(facility_ids):
+    return list(read_db().bed_stats.find({'facility_id': {'$in': facility_ids}}, {'_id': 0, 'facility_id': 1, 'data': 1}))
+
+# Every status a list page has loaded in this process, served while MongoDB is failing
+recent_statuses = LastGood('bed statuses')
+UNKNOWN_STATUS = {"status": "Unknown", "inactive_beds": "N/A"}
+
+# Bed statuses for a list page, read within MONGO_REQUEST_TIMEOUT. If that fails,
+# or the MongoDB breaker is open, the page gets the statuses last loaded (Unknown
+# for facilities never loaded) and is marked stale, and a background refresh
+# retries rather than the next visitor's request.
+def page_bed_statuses(facility_ids):
+    app = current_app._get_current_object()
+
+    def fetch():
+        with app.app_context(), pymongo.timeout(app.config['MONGO_REQUEST_TIMEOUT']):
+            return bed_statuses(facility_ids)
+
+    if recent_statuses.value is None or mongo_breaker.closed:
+        try:
+            statuses = fetch()
+        except CircuitOpen:
+            if recent_statuses.value is None:
+                raise
+        except MONGO_ERRORS as e:
+            # Nothing to fall back on: a 503 with Retry-After, as when the breaker is open
+            if recent_statuses.value is None:
+                raise CircuitOpen(mongo_breaker) from e
+        else:
+            recent_statuses.update({**(recent_statuses.value or {}), **statuses})
+            return statuses
+    recent_statuses.revalidate(lambda: {**recent_statuses.value, **fetch()})
+    mark_stale(recent_statuses.updated_at)
+    last = recent_statuses.value
+    return {facility_id: last.get(facility_id, UNKNOWN_STATUS) for facility_id in facility_ids}
+
+# Serialized export of the hospitals matching `query` (see export.py)
+def export_hospitals(serialize, query, header=True, limit=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    return serialize(export_chunks(read_db(), query, bed_statuses, limit, chunk_size), header)
+
+# Change stream handlers (see watcher.py). Each process reloads its own hospital
+# registry; one process refreshes the shared entries in Redis.
+def start_change_watcher(app):
+    return ChangeWatcher(
+        app,
+        local={'hospitals': on_hospitals_change},
+        shared={'bed_stats': on_bed_stats_change, 'reviews': on_reviews_change},
+        on_reset=reset_shared_caches
+    ).start()
+
+def on_hospitals_change(change):
+    if affects_snapshot(change):
+        hospital_registry.invalidate()
+
+def on_bed_stats_change(change):
+    document = change.get('fullDocument')
+    if document and 'facility_id' in document:
+        record_statuses(mongo.db, cache_bed_statuses({document['facility_id']: document.get('data') or []}))
+    else:
+        # Deleted: the event no longer says which facility, so drop every prediction
+        cache.delete_memoized(predict_bed_availability)
+
+def on_reviews_change(change):
+    cache.delete_memoized(get_reviews)
+
+def reset_shared_caches():
+    cache.delete_memoized(predict_bed_availability)
+    cache.delete_memoized(get_reviews)
+
 
 # Helper: Login Required Decorator
 def login_required(f):
@@ -130,55 +585,60 @@ def login_required(f):
     def decorated_function(*args, **kwargs):
         if 'username' not in session:
             flash('You need to be signed in to access this page.', 'warning')
-            return redirect(url_for('signin'))
+            return redirect(url_for('main.signin'))
         return f(*args, **kwargs)
     return decorated_function
 
 # Routes
-@app.route('/')
+@main.route('/')
 @login_required
 def index():
     return render_template('page1.html')
 
-@app.route('/signup', methods=['GET', 'POST'])
+@main.route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
         email = request.form['email']
         username = request.form['username']
         password = request.form['password']
-        password_hash = generate_password_hash(password)
+        password_hash = hash_password(password)
         create_user(email, username, password_hash)
         flash('Account created successfully! Please sign in to continue.', 'success')
-        return redirect(url_for('signin'))
+        return redirect(url_for('main.signin'))
     return render_template('signup.html')
 
-@app.route('/signin', methods=['GET', 'POST'])
+@main.route('/signin', methods=['GET', 'POST'])
 def signin():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
         user = get_user_by_username(username)
-        if user and check_password_hash(user['password'], password):
+        valid, needs_rehash = verify_password(user['password'], password) if user else (False, False)
+        if valid:
+            # Move werkzeug and raw bcrypt hashes (or ones with an outdated cost) to the current scheme
+            if needs_rehash:
+                update_password_hash(username, hash_password(password))
             session['username'] = username  # Log the user in
             flash('Login successful!', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         flash('Invalid credentials!', 'danger')
     return render_template('signin.html')
 
-@app.route('/logout')
+@main.route('/logout')
 def logout():
     session.pop('username', None)  # Log the user out
     flash('You have been logged out.', 'info')
-    return redirect(url_for('signin'))
+    return redirect(url_for('main.signin'))
 
-@app.route('/location', methods=['GET', 'POST'])
+@main.route('/location', methods=['GET', 'POST'])
 @login_required
 def location():
     # Fetch distinct values for dropdowns
-    cities = mongo.db.hospitals.distinct('city')
-    states = mongo.db.hospitals.distinct('state')
-    counties = mongo.db.hospitals.distinct('county')
-    hospital_types = mongo.db.hospitals.distinct('hospital_type')
+    hospitals_index = hospitals_snapshot()
+    cities = hospitals_index.distinct('city')
+    states = hospitals_index.distinct('state')
+    counties = hospitals_index.distinct('county')
+    hospital_types = hospitals_index.distinct('hospital_type')
 
     hospitals = []
     if request.method == 'POST':
@@ -195,12 +655,12 @@ def location():
             query['county'] = county
         if hospital_type:
             query['hospital_type'] = hospital_type
-        hospitals = list(get_hospitals(query))
+        hospitals = get_hospitals(query)
     
     return render_template('location.html', hospitals=hospitals, cities=cities, states=states, counties=counties, hospital_types=hospital_types)
 
 
-@app.route('/confirm_location/<hospital_id>', methods=['GET', 'POST'])
+@main.route('/confirm_location/<hospital_id>', methods=['GET', 'POST'])
 @login_required
 def confirm_location(hospital_id):
     city = request.args.get('city')
@@ -208,7 +668,7 @@ def confirm_location(hospital_id):
     hospital = get_hospital_by_id(hospital_id)
     if not hospital:
         flash("Hospital not found.", "danger")
-        return redirect(url_for('health_centers'))
+        return redirect(url_for('main.health_centers'))
     
     if request.method == 'POST':
         # Get the user's input for location confirmation
@@ -216,7 +676,7 @@ def confirm_location(hospital_id):
         state = request.form['state']
         country = request.form['country']
         
-        # Use the india_cities.csv data to find the latitude and longitude
+        # Use the gazetteer (US) or india_cities.csv data to find the latitude and longitude
         latitude, longitude = find_lat_lon(city, state, country)
         
         if latitude is not None and longitude is not None:
@@ -227,77 +687,102 @@ def confirm_location(hospital_id):
             session['user_lon'] = longitude
             session['user_location_confirmed'] = True
             # Redirect to navigate page with hospital information
-            return redirect(url_for('navigate', hospital_id=hospital_id))
+            return redirect(url_for('main.navigate', hospital_id=hospital_id))
         else:
             flash("Location could not be found in the database. Please try again.", "danger")
     
     return render_template('confirm_location.html', city=city, state=state, hospital=hospital)
 
-@app.route('/navigate/<hospital_id>')
+@main.route('/navigate/<hospital_id>')
 @login_required
 def navigate(hospital_id):
     hospital = get_hospital_by_id(hospital_id)
     if not hospital:
         flash("Hospital not found.", "danger")
-        return redirect(url_for('health_centers'))
+        return redirect(url_for('main.health_centers'))
     
     address = hospital['address']
     city = hospital['city']
     state = hospital['state']
 
-    # Geocode the hospital address to get latitude and longitude
-    geolocator = Nominatim(user_agent="oxyleap")
-    location = geolocator.geocode(f"{address}, {city}, {state}")
-
-    if location:
-        # Create a Folium map centered on the hospital location
-        hospital_map = folium.Map(location=[location.latitude, location.longitude], zoom_start=13)
-
-        # Add a marker for the hospital
-        folium.Marker([location.latitude, location.longitude], tooltip=f"{address}, {city}, {state}").add_to(hospital_map)
-
-        # Retrieve user location from session
-        user_lat = session.get('user_lat', 37.7749)
-        user_lon = session.get('user_lon', -122.4194)
-        folium.Marker([user_lat, user_lon], tooltip="User Location", icon=folium.Icon(color='green')).add_to(hospital_map)
-
-        # Add a route from user location to hospital
-        folium.PolyLine(locations=[[user_lat, user_lon], [location.latitude, location.longitude]], color="red").add_to(hospital_map)
-
-        # Render the map in the template
-        map_html = hospital_map._repr_html_()
+    # Approximate the hospital location with its ZIP code centroid
+    latitude, longitude = hospital_coordinates(hospital)
+
+    if current_app.config['GEOCODE_ADDRESSES']:
+        geolocator = get_geocoder()
+        with timer('geocode'):
+            try:
+                location = geocoder_breaker.call(geolocator.geocode, f"{address}, {city}, {state}")
+            except Exception as e:
+                print(f"Geocoding failed for hospital {hospital_id}: {e}")
+                location = None
+        if location:
+            latitude, longitude = location.latitude, location.longitude
+
+    if latitude is not None:
+        with timer('folium'):
+            import folium
+
+            # Create a Folium map centered on the hospital location
+            hospital_map = folium.Map(location=[latitude, longitude], zoom_start=13)
+
+            # Add a marker for the hospital
+            folium.Marker([latitude, longitude], tooltip=f"{address}, {city}, {state}").add_to(hospital_map)
+
+            # Add the user's confirmed location and a route from it to the hospital
+            user_lat = session.get('user_lat')
+            user_lon = session.get('user_lon')
+            if user_lat is not None and user_lon is not None:
+                folium.Marker([user_lat, user_lon], tooltip="User Location", icon=folium.Icon(color='green')).add_to(hospital_map)
+                folium.PolyLine(locations=[[user_lat, user_lon], [latitude, longitude]], color="red").add_to(hospital_map)
+
+            # Render the map in the template
+            map_html = hospital_map._repr_html_()
     else:
         flash("Location not found.", "danger")
-        return redirect(url_for('location'))
+        return redirect(url_for('main.location'))
 
-    return render_template('navigation.html', map_html=map_html)
+    return render_template('navigation.html', map_html=map_html, hospital=hospital)
 
-@app.route('/health_centers', methods=['GET', 'POST'])
+@main.route('/health_centers', methods=['GET', 'POST'])
 @login_required
+@rate_limited(get_redis)
+@coalesced
 def health_centers():
     filter_type = request.args.get('filter', 'semi-urgent').lower()  # Default to semi-urgent
     
-    hospitals = list(get_hospitals())
+    # The immediate and emergency filters only list critical access hospitals
+    if filter_type in ('immediate', 'emergency'):
+        hospitals = get_hospitals_by_type('Critical Access Hospitals')
+    else:
+        hospitals = get_hospitals()
 
-    # Predict bed availability status for each hospital
+    # Predict bed availability status for each hospital. Registry records are
+    # shared, so the status travels next to the record instead of on it.
+    statuses = page_bed_statuses([hospital.facility_id for hospital in hospitals])
+    rows = []
     for hospital in hospitals:
-        facility_id = hospital['facility_id']
-        prediction = predict_bed_availability(facility_id)
-        hospital['bed_status'] = prediction.get('status', 'Unknown')
-        hospital['inactive_beds'] = prediction.get('inactive_beds', 'N/A')
+        prediction = statuses[hospital.facility_id]
+        rows.append((hospital, prediction.get('status', 'Unknown'), prediction.get('inactive_beds', 'N/A')))
 
     # Apply filters based on the button clicked
     if filter_type == 'immediate':
-        filtered_hospitals = [hospital for hospital in hospitals if hospital['bed_status'] == 'green' and hospital['hospital_type'] == 'Critical Access Hospitals']
+        filtered_hospitals = [row for row in rows if row[1] == 'green']
     elif filter_type == 'emergency':
-        filtered_hospitals = [hospital for hospital in hospitals if hospital['bed_status'] in ['green', 'yellow'] and hospital['hospital_type'] == 'Critical Access Hospitals']
+        filtered_hospitals = [row for row in rows if row[1] in ['green', 'yellow']]
     elif filter_type == 'urgent' or filter_type == 'semi-urgent':
-        filtered_hospitals = [hospital for hospital in hospitals if hospital['bed_status'] in ['green', 'yellow', 'red']]
+        filtered_hospitals = [row for row in rows if row[1] in ['green', 'yellow', 'red']]
+
+    # Only follow the hospital types shown on the page
+    if filter_type in ('immediate', 'emergency'):
+        subscription = {'hospital_types': ['Critical Access Hospitals']}
+    else:
+        subscription = {}
 
-    return render_template('health_centers.html', hospitals=filtered_hospitals, filter_type=filter_type)
+    return render_template('health_centers.html', hospitals=filtered_hospitals, filter_type=filter_type, subscription=subscription)
 
 
-@app.route('/hospital_info')
+@main.route('/hospital_info')
 def hospital_about():
     hospital_name = request.args.get('hospital_name')
     # Replace spaces with hyphens and convert to lowercase to match the ID format
@@ -307,37 +792,39 @@ def hospital_about():
 
 
 
-@app.route('/emergency')
+@main.route('/emergency')
 @login_required
+@rate_limited(get_redis)
+@coalesced
 def emergency():
     hospitals = get_hospitals_with_emergency_services()
     return render_template('emergency.html', hospitals=hospitals)
 
-@app.route('/acute_care')
+@main.route('/acute_care')
 @login_required
 def acute_care():
     hospitals = get_hospitals_by_type('Acute Care Hospitals')
     return render_template('acute_care.html', hospitals=hospitals)
 
-@app.route('/critical_care')
+@main.route('/critical_care')
 @login_required
 def critical_care():
     hospitals = get_hospitals_by_type('Critical Access Hospitals')
     return render_template('critical_care.html', hospitals=hospitals)
 
-@app.route('/childrens')
+@main.route('/childrens')
 @login_required
 def childrens():
     hospitals = get_hospitals_by_type('Children\'s')
     return render_template('childrens.html', hospitals=hospitals)
 
-@app.route('/psychiatric')
+@main.route('/psychiatric')
 @login_required
 def psychiatric():
     hospitals = get_hospitals_by_type('Psychiatric')
     return render_template('psychiatric.html', hospitals=hospitals)
 
-@app.route('/review/<hospital_id>', methods=['GET', 'POST'])
+@main.route('/review/<hospital_id>', methods=['GET', 'POST'])
 @login_required
 def review(hospital_id):
     hospital = get_hospital_by_id(hospital_id)
@@ -345,19 +832,222 @@ def review(hospital_id):
         review_text = request.form['review']
         rating = request.form['rating']
         add_review(hospital_id, review_text, rating)
-        return redirect(url_for('records'))
+        return redirect(url_for('main.records'))
     return render_template('review.html', hospital=hospital)
 
-@app.route('/records')
+@main.route('/records')
 @login_required
 def records():
     reviews = get_reviews()
     return render_template('records.html', reviews=reviews)
 
+# API key sent as X-API-Key or as an Authorization: Bearer token
+def request_api_key():
+    auth = request.headers.get('Authorization', '')
+    return request.headers.get('X-API-Key') or (auth[7:] if auth.startswith('Bearer ') else None)
+
+# A hospital's busy hours by day and hour, as 0-100 of its busiest hour
+@main.route('/api/hospitals/<facility_id>/busy_hours')
+@login_required
+def hospital_busy_hours(facility_id):
+    response = jsonify(busy_hours(read_db(), facility_id, activity_half_life()))
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+# Sentiment and most mentioned services in a hospital's analysed reviews
+@main.route('/api/hospitals/<facility_id>/review_insights')
+@login_required
+def hospital_review_insights(facility_id):
+    return jsonify(facility_id=facility_id, insights=review_insights(read_db(), facility_id))
+
+# Hospitals and bed statuses changed since the version a client last synced to,
+# for the mobile app: ?since=<v from the previous response>, 0 or absent for
+# everything. Answered as msgpack for ?format=msgpack or Accept: application/msgpack
+# when msgpack is installed, and as JSON otherwise. See delta_sync.py for the keys.
+# Read from the primary, so a version never runs ahead of the data sent with it.
+@main.route('/api/sync')
+def sync_route():
+    if 'username' not in session:
+        return jsonify(error="Sign in first."), 401
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        return jsonify(error="since must be a version number."), 400
+    payload = changes_since(mongo.db, int(since), bed_statuses)
+    prefer_msgpack = request.args.get('format') == 'msgpack' or 'application/msgpack' in request.headers.get('Accept', '')
+    body, content_type = encode(payload, prefer_msgpack)
+    return current_app.response_class(body, content_type=content_type, headers={'Cache-Control': 'private, no-store'})
+
+# Distances and ETAs from a batch of origins to hospitals, for dispatchers.
+# Body: {"origins": [{"lat", "lon"} | [lat, lon] | {"zip"} | {"city", "state"}, ...],
+#        "filters": {"state", "city", "county", "hospital_type", "emergency_services"},
+#        "top_k": k}
+# Without top_k, `hospitals` lists the filtered hospitals and each row of
+# `distances_m` (metres) and `eta_s` (seconds) holds one origin's distance to each
+# of them. With top_k, every row holds that origin's k nearest, nearest first, with
+# their ids in the matching row of `hospitals`.
+@main.route('/api/distance_matrix', methods=['POST'])
+def distance_matrix_route():
+    if 'username' not in session and not is_valid_api_key(request_api_key(), current_app.config['DISPATCH_API_KEYS']):
+        return jsonify(error="Sign in or provide a dispatch API key."), 401
+    import numpy as np
+    from distances import MatrixError, distance_matrix, distances_m, eta_seconds, hospital_arrays, parse_origins, to_json
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify(error="Expected a JSON object."), 400
+    filters = payload.get('filters') or {}
+    top_k = payload.get('top_k')
+    try:
+        origins = parse_origins(payload.get('origins'), load_gazetteer(), current_app.config['DISTANCE_MATRIX_MAX_ORIGINS'])
+        if not isinstance(filters, dict):
+            raise MatrixError("filters must be an object.")
+        if top_k is not None and (isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1):
+            raise MatrixError("top_k must be a positive integer.")
+    except MatrixError as e:
+        return jsonify(error=str(e)), 400
+
+    snapshot = hospitals_snapshot()
+    query = build_query(filters)
+    indices = None
+    if query:
+        indices = np.array([snapshot.ids[str(record.facility_id)] for record in snapshot.where(query)], dtype=np.intp)
+    with timer('distance_matrix'):
+        hospitals, distances = distance_matrix(
+            snapshot, origins, indices, top_k, current_app.config['DISTANCE_MATRIX_MEMORY_MB'] * 1024 * 1024
+        )
+        body = to_json({
+            'hospitals': hospital_arrays(snapshot)['ids'][hospitals].tolist(),
+            'distances_m': distances_m(distances),
+            'eta_s': eta_seconds(distances, current_app.config['ETA_SPEED_KMH']),
+        })
+    return current_app.response_class(body, mimetype='application/json')
+
+# Bed count ingestion for facilities, authenticated with an API key.
+# Accepts a JSON array, {"updates": [...]} or NDJSON (application/x-ndjson) of
+# {"facility_id", "active_beds", "inactive_beds", "timestamp"} objects.
+@main.route('/api/bed_stats', methods=['POST'])
+def ingest_bed_stats():
+    if not is_valid_api_key(request_api_key(), current_app.config['INGEST_API_KEYS']):
+        return jsonify(error="Invalid API key."), 401
+
+    try:
+        updates = parse_updates(request.get_data(as_text=True), request.content_type)
+        if len(updates) > current_app.config['INGEST_MAX_BATCH']:
+            return jsonify(error=f"Batches are limited to {current_app.config['INGEST_MAX_BATCH']} updates."), 413
+        grouped = group_updates(updates)
+    except IngestError as e:
+        return jsonify(error=str(e)), 400
+
+    changed = ingest_bed_updates(grouped)
+    return jsonify(accepted=len(updates), facilities=len(grouped), changed=changed)
+
+# Bulk export of hospitals with bed status and review aggregates, streamed in
+# chunks. Filters: state, city, county, hospital_type, emergency_services.
+# `format` is csv (default), ndjson or parquet; `limit` caps the rows. Rows come
+# in facility_id order, and a download that was cut off resumes with
+# `after=<last facility_id received>` (a continuation has no CSV header).
+@main.route('/api/export/hospitals')
+def export_hospitals_route():
+    if 'username' not in session and not is_valid_api_key(request_api_key(), current_app.config['EXPORT_API_KEYS']):
+        return jsonify(error="Sign in or provide an export API key."), 401
+
+    fmt = request.args.get('format', 'csv')
+    try:
+        mimetype, serialize = get_format(fmt)
+    except ExportError as e:
+        return jsonify(error=str(e)), 400
+    after = request.args.get('after')
+
+    stream = export_hospitals(serialize, build_query(request.args, after), after is None, request.args.get('limit', type=int))
+    response = current_app.response_class(stream_with_context(stream), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=hospitals.{fmt}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# Maintenance job runs, newest first; `name` and `limit` narrow the list
+@main.route('/api/jobs')
+def list_jobs():
+    if 'username' not in session and not is_valid_api_key(request_api_key(), current_app.config['ADMIN_API_KEYS']):
+        return jsonify(error="Sign in or provide an admin API key."), 401
+    query = {'name': request.args['name']} if request.args.get('name') else {}
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    jobs = mongo.db.jobs.find(query).sort('queued_at', -1).limit(limit)
+    return jsonify(jobs=[job_summary(job) for job in jobs], available=list(JOBS))
+
+@main.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    if 'username' not in session and not is_valid_api_key(request_api_key(), current_app.config['ADMIN_API_KEYS']):
+        return jsonify(error="Sign in or provide an admin API key."), 401
+    job = mongo.db.jobs.find_one({'_id': job_id})
+    if job is None:
+        return jsonify(error="No such job."), 404
+    return jsonify(job_summary(job))
+
+# Start a maintenance job now. Answers 202 with the new run, or 200 with the run
+# already queued or in progress.
+@main.route('/api/jobs/<name>', methods=['POST'])
+def start_job(name):
+    if not is_valid_api_key(request_api_key(), current_app.config['ADMIN_API_KEYS']):
+        return jsonify(error="Invalid API key."), 401
+    if name not in JOBS:
+        return jsonify(error=f"Unknown job {name!r}; expected one of {', '.join(JOBS)}."), 404
+    job, created = enqueue_job(name)
+    return jsonify(job_summary(job)), 202 if created else 200
+
+# Saved request profiles, newest first. Download one from /api/profiles/<file>.
+@main.route('/api/profiles')
+def list_profiles_route():
+    if not is_valid_api_key(request_api_key(), current_app.config['ADMIN_API_KEYS']):
+        return jsonify(error="Invalid API key."), 401
+    return jsonify(profiles=list_profiles(current_app.config['PROFILE_DIR']))
+
+@main.route('/api/profiles/<path:filename>')
+def download_profile(filename):
+    if not is_valid_api_key(request_api_key(), current_app.config['ADMIN_API_KEYS']):
+        return jsonify(error="Invalid API key."), 401
+    return send_from_directory(os.path.abspath(current_app.config['PROFILE_DIR']), filename, as_attachment=True)
+
+# Indexes the lookups above rely on
+def ensure_indexes(db=None):
+    db = mongo.db if db is None else db
+    db.hospitals.create_index('facility_id')
+    db.bed_stats.create_index('facility_id', unique=True)
+    # At most one queued or running run of each job
+    db.jobs.create_index('name', unique=True, partialFilterExpression={'active': True})
+    db.jobs.create_index([('queued_at', -1)])
+    # Finished runs are kept for 30 days; some jobs run every minute
+    db.jobs.create_index('finished_at', expireAfterSeconds=30 * 24 * 3600)
+    # Reviews still waiting for analysis (review_analysis.py)
+    db.reviews.create_index('analyzed_at')
+    # Claims of analysis runs, to release those of runs that stopped
+    db.reviews.create_index('analysis_claim', sparse=True)
+    # Changes since a client's last delta sync (delta_sync.py)
+    db.hospitals.create_index('_v')
+    db.bed_statuses.create_index('_v')
+
+# Bring the database up to what this version of the app expects: indexes,
+# migrations, and the hospital dataset if the collection is empty. Runs once per
+# deployment, with a short-lived client like load_hospital_registry(), before
+# workers fork (wsgi.py) or start (worker.py). Raises if MongoDB is unreachable,
+# since serving without the unique indexes would let duplicates in.
+def prepare_database(app, import_dataset=True):
+    from pymongo import MongoClient
+    # No per-operation timeout: building indexes or importing the dataset takes longer
+    options = {key: value for key, value in app.config['MONGO_CLIENT_OPTIONS'].items() if key != 'timeoutMS'}
+    options['serverSelectionTimeoutMS'] = 10000
+    with MongoClient(app.config['MONGO_URI'], **options) as client:
+        db = client.get_default_database()
+        ensure_indexes(db)
+        normalize_facility_ids(db)
+        if import_dataset:
+            import_hospital_dataset(app.config['HOSPITAL_DATASET'], db)
+
 if __name__ == '__main__':
-    import_hospital_dataset('data/hospital_dataset.csv')  # Import data from the CSV file
+    app = create_app()
+    prepare_database(app)
     from gevent import pywsgi
     from geventwebsocket.handler import WebSocketHandler
+    # WebSocketHandler also serves the Socket.IO push channel
     pywsgi.WSGIServer(('', 8080), app, handler_class=WebSocketHandler).serve_forever()
 
 
@@ -0,0 +1,62 @@
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory, url_for
+from markupsafe import Markup
+
+# Serves the fingerprinted files written by build_assets.py. Templates call
+# asset_url('logo.png') or picture('logo.png', alt=...) and get the hashed names
+# from static/dist/manifest.json. Those files never change under the same name,
+# so they are served with a one-year immutable Cache-Control header, and text
+# assets are sent precompressed when the browser accepts gzip. Without a built
+# manifest the helpers fall back to the original files in static/.
+
+ONE_YEAR = 365 * 24 * 3600
+IMMUTABLE = f'public, max-age={ONE_YEAR}, immutable'
+
+# Formats offered to the browser before the PNG/JPEG fallback, best first
+PICTURE_SOURCES = (('avif', 'image/avif'), ('webp', 'image/webp'))
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, 'dist', 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def asset_url(filename, variant='file'):
+    entry = current_app.extensions['assets'].get(filename)
+    if entry and variant in entry:
+        return url_for('static', filename=entry[variant])
+    return url_for('static', filename=filename)
+
+# <picture> element with AVIF/WebP sources and the optimized original as <img>;
+# extra keyword arguments become attributes of the <img> (class_ for class)
+def picture(filename, alt, **attrs):
+    entry = current_app.extensions['assets'].get(filename, {})
+    sources = [
+        Markup('<source srcset="{}" type="{}">').format(asset_url(filename, variant), mime)
+        for variant, mime in PICTURE_SOURCES if variant in entry
+    ]
+    attributes = ''.join(
+        Markup(' {}="{}"').format(name.rstrip('_').replace('_', '-'), value) for name, value in attrs.items()
+    )
+    img = Markup('<img src="{}" alt="{}"{}>').format(asset_url(filename), alt, Markup(attributes))
+    return Markup('<picture>{}{}</picture>').format(Markup(''.join(sources)), img)
+
+def serve_dist(filename):
+    dist = os.path.join(current_app.static_folder, 'dist')
+    if 'gzip' in request.accept_encodings and os.path.isfile(os.path.join(dist, filename + '.gz')):
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(dist, filename + '.gz', mimetype=mimetype, max_age=ONE_YEAR)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(dist, filename, max_age=ONE_YEAR)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+def init_assets(app):
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    app.jinja_env.globals.update(asset_url=asset_url, picture=picture)
+    app.add_url_rule(f'{app.static_url_path}/dist/<path:filename>', 'dist', serve_dist)
@@ -0,0 +1,97 @@
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import sys
+import time
+
+import gevent
+
+from benchmarks.harness import boot_app, seed, signed_in_client, environment, save_json, RESULTS_DIR
+
+# Backend load of bursts of identical requests, with and without single-flight
+# coalescing, and what the per-user token bucket lets through.
+#
+#   python -m benchmarks.bench_coalescing
+#
+# Each wave sends N concurrent identical requests for /health_centers?filter=immediate,
+# as users do during an incident. mongomock and fakeredis never yield to other
+# greenlets, so hospital queries are given a simulated round trip of `--latency`
+# seconds; backend load is the number of hospital queries and bed status lookups
+# the wave caused. With coalescing it should stay flat as N grows.
+
+PATH = '/health_centers?filter=immediate'
+# Cheap enough that a burst outpaces the bucket's refill
+BURST_PATH = '/emergency'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Request coalescing and rate limiting under duplicate traffic")
+    parser.add_argument('--duplicates', type=int, nargs='+', default=[1, 10, 50, 100])
+    parser.add_argument('--latency', type=float, default=0.02, help="Simulated MongoDB round trip in seconds")
+    parser.add_argument('--burst-requests', type=int, default=60)
+    args = parser.parse_args(argv)
+
+    oxyleap, app = boot_app()
+    seed(oxyleap, months=1)
+    client = signed_in_client(app)
+    client.get(PATH)  # Load the registry and cache every prediction
+
+    calls = {'queries': 0, 'statuses': 0}
+    get_hospitals_by_type = oxyleap.get_hospitals_by_type
+    bed_statuses = oxyleap.bed_statuses
+
+    def slow_get_hospitals_by_type(hospital_type):
+        calls['queries'] += 1
+        gevent.sleep(args.latency)
+        return get_hospitals_by_type(hospital_type)
+
+    def counted_bed_statuses(facility_ids):
+        calls['statuses'] += len(facility_ids)
+        return bed_statuses(facility_ids)
+
+    oxyleap.get_hospitals_by_type = slow_get_hospitals_by_type
+    oxyleap.bed_statuses = counted_bed_statuses
+
+    def wave(count):
+        calls.update(queries=0, statuses=0)
+        started = time.perf_counter()
+        jobs = [gevent.spawn(signed_in_client(app).get, PATH) for _ in range(count)]
+        gevent.joinall(jobs)
+        assert all(job.value.status_code == 200 for job in jobs)
+        return {'seconds': round(time.perf_counter() - started, 3), **calls}
+
+    results = {}
+    for coalesce in (False, True):
+        app.config['COALESCE_REQUESTS'] = coalesce
+        mode = 'coalesced' if coalesce else 'independent'
+        results[mode] = {}
+        for count in args.duplicates:
+            results[mode][count] = wave(count)
+
+    print(f"{'duplicates':>10}  {'independent: queries / statuses / s':>40}  {'coalesced: queries / statuses / s':>38}")
+    for count in args.duplicates:
+        a, b = results['independent'][count], results['coalesced'][count]
+        print(f"{count:>10}  {a['queries']:>14} / {a['statuses']:>9} / {a['seconds']:>6}"
+              f"  {b['queries']:>12} / {b['statuses']:>9} / {b['seconds']:>6}")
+
+    # One user bursting past the bucket, with Redis and with the in-process fallback
+    app.config['RATE_LIMITING'] = True
+    oxyleap.get_hospitals_by_type = get_hospitals_by_type
+    limits = {}
+    for name in ('redis', 'in_process'):
+        if name == 'in_process':
+            import redis
+            oxyleap._redis[0] = redis.Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.05)
+        burst_client = signed_in_client(app, username=f'burst-{name}')
+        statuses = [burst_client.get(BURST_PATH).status_code for _ in range(args.burst_requests)]
+        limits[name] = {'allowed': statuses.count(200), 'rejected': statuses.count(429)}
+        print(f"rate limit ({name}): {limits[name]['allowed']} allowed, {limits[name]['rejected']} rejected "
+              f"of {args.burst_requests} back-to-back requests (burst {app.config['RATE_LIMIT_USER'][1]})")
+
+    save_json(f'{RESULTS_DIR}/coalescing.json', {
+        'environment': environment(), 'latency': args.latency, 'waves': results, 'rate_limit': limits,
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import json
+import sys
+import time
+
+import gevent
+from gevent import pywsgi
+
+from benchmarks.harness import boot_app, environment, save_json, RESULTS_DIR
+
+# Shows that concurrent requests overlap their I/O once gevent's monkey patching
+# is applied.
+#
+#   python -m benchmarks.bench_concurrency
+#
+# With GEOCODE_ADDRESSES on, /navigate geocodes through a local stand-in for
+# Nominatim that answers after `--delay` seconds. The same requests run one after
+# another and then all at once.
+# With cooperative sockets the concurrent wall time stays close to a single delay
+# rather than growing with the number of requests.
+
+def start_slow_geocoder(delay):
+    def application(environ, start_response):
+        gevent.sleep(delay)
+        body = json.dumps([{'lat': '33.5', 'lon': '-86.8', 'display_name': 'Stub hospital'}]).encode()
+        start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    server = pywsgi.WSGIServer(('127.0.0.1', 0), application, log=None)
+    server.start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cooperative I/O benchmark")
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0.2, help="Geocoder latency in seconds")
+    args = parser.parse_args(argv)
+
+    import app as oxyleap_module
+    real_geocoder = oxyleap_module.get_geocoder
+    server = start_slow_geocoder(args.delay)
+    oxyleap, app = boot_app(
+        GEOCODE_ADDRESSES=True,
+        NOMINATIM_DOMAIN=f'127.0.0.1:{server.server_port}',
+        NOMINATIM_SCHEME='http',
+    )
+    oxyleap.get_geocoder = real_geocoder  # Talk to the local server over real sockets
+    oxyleap.mongo.db.hospitals.insert_one({
+        'facility_id': '10001', 'name': 'Stub hospital', 'address': '1 Main St',
+        'city': 'Dothan', 'state': 'Alabama', 'hospital_type': 'Acute Care Hospitals',
+    })
+
+    def navigate():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['username'] = 'benchmark'
+        response = client.get('/navigate/10001')
+        assert response.status_code == 200, response.status_code
+
+    navigate()  # Warm up folium and the template
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        navigate()
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    gevent.joinall([gevent.spawn(navigate) for _ in range(args.requests)], raise_error=True)
+    concurrent = time.perf_counter() - started
+    server.stop()
+
+    print(f"{args.requests} requests with {args.delay * 1000:.0f} ms of geocoder I/O each")
+    print(f"  sequential: {sequential:.2f} s")
+    print(f"  concurrent: {concurrent:.2f} s  ({sequential / concurrent:.1f}x overlap)")
+    save_json(f'{RESULTS_DIR}/concurrency.json', {
+        'environment': environment(),
+        'requests': args.requests,
+        'delay_s': args.delay,
+        'sequential_s': round(sequential, 3),
+        'concurrent_s': round(concurrent, 3),
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
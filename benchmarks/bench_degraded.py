@@ -0,0 +1,177 @@
+import argparse
+import socket
+import sys
+import threading
+import time
+
+from benchmarks.harness import boot_app, seed, signed_in_client, environment, save_json, summarize, RESULTS_DIR
+
+# Latency of the list pages and /navigate while MongoDB, Redis or Nominatim is
+# slow or down, with the circuit breakers and stale fallbacks of breakers.py.
+#
+#   python -m benchmarks.bench_degraded
+#
+# Faults are injected into local stand-ins through real sockets, so the real
+# clients hit their real timeouts: Redis is a fakeredis TCP server behind a proxy
+# that holds every request for `--redis-delay` seconds, MongoDB is a listener that
+# accepts connections and never answers, and the geocoder takes `--geocoder-delay`
+# seconds. Every request should finish within about one dependency timeout, the
+# first few while the breakers trip and the rest at once, from stale data.
+# While Redis is out /health_centers reads every status from MongoDB, which is
+# fresh but takes mongomock about a second; a real server answers far faster.
+
+PAGES = ('/emergency', '/health_centers?filter=immediate')
+BANNER = b'id="stale-banner"'
+
+# TCP stand-in in front of `target` that holds each request for `delay` seconds
+# before passing it on. With no target it accepts connections and never answers.
+class DelayProxy:
+    def __init__(self, target=None, delay=0.0):
+        self.target = target
+        self.delay = delay
+        self.held = []
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(128)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            conn, _ = self.listener.accept()
+            if self.target is None:
+                self.held.append(conn)
+                continue
+            upstream = socket.create_connection(self.target)
+            threading.Thread(target=self.pipe, args=(conn, upstream, self.delay), daemon=True).start()
+            threading.Thread(target=self.pipe, args=(upstream, conn, 0), daemon=True).start()
+
+    @staticmethod
+    def pipe(source, destination, delay):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if delay:
+                    time.sleep(delay)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            source.close()
+            destination.close()
+
+def redis_server():
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address
+
+# Geocoder that takes `delay` seconds, giving up at its timeout like geopy does
+def slow_geocoder(delay):
+    from geopy.exc import GeocoderTimedOut
+
+    class SlowGeocoder:
+        def __init__(self, timeout):
+            self.timeout = timeout
+
+        def geocode(self, query, *args, **kwargs):
+            time.sleep(min(delay, self.timeout))
+            if delay >= self.timeout:
+                raise GeocoderTimedOut("Service timed out")
+            return None
+    return SlowGeocoder
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Page latency while dependencies are slow or down")
+    parser.add_argument('--requests', type=int, default=20, help="Requests per page and phase")
+    parser.add_argument('--redis-delay', type=float, default=2.0)
+    parser.add_argument('--geocoder-delay', type=float, default=10.0)
+    parser.add_argument('--reset-seconds', type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    import redis
+    from pymongo import MongoClient
+    import breakers
+
+    oxyleap, app = boot_app(
+        REGISTRY_CHECK_INTERVAL=0.5, CIRCUIT_BREAKER_RESET_SECONDS=args.reset_seconds,
+        GEOCODE_ADDRESSES=True, GEOCODER_TIMEOUT=1.0,
+    )
+    seed(oxyleap, months=1)
+    client = signed_in_client(app)
+    facility_id = oxyleap.get_hospitals_with_emergency_services()[0].facility_id
+    pages = PAGES + (f'/navigate/{facility_id}',)
+
+    mongomock_client, mongomock_db = oxyleap.mongo.cx, oxyleap.mongo.db
+    redis_address = redis_server()
+    healthy_redis = redis.Redis(*redis_address, socket_timeout=0.5, socket_connect_timeout=0.5)
+    slow_redis = redis.Redis('127.0.0.1', DelayProxy(redis_address, args.redis_delay).port,
+                             socket_timeout=0.5, socket_connect_timeout=0.5)
+    dead_mongo = MongoClient(f'mongodb://127.0.0.1:{DelayProxy().port}/oxyleap', **app.config['MONGO_CLIENT_OPTIONS'])
+    geocoder = oxyleap.get_geocoder
+
+    def use(redis_client, mongo_down=False, geocoder_delay=0.0):
+        oxyleap.cache.cache._write_client = redis_client
+        oxyleap.cache.cache._read_client = redis_client
+        oxyleap._redis[0] = redis_client
+        oxyleap.mongo.cx, oxyleap.mongo.db = (dead_mongo, dead_mongo['oxyleap']) if mongo_down else (mongomock_client, mongomock_db)
+        oxyleap.get_geocoder = (lambda: slow_geocoder(geocoder_delay)(app.config['GEOCODER_TIMEOUT'])) if geocoder_delay else geocoder
+
+    def run_phase(name):
+        results = {}
+        for page in pages:
+            latencies, stale, errors = [], 0, 0
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                response = client.get(page)
+                latencies.append(time.perf_counter() - t0)
+                stale += BANNER in response.data
+                errors += response.status_code >= 500
+            results[page] = dict(summarize(latencies, time.perf_counter() - started), stale=stale, errors=errors)
+        states = {breaker.name: breaker.state for breaker in breakers.BREAKERS}
+        print(f"\n{name}  (breakers: {', '.join(f'{k} {v}' for k, v in states.items())})")
+        print(f"{'page':<36}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'stale':>8}{'5xx':>6}")
+        for page, r in results.items():
+            print(f"{page:<36}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['max_ms']:>10}{r['stale']:>8}{r['errors']:>6}")
+        return {'pages': results, 'breakers': states}
+
+    phases = {}
+    use(healthy_redis)
+    for page in pages:
+        client.get(page)  # Load the registry and cache every status
+    phases['healthy'] = run_phase('healthy')
+
+    use(slow_redis)
+    phases['redis_slow'] = run_phase(f'Redis answering after {args.redis_delay}s')
+
+    use(healthy_redis, mongo_down=True)
+    time.sleep(args.reset_seconds)  # Let the Redis breaker close again
+    healthy_redis.flushall()  # Every status must come from MongoDB
+    phases['mongo_down'] = run_phase('MongoDB not answering')
+
+    use(slow_redis, mongo_down=True, geocoder_delay=args.geocoder_delay)
+    phases['all_down'] = run_phase(f'MongoDB down, Redis slow, Nominatim taking {args.geocoder_delay}s')
+
+    use(healthy_redis)
+    time.sleep(args.reset_seconds + app.config['REGISTRY_CHECK_INTERVAL'])
+    started = time.perf_counter()
+    fresh = False
+    while not fresh and time.perf_counter() - started < 30:
+        responses = [client.get(page) for page in PAGES]
+        fresh = all(BANNER not in response.data for response in responses)
+        time.sleep(0.1)
+    print(f"\nrecovered: pages fresh again {time.perf_counter() - started:.2f}s after the breakers could close")
+    phases['recovered'] = run_phase('recovered')
+
+    save_json(f'{RESULTS_DIR}/degraded.json', {
+        'environment': environment(), 'requests': args.requests, 'redis_delay': args.redis_delay,
+        'geocoder_delay': args.geocoder_delay, 'reset_seconds': args.reset_seconds, 'phases': phases,
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.harness import boot_app, seed, signed_in_client, environment, save_json, summarize, RESULTS_DIR
+
+# Distance/ETA matrix from a batch of incident locations to every hospital in the
+# dataset: the NumPy computation on its own (chunked, full and top-k, checked
+# against a plain Python haversine) and the whole POST /api/distance_matrix request.
+#
+#   python -m benchmarks.bench_distance_matrix --origins 500
+
+def random_origins(gazetteer_rows, count, seed_value=11):
+    rng = random.Random(seed_value)
+    return [list(rng.choice(gazetteer_rows)) for _ in range(count)]
+
+def python_haversine(lat1, lon1, lat2, lon2):
+    import math
+    from distances import EARTH_RADIUS_KM
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def timed_runs(fn, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distance matrix throughput")
+    parser.add_argument('--origins', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--memory-mb', type=int, default=32)
+    args = parser.parse_args(argv)
+
+    import numpy as np
+    from distances import distance_matrix, hospital_arrays
+
+    oxyleap, app = boot_app()
+    seed(oxyleap, months=1)
+    snapshot = oxyleap.hospitals_snapshot()
+    gazetteer = oxyleap.load_gazetteer()
+    origins_list = random_origins(list(zip(gazetteer.zip_lat, gazetteer.zip_lon)), args.origins)
+    origins = np.array(origins_list)
+    budget = args.memory_mb * 1024 * 1024
+    located = len(hospital_arrays(snapshot)['located'])
+    print(f"{args.origins} origins x {located} hospitals with coordinates")
+
+    # Spot-check against the scalar formula
+    indices, distances = distance_matrix(snapshot, origins, memory_budget=budget)
+    for i in (0, len(origins) // 2, len(origins) - 1):
+        j = indices[i % len(indices)]
+        record = snapshot.records[j]
+        expected = python_haversine(origins[i][0], origins[i][1], record.latitude, record.longitude)
+        assert abs(distances[i, i % len(indices)] - expected) < 1e-6, (distances[i, i % len(indices)], expected)
+    nearest, nearest_distances = distance_matrix(snapshot, origins, top_k=args.top_k, memory_budget=budget)
+    assert np.allclose(nearest_distances, np.sort(distances, axis=1)[:, :args.top_k])
+
+    results = {
+        'full_matrix': timed_runs(lambda: distance_matrix(snapshot, origins, memory_budget=budget), args.iterations),
+        'top_k': timed_runs(lambda: distance_matrix(snapshot, origins, top_k=args.top_k, memory_budget=budget), args.iterations),
+    }
+    client = signed_in_client(app)
+    for name, body in (('request_full', {'origins': origins_list}), ('request_top_k', {'origins': origins_list, 'top_k': args.top_k})):
+        results[name] = timed_runs(lambda: client.post('/api/distance_matrix', json=body), max(1, args.iterations // 2))
+
+    print(f"{'benchmark':<16}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['p50_ms']:>10}{r['p95_ms']:>10}")
+    save_json(f'{RESULTS_DIR}/distance_matrix.json', {
+        'environment': environment(), 'origins': args.origins, 'hospitals': located, 'top_k': args.top_k, 'results': results,
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
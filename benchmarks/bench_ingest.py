@@ -0,0 +1,86 @@
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.harness import boot_app, seed, signed_in_client, environment, save_json, summarize, RESULTS_DIR
+
+# Throughput of bed count ingestion (POST /api/bed_stats) in updates per second,
+# for a few batch sizes, end to end: parsing, validation, the bulk_write, status
+# recomputation and caching, the delta-sync record, activity counters and the
+# Socket.IO push.
+#
+#   python -m benchmarks.bench_ingest --batch-sizes 1 100 1000
+#   python -m benchmarks.bench_ingest --mongo-uri mongodb://localhost:27017/oxyleap_bench
+#
+# Without --mongo-uri MongoDB is mongomock, which scans the whole collection for
+# every update (it uses no indexes), so those figures are a floor: over 90% of the
+# time goes there. Measure throughput targets against a real server. Against one,
+# the MongoDB commands each batch took are also reported, from the mongo entry of
+# the Server-Timing header; mongomock issues none.
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bed count ingestion throughput")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--updates', type=int, default=1000, help="Updates sent per batch size")
+    parser.add_argument('--ndjson', action='store_true', help="Send NDJSON instead of a JSON array")
+    parser.add_argument('--mongo-uri')
+    args = parser.parse_args(argv)
+
+    oxyleap, app = boot_app(args.mongo_uri, INGEST_MAX_BATCH=max(args.batch_sizes))
+    seed(oxyleap, months=12)
+    client = signed_in_client(app)
+    facility_ids = [hospital['facility_id'] for hospital in oxyleap.mongo.db.hospitals.find({}, {'facility_id': 1})]
+    rng = random.Random(3)
+
+    def batch(size):
+        now = datetime.now()
+        return [{
+            'facility_id': rng.choice(facility_ids),
+            'active_beds': rng.randint(0, 500),
+            'inactive_beds': rng.randint(0, 50),
+            'timestamp': (now - timedelta(minutes=rng.randint(0, 60))).isoformat(),
+        } for _ in range(size)]
+
+    def post(updates):
+        if args.ndjson:
+            body = '\n'.join(json.dumps(update) for update in updates)
+            response = client.post('/api/bed_stats', data=body, content_type='application/x-ndjson',
+                                   headers={'X-API-Key': 'benchmark-key'})
+        else:
+            response = client.post('/api/bed_stats', json=updates, headers={'X-API-Key': 'benchmark-key'})
+        assert response.status_code == 200, response.data
+        match = re.search(r'mongo;dur=[0-9.]+;desc="(\d+)x"', response.headers.get('Server-Timing', ''))
+        return int(match.group(1)) if match else 0
+
+    results = {}
+    print(f"{'batch size':>10}{'updates/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'commands':>10}")
+    for size in args.batch_sizes:
+        batches = [batch(size) for _ in range(max(1, args.updates // size))]
+        post(batches[0])  # Warm up
+        latencies = []
+        commands = []
+        started = time.perf_counter()
+        for updates in batches:
+            t0 = time.perf_counter()
+            commands.append(post(updates))
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        result = summarize(latencies, elapsed)
+        result['updates_per_second'] = round(size * len(batches) / elapsed, 1)
+        result['mongo_commands_per_batch'] = round(sum(commands) / len(commands), 1)
+        results[f'batch_size={size}'] = result
+        print(f"{size:>10}{result['updates_per_second']:>12}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+              f"{result['mongo_commands_per_batch']:>10}")
+
+    save_json(f'{RESULTS_DIR}/ingest.json', {
+        'environment': environment(), 'mongo': 'server' if args.mongo_uri else 'mongomock',
+        'ndjson': args.ndjson, 'results': results,
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import sys
+import time
+
+import gevent
+
+from benchmarks.harness import boot_app, summarize, print_table, environment, save_json, RESULTS_DIR
+
+# Latency of a cheap route while a burst of logins runs in the same gevent process.
+#
+#   python -m benchmarks.bench_login_burst
+#
+# Each scenario runs probe greenlets that keep requesting GET /signin while login
+# greenlets post valid credentials. With hashing inline every bcrypt call stalls
+# the event loop, so probe p99 grows to the cost of a whole hash; with the native
+# thread pool the probes keep close to their normal latency, as long as the pool
+# leaves a core free for the event loop.
+
+# Requests are scheduled every `interval` seconds and latency is measured from the
+# scheduled start, so time spent waiting for a blocked event loop is counted too
+def probe(client, stop_at, latencies, interval=0.005):
+    scheduled = time.perf_counter()
+    while scheduled < stop_at:
+        gevent.sleep(max(0.0, scheduled - time.perf_counter()))
+        response = client.get('/signin')
+        assert response.status_code == 200
+        latencies.append(time.perf_counter() - scheduled)
+        scheduled += interval
+
+def login(client, stop_at, count):
+    while time.perf_counter() < stop_at:
+        response = client.post('/signin', data={'username': 'burst-user', 'password': 'burst-password'})
+        assert response.status_code == 302
+        count.append(1)
+
+def scenario(oxyleap, app, pool_size, rounds, logins, probes, duration):
+    import passwords
+    passwords.configure(rounds, pool_size)
+    oxyleap.mongo.db.users.delete_many({})
+    oxyleap.mongo.db.users.insert_one({
+        'email': 'burst@example.com',
+        'username': 'burst-user',
+        'password': passwords.hash_password('burst-password'),
+    })
+
+    latencies, completed = [], []
+    stop_at = time.perf_counter() + duration
+    started = time.perf_counter()
+    greenlets = [gevent.spawn(probe, app.test_client(), stop_at, latencies) for _ in range(probes)]
+    greenlets += [gevent.spawn(login, app.test_client(), stop_at, completed) for _ in range(logins)]
+    gevent.joinall(greenlets, raise_error=True)
+    result = summarize(latencies, time.perf_counter() - started)
+    result['logins_per_second'] = round(len(completed) / duration, 2)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe latency during a login burst")
+    parser.add_argument('--rounds', type=int, default=12, help="bcrypt cost")
+    parser.add_argument('--pool-size', type=int, help="Hashing threads (default: the app's PASSWORD_HASH_POOL_SIZE)")
+    parser.add_argument('--logins', type=int, default=8, help="Concurrent login greenlets")
+    parser.add_argument('--probes', type=int, default=4, help="Concurrent probe greenlets")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per scenario")
+    args = parser.parse_args(argv)
+
+    oxyleap, app = boot_app()
+    if args.pool_size is None:
+        args.pool_size = app.config['PASSWORD_HASH_POOL_SIZE']
+    results = {
+        'probe_idle': scenario(oxyleap, app, args.pool_size, args.rounds, 0, args.probes, args.duration),
+        'probe_burst_inline_hashing': scenario(oxyleap, app, 0, args.rounds, args.logins, args.probes, args.duration),
+        'probe_burst_thread_pool': scenario(oxyleap, app, args.pool_size, args.rounds, args.logins, args.probes, args.duration),
+    }
+    print_table(results)
+    for name, result in results.items():
+        print(f"{name}: {result['logins_per_second']} logins/s")
+    save_json(f'{RESULTS_DIR}/login_burst.json', {'environment': environment(), 'results': results})
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
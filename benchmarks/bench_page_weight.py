@@ -0,0 +1,70 @@
+import argparse
+import re
+import sys
+
+from benchmarks.harness import boot_app, signed_in_client, environment, save_json, RESULTS_DIR
+
+# Page weight of the image-heavy pages, with and without the build_assets.py output.
+#
+#   python build_assets.py
+#   python -m benchmarks.bench_page_weight
+#
+# For each page the HTML and every image it references are fetched the way a
+# browser that accepts WebP/AVIF would: the first <source> of a <picture>,
+# otherwise the <img>. "First visit" is the bytes transferred with an empty cache.
+# "Repeat visit" counts the asset requests a browser still has to make with a warm
+# cache: immutable assets are not requested again, anything else is revalidated.
+
+PAGES = ('/signup', '/signin', '/')
+
+PICTURE_PATTERN = re.compile(r'<picture><source srcset="([^"]+)".*?</picture>', re.S)
+IMAGE_PATTERN = re.compile(r'<img src="([^"]+)"|rel="shortcut icon"[^>]*href="([^"]+)"')
+
+def page_assets(html):
+    urls = PICTURE_PATTERN.findall(html)  # The browser only downloads the first source
+    for img, icon in IMAGE_PATTERN.findall(PICTURE_PATTERN.sub('', html)):
+        urls.append(img or icon)
+    return urls
+
+def measure_pages(client):
+    results = {}
+    for page in PAGES:
+        response = client.get(page)
+        assert response.status_code == 200, (page, response.status_code)
+        html = response.get_data(as_text=True)
+        first_visit = len(response.data)
+        revalidated = 0
+        for url in page_assets(html):
+            asset = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            first_visit += len(asset.data)
+            if 'immutable' not in asset.headers.get('Cache-Control', ''):
+                revalidated += 1
+        results[page] = {'first_visit_kb': round(first_visit / 1024, 1), 'repeat_visit_requests': revalidated}
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Page weight with and without built assets")
+    parser.parse_args(argv)
+
+    oxyleap, app = boot_app()
+    client = signed_in_client(app)
+    manifest = app.extensions['assets']
+    if not manifest:
+        print("static/dist/manifest.json not found; run `python build_assets.py` first")
+        return 1
+
+    app.extensions['assets'] = {}
+    original = measure_pages(client)
+    app.extensions['assets'] = manifest
+    built = measure_pages(client)
+
+    print(f"{'page':<12}{'first visit KB':>30}{'repeat-visit requests':>26}")
+    for page in PAGES:
+        before, after = original[page], built[page]
+        print(f"{page:<12}{before['first_visit_kb']:>14} -> {after['first_visit_kb']:<12}"
+              f"{before['repeat_visit_requests']:>12} -> {after['repeat_visit_requests']}")
+    save_json(f'{RESULTS_DIR}/page_weight.json', {'environment': environment(), 'original': original, 'built': built})
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import argparse
+import random
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.harness import boot_app, environment, save_json, summarize, RESULTS_DIR
+
+# Review analysis throughput in reviews per second (review_analysis.py), for a
+# few process counts and nlp.pipe batch sizes, and the cost of add_review(),
+# which must not grow now that reviews are analysed.
+#
+#   python -m spacy download en_core_web_sm
+#   python -m benchmarks.bench_review_analysis --reviews 5000 --processes 1 2 4
+
+PHRASES = (
+    "The nurses were kind and attentive", "We waited four hours in the emergency room",
+    "Billing was a mess and nobody answered", "Doctors explained everything clearly",
+    "The room was not clean", "Parking is expensive", "Staff at reception were rude",
+    "Great surgery team, quick recovery", "Food was cold", "Not bad for a small hospital",
+)
+
+def synthetic_reviews(hospital_ids, count, seed_value=7):
+    rng = random.Random(seed_value)
+    return [{
+        'hospital_id': rng.choice(hospital_ids),
+        'review': '. '.join(rng.sample(PHRASES, rng.randint(1, 4))) + '.',
+        'rating': str(rng.randint(1, 5)),
+        'timestamp': datetime.now(),
+    } for _ in range(count)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Review analysis throughput")
+    parser.add_argument('--reviews', type=int, default=2000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[16, 64, 256])
+    args = parser.parse_args(argv)
+
+    import review_analysis
+    oxyleap, app = boot_app()
+    db = oxyleap.mongo.db
+    hospital_ids = [f'H{i:05d}' for i in range(200)]
+    reviews = synthetic_reviews(hospital_ids, args.reviews)
+
+    review_analysis.load_pipeline()  # Loaded once here, as a worker would
+    results = {}
+    for processes in args.processes:
+        for batch_size in args.batch_sizes:
+            db.reviews.drop()
+            db.review_insights.drop()
+            db.reviews.insert_many([dict(review) for review in reviews])
+            result = review_analysis.analyze_pending(db, processes, batch_size)
+            results[f'processes={processes} batch_size={batch_size}'] = result
+            print(f"{processes} process(es), batch {batch_size:>4}: {result['reviews_per_second']:>8} reviews/s")
+
+    latencies = []
+    started = time.perf_counter()
+    for review in reviews[:500]:
+        t0 = time.perf_counter()
+        oxyleap.add_review(review['hospital_id'], review['review'], review['rating'])
+        latencies.append(time.perf_counter() - t0)
+    add_review = summarize(latencies, time.perf_counter() - started)
+    print(f"add_review: p50 {add_review['p50_ms']} ms, p95 {add_review['p95_ms']} ms")
+
+    save_json(f'{RESULTS_DIR}/review_analysis.json', {
+        'environment': environment(), 'reviews': args.reviews, 'analysis': results, 'add_review': add_review,
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+
+from benchmarks.harness import (
+    BASELINE_DIR, RESULTS_DIR, boot_app, seed, signed_in_client, measure,
+    environment, load_json, save_json, find_regressions, print_table
+)
+
+# Latency and throughput of the main routes and of predict_bed_availability.
+#
+#   python -m benchmarks.bench_routes                  # compare with the baseline
+#   python -m benchmarks.bench_routes --save-baseline  # record a new baseline
+#   python -m benchmarks.bench_routes --mongo-uri mongodb://localhost:27017/oxyleap_bench
+#
+# Without --mongo-uri the app runs against mongomock. Baselines are machine
+# specific, so record one on the machine that runs the comparison; without one
+# the comparison fails rather than passing with nothing to compare against.
+
+def run(oxyleap, app, iterations):
+    client = signed_in_client(app)
+    db = oxyleap.mongo.db
+    hospital = db.hospitals.find_one({'hospital_type': 'Acute Care Hospitals'})
+    facility_id = hospital['facility_id']
+
+    from passwords import hash_password
+    db.users.insert_one({
+        'email': 'bench@example.com',
+        'username': 'bench-user',
+        'password': hash_password('bench-password'),
+    })
+    anonymous = app.test_client()
+
+    def get(path, **kwargs):
+        response = client.get(path, **kwargs)
+        assert response.status_code == 200, f"{path} returned {response.status_code}"
+
+    def post(path, data, expected=200):
+        response = client.post(path, data=data)
+        assert response.status_code == expected, f"{path} returned {response.status_code}"
+
+    def signin():
+        response = anonymous.post('/signin', data={'username': 'bench-user', 'password': 'bench-password'})
+        assert response.status_code == 302, f"/signin returned {response.status_code}"
+
+    def predict_cold():
+        oxyleap.cache.delete_memoized(oxyleap.predict_bed_availability, facility_id)
+        oxyleap.predict_bed_availability(facility_id)
+
+    # Page routes are far slower than a prediction, so they run fewer times
+    page_iterations = max(5, iterations // 10)
+    results = {}
+    results['health_centers'] = measure(lambda: get('/health_centers'), page_iterations)
+    results['health_centers_immediate'] = measure(lambda: get('/health_centers?filter=immediate'), page_iterations)
+    results['location_get'] = measure(lambda: get('/location'), page_iterations)
+    results['location_post'] = measure(lambda: post('/location', {
+        'city': '', 'state': hospital['state'], 'county': '', 'hospital_type': ''
+    }), page_iterations)
+    results['navigate'] = measure(lambda: get(f'/navigate/{facility_id}'), page_iterations)
+    results['signin'] = measure(signin, page_iterations)
+    results['predict_bed_availability_cold'] = measure(predict_cold, iterations)
+    results['predict_bed_availability_warm'] = measure(lambda: oxyleap.predict_bed_availability(facility_id), iterations)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Route latency benchmarks")
+    parser.add_argument('--mongo-uri', help="Benchmark against a local mongod instead of mongomock")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--baseline', default=os.path.join(BASELINE_DIR, 'routes.json'))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown before a run fails, as a fraction")
+    args = parser.parse_args(argv)
+
+    oxyleap, app = boot_app(args.mongo_uri)
+    seeded = seed(oxyleap)
+    print(f"Seeded {seeded} hospitals ({'mongod' if args.mongo_uri else 'mongomock'})")
+
+    results = run(oxyleap, app, args.iterations)
+    print_table(results)
+    report = {'environment': environment(), 'results': results}
+    save_json(os.path.join(RESULTS_DIR, 'routes.json'), report)
+
+    if args.save_baseline:
+        save_json(args.baseline, report)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_json(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 2
+    regressions = find_regressions(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import ROOT, RESULTS_DIR, boot_app, signed_in_client, environment, save_json
+
+# How import time, memory and route latency grow with the size of the data, on
+# synthetic datasets made by synthetic_data.py at several multiples of the real
+# one, to find where the system stops scaling.
+#
+#   python -m benchmarks.bench_scaling --scales 0.5 1 2 4
+#   python -m benchmarks.bench_scaling --scales 1 10 100 --months 36 \
+#       --mongo-uri mongodb://localhost:27017/oxyleap_bench
+#
+# Each scale runs in a fresh interpreter so memory figures do not carry over.
+# Against mongomock the database lives in that process and is counted in its
+# memory; with --mongo-uri the figures are the app's own. mongomock also checks
+# unique indexes by scanning the collection, so loading bed statistics into it
+# grows quadratically: measure large scales against a real server. Datasets are
+# kept in benchmarks/results/synthetic and reused by runs with the same settings.
+#
+# Memory is how much the resident size grew over each stage, and at its peak
+# over what it was before the app was booted. The growth table gives, for each
+# measurement, the exponent k in cost ~ hospitals^k between consecutive scales:
+# about 1 is linear, about 0 is flat, and above SUPERLINEAR the cost grows
+# faster than the data.
+
+SUPERLINEAR = 1.25
+# Collections the load replaces; users and jobs are left alone on a real server
+COLLECTIONS = ('hospitals', 'bed_stats', 'bed_statuses', 'reviews', 'review_insights', 'meta')
+
+def rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # Bytes on macOS, KiB elsewhere
+
+# Load the dataset in `data_dir` into a fresh app and measure it; runs in the
+# child interpreter
+def run_scale(data_dir, iterations, workers, mongo_uri=None):
+    from preprocess_bed_stats import preprocess_bed_stats
+    from synthetic_data import read_reviews
+
+    stages = {}
+    def stage(name, fn):
+        started = time.perf_counter()
+        result = fn()
+        stages[name] = {'s': round(time.perf_counter() - started, 3), 'rss_mb': rss_mb()}
+        return result
+
+    stages['baseline'] = {'s': 0.0, 'rss_mb': rss_mb()}
+    oxyleap, app = stage('boot', lambda: boot_app(mongo_uri))
+    db = oxyleap.mongo.db
+    for name in COLLECTIONS:
+        db[name].drop()
+    oxyleap.cache.clear()
+
+    stage('import_hospitals', lambda: oxyleap.import_hospital_dataset(os.path.join(data_dir, 'hospital_dataset.csv')))
+    stage('ensure_indexes', oxyleap.ensure_indexes)
+    stage('load_bed_stats', lambda: preprocess_bed_stats(db, os.path.join(data_dir, 'bed_stats'), workers=workers))
+    def load_reviews():
+        for batch in read_reviews(os.path.join(data_dir, 'reviews.csv')):
+            db.reviews.insert_many(batch, ordered=False)
+    stage('load_reviews', load_reviews)
+
+    client = signed_in_client(app)
+    hospital = db.hospitals.find_one({'emergency_services': 'Yes'})
+    routes = {
+        'emergency': lambda: client.get('/emergency'),
+        'health_centers_immediate': lambda: client.get('/health_centers?filter=immediate'),
+        'health_centers': lambda: client.get('/health_centers'),
+        'location_post': lambda: client.post('/location', data={
+            'city': '', 'state': hospital['state'], 'county': '', 'hospital_type': ''
+        }),
+        'navigate': lambda: client.get(f"/navigate/{hospital['facility_id']}"),
+        'records': lambda: client.get('/records'),
+        'sync_full': lambda: client.get('/api/sync'),
+    }
+
+    # The first request also loads the hospital registry and computes and caches
+    # every bed status it shows
+    results = {}
+    for name, fn in routes.items():
+        latencies = []
+        for _ in range(iterations + 1):
+            started = time.perf_counter()
+            response = fn()
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, f"{name} returned {response.status_code}"
+        warm = sorted(latencies[1:])
+        results[name] = {
+            'cold_ms': round(latencies[0] * 1000, 3),
+            'p50_ms': round(warm[len(warm) // 2] * 1000, 3),
+            'max_ms': round(warm[-1] * 1000, 3),
+            'bytes': len(response.data),
+        }
+    stages['routes'] = {'s': None, 'rss_mb': rss_mb()}
+
+    counts = {name: db[name].estimated_document_count() for name in ('hospitals', 'bed_stats', 'reviews')}
+    return {'counts': counts, 'stages': stages, 'routes': results, 'peak_rss_mb': peak_rss_mb()}
+
+# Dataset for `scale`, generated once per set of settings
+def dataset(scale, months, reviews, seed):
+    from synthetic_data import generate
+    data_dir = os.path.join(RESULTS_DIR, 'synthetic', f'x{scale:g}-m{months}-r{reviews:g}-s{seed}')
+    if not os.path.exists(os.path.join(data_dir, 'reviews.csv')):
+        started = time.perf_counter()
+        result = generate(data_dir, scale, months, reviews, seed)
+        print(f"Generated {result['hospitals']} hospitals and {result['reviews']} reviews "
+              f"in {time.perf_counter() - started:.1f}s")
+    return data_dir
+
+def measure_scale(data_dir, args):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    command = [sys.executable, '-m', 'benchmarks.bench_scaling', '--child', data_dir, '--output', output,
+               '--iterations', str(args.iterations)]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    if args.mongo_uri:
+        command += ['--mongo-uri', args.mongo_uri]
+    try:
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+# Exponent k in cost ~ hospitals^k between two runs; None when either is ~0
+def growth(n1, cost1, n2, cost2):
+    if not cost1 or not cost2 or cost1 <= 0.001 or n1 == n2:
+        return None
+    return round(math.log(cost2 / cost1) / math.log(n2 / n1), 2)
+
+def measurements(run):
+    values = {f'{name}_s': stage['s'] for name, stage in run['stages'].items() if stage['s']}
+    # Memory each stage added, so its growth tracks the data the stage handles
+    previous = None
+    for name, stage in run['stages'].items():
+        if previous is not None:
+            values[f'{name}_mb'] = round(stage['rss_mb'] - previous, 1)
+        previous = stage['rss_mb']
+    values['peak_mb'] = round(run['peak_rss_mb'] - run['stages']['baseline']['rss_mb'], 1)
+    values.update({f'{name}_ms': route['p50_ms'] for name, route in run['routes'].items()})
+    values.update({f'{name}_cold_ms': route['cold_ms'] for name, route in run['routes'].items()})
+    return values
+
+def print_report(runs, budget_ms):
+    scales = list(runs)
+    print(f"\n{'':<34}" + ''.join(f"{f'x{scale:g}':>12}" for scale in scales))
+    print(f"{'hospitals':<34}" + ''.join(f"{runs[scale]['counts']['hospitals']:>12}" for scale in scales))
+    print(f"{'reviews':<34}" + ''.join(f"{runs[scale]['counts']['reviews']:>12}" for scale in scales))
+    table = {scale: measurements(runs[scale]) for scale in scales}
+    names = list(table[scales[0]])
+    for name in names:
+        print(f"{name:<34}" + ''.join(f"{table[scale].get(name, ''):>12}" for scale in scales))
+
+    exponents = {}
+    if len(scales) > 1:
+        print(f"\nGrowth exponent per step (above {SUPERLINEAR} grows faster than the data)")
+        steps = list(zip(scales, scales[1:]))
+        print(f"{'':<34}" + ''.join(f"{f'x{a:g}->x{b:g}':>12}" for a, b in steps))
+        for name in names:
+            row = [growth(runs[a]['counts']['hospitals'], table[a].get(name),
+                          runs[b]['counts']['hospitals'], table[b].get(name)) for a, b in steps]
+            exponents[name] = row
+            flag = '  superlinear' if any(k is not None and k > SUPERLINEAR for k in row) else ''
+            print(f"{name:<34}" + ''.join(f"{'' if k is None else k:>12}" for k in row) + flag)
+
+    over_budget = {}
+    for name in runs[scales[0]]['routes']:
+        over = [scale for scale in scales if runs[scale]['routes'][name]['p50_ms'] > budget_ms]
+        if over:
+            over_budget[name] = over[0]
+    if over_budget:
+        print(f"\nFirst scale with a warm p50 over {budget_ms} ms:")
+        for name, scale in over_budget.items():
+            print(f"  {name:<32}x{scale:g}")
+    return exponents, over_budget
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time, memory and route latency against data size")
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.5, 1, 2],
+                        help="Multiples of the real number of hospitals")
+    parser.add_argument('--months', type=int, default=24, help="Months of bed statistics per hospital")
+    parser.add_argument('--reviews', type=float, default=2.0, help="Average reviews per hospital")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=3, help="Warm requests per route")
+    parser.add_argument('--workers', type=int, help="Processes parsing bed statistics (default: one per CPU)")
+    parser.add_argument('--budget-ms', type=float, default=1000, help="Warm p50 a route should stay under")
+    parser.add_argument('--mongo-uri')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_scale(args.child, args.iterations, args.workers, args.mongo_uri)
+        with open(args.output, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    runs = {}
+    for scale in sorted(args.scales):
+        data_dir = dataset(scale, args.months, args.reviews, args.seed)
+        print(f"x{scale:g}: loading and measuring...")
+        runs[scale] = measure_scale(data_dir, args)
+    exponents, over_budget = print_report(runs, args.budget_ms)
+
+    save_json(f'{RESULTS_DIR}/scaling.json', {
+        'environment': environment(), 'months': args.months, 'reviews_per_hospital': args.reviews,
+        'mongo': 'server' if args.mongo_uri else 'mongomock', 'budget_ms': args.budget_ms,
+        'runs': {f'x{scale:g}': run for scale, run in runs.items()},
+        'growth': exponents, 'over_budget': {name: f'x{scale:g}' for name, scale in over_budget.items()},
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.harness import ROOT, RESULTS_DIR, environment, save_json
+
+# Cold start cost of the app: import time of every module pulled in by
+# `import app`, the time create_app() takes, and the import cost of the heavy
+# dependencies that are now deferred to the routes that need them.
+#
+#   python -m benchmarks.bench_startup
+#
+# Each measurement runs in a fresh interpreter so nothing is already imported.
+
+DEFERRED_MODULES = ('pandas', 'folium', 'geopy.geocoders', 'sklearn.ensemble')
+
+def run_python(code, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, '-c', code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+# Parse `python -X importtime` output into {module: (self_us, cumulative_us)} for
+# the module itself and the modules it imports directly
+def import_times(module):
+    result = run_python(f'import {module}', '-X', 'importtime')
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def create_app_time():
+    code = (
+        'import json, time\n'
+        't0 = time.perf_counter()\n'
+        'import app\n'
+        't1 = time.perf_counter()\n'
+        'app.create_app()\n'
+        't2 = time.perf_counter()\n'
+        'print(json.dumps({"import_s": t1 - t0, "create_app_s": t2 - t1}))\n'
+    )
+    return json.loads(run_python(code).stdout)
+
+def deferred_import_time(module):
+    code = f'import time\nt0 = time.perf_counter()\nimport {module}\nprint(time.perf_counter() - t0)\n'
+    try:
+        return float(run_python(code).stdout)
+    except subprocess.CalledProcessError:
+        return None  # Not installed here
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="App cold start benchmark")
+    parser.add_argument('--top', type=int, default=20, help="Modules to list")
+    args = parser.parse_args(argv)
+
+    times = import_times('app')
+    slowest = sorted(times.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    print(f"{'module':<40}{'self ms':>10}{'cumulative ms':>16}")
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{name:<40}{self_us / 1000:>10.1f}{cumulative_us / 1000:>16.1f}")
+
+    startup = create_app_time()
+    print(f"\nimport app: {startup['import_s'] * 1000:.1f} ms, create_app(): {startup['create_app_s'] * 1000:.1f} ms")
+
+    deferred = {module: deferred_import_time(module) for module in DEFERRED_MODULES}
+    print("\nDeferred until first use:")
+    for module, seconds in deferred.items():
+        print(f"  {module:<38}{'not installed' if seconds is None else f'{seconds * 1000:.1f} ms'}")
+
+    save_json(f'{RESULTS_DIR}/startup.json', {
+        'environment': environment(),
+        'startup': startup,
+        'modules_ms': {name: cumulative_us / 1000 for name, (self_us, cumulative_us) in slowest},
+        'deferred_ms': {module: seconds and seconds * 1000 for module, seconds in deferred.items()},
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.harness import boot_app, seed, signed_in_client, environment, save_json, RESULTS_DIR
+
+# What a mobile client downloads to refresh its hospital list: the full
+# /health_centers page, a full /api/sync and the delta after a round of bed
+# updates, as JSON and as msgpack (when installed). Bytes are uncompressed.
+#
+#   python -m benchmarks.bench_sync --updates 50
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delta sync payload sizes")
+    parser.add_argument('--updates', type=int, default=50, help="Facilities whose beds change between syncs")
+    args = parser.parse_args(argv)
+
+    oxyleap, app = boot_app()
+    seed(oxyleap, months=3)
+    client = signed_in_client(app)
+
+    def fetch(path, **kwargs):
+        started = time.perf_counter()
+        response = client.get(path, **kwargs)
+        assert response.status_code == 200, response.status_code
+        return response, round((time.perf_counter() - started) * 1000, 3)
+
+    results = {}
+    page, ms = fetch('/health_centers?filter=semi-urgent')
+    results['health_centers_html'] = {'bytes': len(page.data), 'ms': ms}
+
+    first, ms = fetch('/api/sync')
+    version = first.get_json()['v']
+    results['full_json'] = {'bytes': len(first.data), 'ms': ms, 'hospitals': len(first.get_json()['h'])}
+    packed, ms = fetch('/api/sync', headers={'Accept': 'application/msgpack'})
+    results['full_msgpack'] = {'bytes': len(packed.data), 'ms': ms, 'content_type': packed.content_type}
+
+    # Bed updates for a few facilities, enough to flip some of their statuses
+    rng = random.Random(5)
+    facility_ids = [row['i'] for row in first.get_json()['h']]
+    updates = [{'facility_id': facility_id, 'active_beds': rng.randint(0, 500), 'inactive_beds': rng.randint(0, 50)}
+               for facility_id in rng.sample(facility_ids, args.updates)]
+    response = client.post('/api/bed_stats', json=updates, headers={'X-API-Key': 'benchmark-key'})
+    assert response.status_code == 200, response.data
+
+    delta, ms = fetch(f'/api/sync?since={version}')
+    body = delta.get_json()
+    results['delta_json'] = {'bytes': len(delta.data), 'ms': ms, 'hospitals': len(body['h']), 'statuses': len(body['s'])}
+    packed, ms = fetch(f'/api/sync?since={version}&format=msgpack')
+    results['delta_msgpack'] = {'bytes': len(packed.data), 'ms': ms, 'content_type': packed.content_type}
+    unchanged, ms = fetch(f"/api/sync?since={body['v']}")
+    results['unchanged_json'] = {'bytes': len(unchanged.data), 'ms': ms}
+
+    print(f"{'response':<22}{'bytes':>12}{'ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['bytes']:>12}{r['ms']:>10}")
+    save_json(f'{RESULTS_DIR}/sync.json', {'environment': environment(), 'updates': args.updates, 'results': results})
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import gevent
+
+from benchmarks.harness import ROOT, RESULTS_DIR, environment, save_json
+
+# Throughput of the gunicorn deployment as the number of workers grows.
+#
+#   python -m benchmarks.bench_workers --workers 1 2 4 --path /signin
+#
+# Each step starts gunicorn with gunicorn.conf.py and the given worker count,
+# keeps `--concurrency` requests in flight for `--duration` seconds and reports
+# requests per second. Routes that read MongoDB need MONGO_URI to point at a
+# running mongod.
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not start serving {url}")
+
+def load(url, concurrency, duration):
+    completed = []
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < stop_at:
+            urllib.request.urlopen(url, timeout=10).read()
+            completed.append(1)
+
+    gevent.joinall([gevent.spawn(client) for _ in range(concurrency)], raise_error=True)
+    return len(completed) / duration
+
+def run(workers, args):
+    port = args.port
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), OXYLEAP_BIND=f'127.0.0.1:{port}')
+    env.setdefault('SOCKETIO_MESSAGE_QUEUE', '')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        url = f'http://127.0.0.1:{port}{args.path}'
+        wait_until_up(url)
+        load(url, args.concurrency, 1.0)  # Warm up every worker
+        return load(url, args.concurrency, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="gunicorn worker scaling benchmark")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--path', default='/signin')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=8099)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for workers in args.workers:
+        results[workers] = round(run(workers, args), 1)
+        speedup = results[workers] / results[args.workers[0]]
+        print(f"{workers:>3} workers: {results[workers]:>9} req/s  ({speedup:.2f}x)")
+    save_json(f'{RESULTS_DIR}/workers.json', {
+        'environment': environment(), 'path': args.path, 'requests_per_second': results
+    })
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import contextvars
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+from flask.testing import FlaskClient
+
+# Benchmarks run from the repository root so the app finds data/ and templates/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, 'benchmarks', 'baselines')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Geocoder stand-in so /navigate never leaves the machine. Coordinates are derived
+# from the query so repeated lookups of the same address agree.
+class StubLocation:
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+class StubGeocoder:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def geocode(self, query, *args, **kwargs):
+        rng = random.Random(query)
+        return StubLocation(rng.uniform(25.0, 49.0), rng.uniform(-124.0, -67.0))
+
+# Test client whose requests start from an empty context. Flask reuses an app
+# context that is already active, so requests made while boot_app's context is
+# pushed would otherwise all share one `g`, unlike requests in production.
+class IsolatedClient(FlaskClient):
+    def open(self, *args, **kwargs):
+        return contextvars.Context().run(super().open, *args, **kwargs)
+
+# Build the app wired to local stand-ins: an in-memory Mongo (mongomock) unless a
+# mongod URI is given, fakeredis for the cache and an in-process Socket.IO channel.
+# Returns the app module and the app, with an application context pushed for
+# calls made outside requests. Each test client request gets a context of its own.
+def boot_app(mongo_uri=None, **config):
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    import fakeredis
+    import app as oxyleap
+
+    class BenchConfig(oxyleap.Config):
+        TESTING = True
+        SOCKETIO_MESSAGE_QUEUE = None
+        INGEST_API_KEYS = ['benchmark-key']
+        RATE_LIMITING = False  # Every benchmark request comes from one user and address
+        MONGO_URI = mongo_uri or 'mongodb://localhost:27017/oxyleap_bench'
+    for key, value in config.items():
+        setattr(BenchConfig, key, value)
+
+    app = oxyleap.create_app(BenchConfig)
+    app.test_client_class = IsolatedClient
+    app.app_context().push()
+    if not mongo_uri:
+        import mongomock
+        oxyleap.mongo.cx = mongomock.MongoClient()
+        oxyleap.mongo.db = oxyleap.mongo.cx['oxyleap']
+    redis_client = fakeredis.FakeStrictRedis()
+    oxyleap.cache.cache._write_client = redis_client
+    oxyleap.cache.cache._read_client = redis_client
+    oxyleap._redis[0] = redis_client
+    oxyleap.get_geocoder = StubGeocoder
+    return oxyleap, app
+
+# Seed hospitals from data/hospital_dataset.csv plus a deterministic monthly bed
+# series for each of them, standing in for data/bed_stats
+def seed(oxyleap, months=24, seed_value=42):
+    db = oxyleap.mongo.db
+    for name in ('hospitals', 'bed_stats', 'users', 'reviews'):
+        db[name].drop()
+    oxyleap.import_hospital_dataset(os.path.join(ROOT, 'data', 'hospital_dataset.csv'))
+    oxyleap.ensure_indexes()
+
+    rng = random.Random(seed_value)
+    documents = []
+    for hospital in db.hospitals.find({}, {'facility_id': 1, 'bed_count': 1}):
+        beds = int(hospital.get('bed_count') or 50)
+        data = []
+        for month in range(months):
+            active = rng.randint(beds // 3, beds)
+            data.append({
+                'Date': datetime(2022 + month // 12, month % 12 + 1, 1),
+                'Active Beds': active,
+                'Inactive Beds': beds - active,
+            })
+        documents.append({'facility_id': hospital['facility_id'], 'data': data})
+    db.bed_stats.insert_many(documents)
+    oxyleap.cache.clear()
+    return len(documents)
+
+# A test client whose session is already signed in
+def signed_in_client(app, username='benchmark'):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = username
+    return client
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+# Summarise a list of latencies in seconds measured over `elapsed` seconds
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+def measure(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+def load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+# Compare results against a baseline; latency may grow and throughput may shrink
+# by at most `tolerance` (a fraction) before it counts as a regression
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {previous['throughput_rps']} -> {current['throughput_rps']}")
+    return regressions
+
+def print_table(results):
+    print(f"{'benchmark':<34}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<34}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['throughput_rps']:>10}")
@@ -0,0 +1,219 @@
+import threading
+import time
+from datetime import datetime
+from flask import g, has_request_context, request
+from flask_caching.backends import RedisCache
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+import redis
+from instrumentation import CIRCUIT_BREAKER_TRIPS, STALE_RESPONSES
+
+# Degraded-mode serving when MongoDB, Redis or Nominatim is slow or down.
+#
+# Each dependency has a circuit breaker. Calls go through while it is closed.
+# After `failures` consecutive timeouts or connection errors it opens, and calls
+# fail at once with CircuitOpen instead of each waiting out a timeout. After
+# `reset_seconds` it lets a single trial call through (half-open): success closes
+# it, failure opens it for another period.
+#
+# List pages fall back to the last data this process loaded successfully, with a
+# banner saying how old it is (mark_stale), and refresh it on a background thread
+# so that no visitor's request is the one waiting on the failing service.
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+class CircuitOpen(Exception):
+    def __init__(self, breaker):
+        super().__init__(f"{breaker.name} is unavailable")
+        self.breaker = breaker
+
+class CircuitBreaker:
+    def __init__(self, name, errors, failures=3, reset_seconds=15):
+        self.name = name
+        self.errors = errors  # Exceptions that count as the dependency failing
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.lock = threading.Lock()
+        self.failed = 0  # Consecutive failures
+        self.opened_at = None  # time.monotonic() it opened; None while closed
+        self.probing = False  # A half-open trial call is in flight
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return HALF_OPEN
+        return OPEN
+
+    @property
+    def closed(self):
+        return self.opened_at is None
+
+    # Whether a call may go ahead now; half-open, only one at a time
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.failed = 0
+                self.opened_at = None
+                return
+            self.failed += 1
+            if self.opened_at is None and self.failed < self.failures:
+                return
+            if self.opened_at is None:
+                print(f"Circuit breaker for {self.name} opened after {self.failed} failures")
+                CIRCUIT_BREAKER_TRIPS.inc(self.name)
+            self.opened_at = time.monotonic()  # A failed trial keeps it open for another period
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpen(self)
+        try:
+            result = fn(*args, **kwargs)
+        except self.errors:
+            self.record(False)
+            raise
+        except Exception:
+            self.record(True)  # The dependency answered; the error is the caller's
+            raise
+        except BaseException:
+            with self.lock:
+                self.probing = False
+            raise
+        self.record(True)
+        return result
+
+MONGO_ERRORS = (ConnectionFailure, ExecutionTimeout)  # Timeouts, network errors and no server to select
+REDIS_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+mongo_breaker = CircuitBreaker('MongoDB', MONGO_ERRORS)
+redis_breaker = CircuitBreaker('Redis', REDIS_ERRORS)
+# geopy is only imported when a map is requested, so every error counts
+geocoder_breaker = CircuitBreaker('Nominatim', (Exception,))
+BREAKERS = (mongo_breaker, redis_breaker, geocoder_breaker)
+
+def init_breakers(app):
+    for breaker in BREAKERS:
+        breaker.failures = app.config['CIRCUIT_BREAKER_FAILURES']
+        breaker.reset_seconds = app.config['CIRCUIT_BREAKER_RESET_SECONDS']
+
+    # A request inside an app context pushed by the caller shares its `g`
+    @app.before_request
+    def reset_stale():
+        g.pop('stale_since', None)
+
+    # Pages extending base.html show a banner when built from stale data
+    @app.context_processor
+    def stale_context():
+        return {'stale_since': g.get('stale_since')}
+
+    # A page with nothing to fall back on while its dependency is out
+    @app.errorhandler(CircuitOpen)
+    def circuit_open(e):
+        return unavailable(e.breaker)
+
+    # MongoDB failing under a page that has no fallback, before its breaker opens
+    def mongo_unavailable(e):
+        return unavailable(mongo_breaker)
+    for error in MONGO_ERRORS:
+        app.register_error_handler(error, mongo_unavailable)
+
+def unavailable(breaker):
+    retry_after = str(max(1, int(breaker.reset_seconds)))
+    return "This page is temporarily unavailable. Please try again shortly.", 503, {'Retry-After': retry_after}
+
+# Note that the current page is built from data last refreshed at `since`
+def mark_stale(since):
+    if not has_request_context():
+        return
+    if 'stale_since' not in g:
+        STALE_RESPONSES.inc(request.endpoint)
+        g.stale_since = since
+    else:
+        g.stale_since = min(g.stale_since, since)
+
+# The last value fetched successfully, kept to serve while its dependency fails.
+# revalidate() fetches a new one on a background thread, one at a time.
+class LastGood:
+    def __init__(self, name):
+        self.name = name
+        self.value = None
+        self.updated_at = None
+        self.lock = threading.Lock()
+
+    def update(self, value):
+        self.value = value
+        self.updated_at = datetime.now()
+
+    def revalidate(self, fetch):
+        if not self.lock.acquire(blocking=False):
+            return
+        def run():
+            try:
+                self.update(fetch())
+            except CircuitOpen:
+                pass  # Retried on a later request
+            except Exception as e:
+                print(f"Background refresh of {self.name} failed: {e}")
+            finally:
+                self.lock.release()
+        threading.Thread(target=run, daemon=True).start()
+
+# RedisCache that treats Redis being slow or down as a cache miss. Calls go
+# through the Redis breaker, so once it opens lookups cost nothing instead of a
+# socket timeout each, and writes are dropped until Redis is back.
+class GuardedRedisCache(RedisCache):
+    def _guarded(self, fn, fallback, *args, **kwargs):
+        try:
+            return redis_breaker.call(fn, *args, **kwargs)
+        except CircuitOpen:
+            return fallback
+        except REDIS_ERRORS as e:
+            print(f"Cache unavailable: {e}")
+            return fallback
+
+    def get(self, key):
+        return self._guarded(super().get, None, key)
+
+    def get_many(self, *keys):
+        return self._guarded(super().get_many, [None] * len(keys), *keys)
+
+    def has(self, key):
+        return self._guarded(super().has, False, key)
+
+    def set(self, key, value, timeout=None):
+        return self._guarded(super().set, False, key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self._guarded(super().add, False, key, value, timeout)
+
+    def set_many(self, mapping, timeout=None):
+        return self._guarded(super().set_many, [], mapping, timeout)
+
+    def delete(self, key):
+        return self._guarded(super().delete, False, key)
+
+    def delete_many(self, *keys):
+        return self._guarded(super().delete_many, [], *keys)
+
+    def unlink(self, *keys):
+        return self._guarded(super().unlink, [], *keys)
+
+    def inc(self, key, delta=1):
+        return self._guarded(super().inc, None, key, delta)
+
+    def dec(self, key, delta=1):
+        return self._guarded(super().dec, None, key, delta)
+
+    def clear(self):
+        return self._guarded(super().clear, False)
@@ -0,0 +1,129 @@
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+from PIL import Image, features
+
+# Builds the optimized copies of static/ that the app serves from static/dist/:
+#
+#   python build_assets.py
+#
+# - Images are downscaled to --max-size pixels and re-encoded as an optimized PNG
+#   fallback plus WebP, and AVIF when this Pillow build can write it.
+# - Every output file is named after a hash of its content (logo.3f2a9c1d0b.webp),
+#   so it can be cached forever: a changed file gets a new name.
+# - Text assets (CSS, JS, SVG, ...) are fingerprinted and precompressed with gzip.
+# - static/dist/manifest.json maps each source name to its outputs; assets.py
+#   reads it to resolve asset_url() and picture() in templates.
+#
+# Run it again after changing anything in static/. The output is not committed.
+
+SOURCE_DIR = 'static'
+DIST_DIR = os.path.join(SOURCE_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+TEXT_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+
+# Shown at most 350 CSS pixels wide today; this leaves room for 2x displays
+DEFAULT_MAX_SIZE = 1024
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+def write_fingerprinted(name, data, ext):
+    stem = os.path.splitext(name)[0]
+    filename = f'{stem}.{fingerprint(data)}{ext}'
+    path = os.path.join(DIST_DIR, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return f'dist/{filename}'.replace(os.sep, '/')
+
+def encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+def avif_supported():
+    try:
+        return features.check_module('avif')
+    except ValueError:
+        pass  # Pillow < 11.2 has no built-in AVIF support
+    try:
+        import pillow_avif  # noqa: F401  Plugin that registers the AVIF encoder on older Pillow
+        return True
+    except ImportError:
+        return False
+
+def build_image(name, path, max_size, quality, avif):
+    with Image.open(path) as image:
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    entry = {'width': image.width, 'height': image.height}
+    entry['file'] = write_fingerprinted(name, encode(image, 'PNG', optimize=True), '.png')
+    entry['webp'] = write_fingerprinted(name, encode(image, 'WEBP', quality=quality, method=6), '.webp')
+    if avif:
+        entry['avif'] = write_fingerprinted(name, encode(image, 'AVIF', quality=quality - 20), '.avif')
+    return entry
+
+def build_text(name, path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    entry = {'file': write_fingerprinted(name, data, os.path.splitext(name)[1])}
+    # Precompressed next to the original; mtime=0 keeps the output reproducible
+    with open(os.path.join(SOURCE_DIR, entry['file']) + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    return entry
+
+def source_files():
+    for root, dirs, files in os.walk(SOURCE_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != DIST_DIR]
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            yield os.path.relpath(path, SOURCE_DIR).replace(os.sep, '/'), path
+
+def build(max_size=DEFAULT_MAX_SIZE, quality=80):
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+    avif = avif_supported()
+    manifest = {}
+    for name, path in source_files():
+        ext = os.path.splitext(name)[1].lower()
+        if ext in IMAGE_EXTENSIONS:
+            manifest[name] = build_image(name, path, max_size, quality, avif)
+        elif ext in TEXT_EXTENSIONS:
+            manifest[name] = build_text(name, path)
+    with open(os.path.join(DIST_DIR, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest, avif
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build fingerprinted, optimized static assets")
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE, help="Longest image side in pixels")
+    parser.add_argument('--quality', type=int, default=80, help="WebP quality (AVIF uses 20 less)")
+    args = parser.parse_args(argv)
+
+    manifest, avif = build(args.max_size, args.quality)
+    if not avif:
+        print("AVIF encoder not available in this Pillow build; writing WebP and PNG only")
+    before = after = 0
+    for name, entry in manifest.items():
+        size = os.path.getsize(os.path.join(SOURCE_DIR, name))
+        # What a modern browser downloads: the smallest variant it accepts
+        best = min(os.path.getsize(os.path.join(SOURCE_DIR, entry[key])) for key in ('avif', 'webp', 'file') if key in entry)
+        before += size
+        after += best
+        print(f"{name:<24}{size / 1024:>9.1f} KB -> {best / 1024:>7.1f} KB")
+    print(f"{'total':<24}{before / 1024:>9.1f} KB -> {after / 1024:>7.1f} KB")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import argparse
+import bz2
+import csv
+import json
+import os
+import sys
+
+# Builds data/us_zip_centroids.csv, the offline gazetteer used by gazetteer.py, from
+# the ZIP code database bundled with the MIT-licensed `zipcodes` package (1.x ships
+# it as zips.json.bz2). The package is only needed to rebuild the file:
+#
+#   pip install "zipcodes<2"
+#   python build_gazetteer.py
+
+OUTPUT_PATH = 'data/us_zip_centroids.csv'
+
+def bundled_zips_path():
+    import zipcodes
+    return os.path.join(os.path.dirname(zipcodes.__file__), 'zips.json.bz2')
+
+def build(source, output):
+    with bz2.open(source, 'rt') as f:
+        zips = json.load(f)
+
+    rows = []
+    for record in zips:
+        # Some records carry no coordinates, or 0, 0 as a placeholder
+        if not record.get('lat') or not record.get('long') or float(record['lat']) == float(record['long']) == 0:
+            continue
+        rows.append((
+            record['zip_code'], record['city'], record['state'],
+            round(float(record['lat']), 4), round(float(record['long']), 4)
+        ))
+    rows.sort()
+
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['zip_code', 'city', 'state', 'latitude', 'longitude'])
+        writer.writerows(rows)
+    return len(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the offline ZIP code gazetteer")
+    parser.add_argument('--source', help="Path to zips.json.bz2 (default: the installed zipcodes package)")
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    args = parser.parse_args(argv)
+
+    count = build(args.source or bundled_zips_path(), args.output)
+    print(f"Wrote {count} ZIP codes to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
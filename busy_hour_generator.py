@@ -1,49 +1,64 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 import os
+import re
 import shutil
+from datetime import timedelta
 
-# Load the dataset
-file_path = 'data/hospital_dataset.csv'  # Replace with your actual path
-hospital_data = pd.read_csv(file_path)
-
-# Extract the hospital names
-hospital_names = hospital_data['name'].unique()
-
-# Directory to save images
-output_dir = 'hospital_busy_hours'
-os.makedirs(output_dir, exist_ok=True)
-
-# Example busy hour pattern for a day (simulated)
-busy_pattern = [5, 10, 15, 20, 30, 50, 70, 90, 100, 120, 140, 150, 
-                160, 170, 180, 190, 200, 180, 160, 120, 100, 70, 40, 20]
-
-# Time labels (hours)
-time_labels = [f"{i}am" if i < 12 else f"{i-12 if i > 12 else 12}pm" for i in range(24)]
-
-# Loop through each hospital and create an image
-for hospital in hospital_names:
-    plt.figure(figsize=(10, 5))
-    plt.bar(time_labels, busy_pattern, color='blue')
-    plt.title(f"Popular Times for {hospital}")
-    plt.xlabel('Time of Day')
-    plt.ylabel('Activity Level')
-    
-    # Create the file name
-    file_name = hospital.lower().replace(" ", "-").replace("'", "") + ".png"
-    file_path = os.path.join(output_dir, file_name)
-    
-    # Ensure the directory exists (in case of nested directories)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    
-    # Save the figure
-    plt.savefig(file_path)
-    plt.close()  # Close the plot to save memory
-
-# Zip the directory
-zip_file_path = 'hospital_busy_hours.zip'
-shutil.make_archive(zip_file_path.replace('.zip', ''), 'zip', output_dir)
-
-# Print completion message
-print("busy hours extracted successfully")
+MONGO_URI = "mongodb://localhost:27017/oxyleap"
+
+# Hour labels (rows of the chart)
+time_labels = [f"{(i % 12) or 12}{'am' if i < 12 else 'pm'}" for i in range(24)]
+
+# File name of a hospital's chart; the facility id keeps hospitals that share a
+# name apart
+def chart_file_name(facility_id, name):
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower().replace("'", "")).strip("-")
+    return f"{facility_id}-{slug}.png"
+
+# Draw one busy hours chart per hospital in output_dir and zip them. `hospitals`
+# yields (facility_id, name, busy) with `busy` as activity.busy_hours() returns
+# it; hospitals without activity yet get no chart. Charts from earlier runs are
+# removed first so the archive only holds current ones. `progress` is called as
+# progress(done, total) while the charts are drawn.
+def generate_busy_hour_charts(hospitals, output_dir='hospital_busy_hours', progress=None):
+    import matplotlib
+    matplotlib.use('Agg')  # No display in a worker
+    import matplotlib.pyplot as plt
+
+    hospitals = list(hospitals)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+
+    charts = 0
+    for i, (facility_id, name, busy) in enumerate(hospitals, 1):
+        if busy['matrix']:
+            # Day (x) by hour (y), 0-100% of the busiest hour, as on the hospital page
+            hours = [[busy['matrix'][day][hour] for day in range(7)] for hour in range(24)]
+            fig, ax = plt.subplots(figsize=(6, 8))
+            image = ax.imshow(hours, cmap='Blues', vmin=0, vmax=100, aspect='auto')
+            ax.set_xticks(range(7), busy['days'])
+            ax.set_yticks(range(24), time_labels)
+            ax.set_title(f"Popular Times for {name}")
+            fig.colorbar(image, ax=ax, label='% of busiest hour')
+            fig.text(0.01, 0.01, f"Based on {busy['events']} reviews and bed updates", fontsize=8)
+            fig.savefig(os.path.join(output_dir, chart_file_name(facility_id, name)))
+            plt.close(fig)  # Close the plot to save memory
+            charts += 1
+        if progress:
+            progress(i, len(hospitals))
+
+    # Zip the directory
+    zip_file_path = output_dir + '.zip'
+    shutil.make_archive(output_dir, 'zip', output_dir)
+    return {'charts': charts, 'hospitals': len(hospitals), 'archive': zip_file_path}
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+    from activity import busy_hours
+
+    db = MongoClient(MONGO_URI).oxyleap
+    half_life = timedelta(days=float(os.environ.get('ACTIVITY_HALF_LIFE_DAYS', 28)))
+    names = {str(h['facility_id']): h['name'] for h in db.hospitals.find({}, {'facility_id': 1, 'name': 1})}
+    hospitals = [(facility_id, names[facility_id], busy_hours(db, facility_id, half_life))
+                 for facility_id in sorted(db.activity.distinct('_id')) if facility_id in names]
+    result = generate_busy_hour_charts(hospitals)
+    print(f"Drew {result['charts']} busy hour charts into {result['archive']}")
@@ -0,0 +1,153 @@
+import json
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from pymongo import ReturnDocument, UpdateOne
+
+# Delta sync for the mobile app. A client sends the version it last synced to
+# and gets only the hospitals and bed statuses that changed since, with short
+# keys, as msgpack when available and compact JSON otherwise.
+#
+# Every write to hospitals or to the recorded bed statuses takes a new version
+# from meta/{_id: 'sync'} and stamps it on the documents it changes as `_v`.
+# Hospitals are never deleted, so there are no tombstones to send.
+#
+# A client must never be told it is at version n while a write with a version at
+# or below n is still landing, or it would skip that write for good. Writers
+# register in `writers` for the duration of the write. When none is in flight the
+# synced version is the counter itself; otherwise it is `settled`, the counter as
+# of the last moment nothing was in flight. Writers that crashed are ignored
+# after WRITER_EXPIRY seconds.
+
+SYNC_ID = 'sync'
+WRITER_EXPIRY = 600
+
+# Hospital fields sent to clients and their short keys
+HOSPITAL_KEYS = {
+    'facility_id': 'i', 'name': 'n', 'address': 'a', 'city': 'c', 'state': 's', 'zip_code': 'z',
+    'county': 'k', 'telephone': 'p', 'hospital_type': 't', 'hospital_ownership': 'o',
+    'emergency_services': 'e', 'bed_count': 'b', 'latitude': 'y', 'longitude': 'x',
+}
+STATUS_CODES = {'green': 'g', 'yellow': 'y', 'red': 'r', 'Unknown': 'u'}
+
+# Version for a write, held until the write is done
+@contextmanager
+def change_version(db):
+    token = uuid.uuid4().hex
+    meta = db.meta.find_one_and_update(
+        {'_id': SYNC_ID},
+        {'$inc': {'version': 1}, '$set': {f'writers.{token}': time.time()}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    try:
+        yield meta['version']
+    finally:
+        meta = db.meta.find_one_and_update(
+            {'_id': SYNC_ID}, {'$unset': {f'writers.{token}': ''}}, return_document=ReturnDocument.AFTER
+        )
+        if not live_writers(meta):
+            db.meta.update_one({'_id': SYNC_ID, 'version': meta['version']}, {'$max': {'settled': meta['version']}})
+
+# (the highest version every write up to which has landed, the latest version)
+def sync_versions(db):
+    meta = db.meta.find_one({'_id': SYNC_ID})
+    if meta is None:
+        return 0, 0
+    if live_writers(meta):
+        return meta.get('settled', 0), meta['version']
+    return meta['version'], meta['version']
+
+def live_writers(meta):
+    cutoff = time.time() - WRITER_EXPIRY
+    return [token for token, started in (meta.get('writers') or {}).items() if started > cutoff]
+
+def same(a, b):
+    return a == b or (is_nan(a) and is_nan(b))
+
+def is_nan(value):
+    return isinstance(value, float) and math.isnan(value)
+
+# Store the statuses in `statuses` ({facility_id: status}) that differ from the
+# recorded ones, under a new version. Returns the ones that changed, in the same form.
+def record_statuses(db, statuses):
+    if not statuses:
+        return {}
+    recorded = {document['_id']: document for document in db.bed_statuses.find({'_id': {'$in': list(statuses)}})}
+    changed = {
+        facility_id: status for facility_id, status in statuses.items()
+        if facility_id not in recorded
+        or not same(recorded[facility_id].get('status'), status.get('status'))
+        or not same(recorded[facility_id].get('inactive_beds'), status.get('inactive_beds'))
+    }
+    if changed:
+        with change_version(db) as version:
+            db.bed_statuses.bulk_write([
+                UpdateOne({'_id': facility_id}, {'$set': {
+                    'status': status.get('status'), 'inactive_beds': status.get('inactive_beds'), '_v': version,
+                }}, upsert=True)
+                for facility_id, status in changed.items()
+            ], ordered=False)
+    return changed
+
+def compact_hospital(document):
+    row = {}
+    for field, key in HOSPITAL_KEYS.items():
+        value = document.get(field)
+        if value is None or is_nan(value):
+            continue
+        if field == 'emergency_services':
+            value = 1 if value == 'Yes' else 0
+        elif field == 'bed_count':
+            value = int(value)
+        row[key] = value
+    return row
+
+def compact_status(facility_id, status):
+    inactive_beds = status.get('inactive_beds')
+    if is_nan(inactive_beds) or inactive_beds == 'N/A':
+        inactive_beds = None
+    elif isinstance(inactive_beds, float):
+        inactive_beds = int(inactive_beds)
+    return [facility_id, STATUS_CODES.get(status.get('status'), 'u'), inactive_beds]
+
+# Changes since version `since` as {v, full, h: [hospital], s: [[facility_id,
+# status code, inactive beds]]}. With since=0, or a version this database never
+# reached, the client gets everything and replaces what it has (full). Statuses
+# never recorded are filled in by current_statuses(facility_ids) then.
+def changes_since(db, since, current_statuses):
+    synced, latest = sync_versions(db)
+    full = since <= 0 or since > latest
+    version = synced if full else max(synced, since)
+    query = {} if full else {'_v': {'$gt': since}}
+    projection = {'_id': 0, **{field: 1 for field in HOSPITAL_KEYS}}
+    hospitals = [compact_hospital(document) for document in db.hospitals.find(query, projection)]
+
+    statuses = {}
+    for document in db.bed_statuses.find(query, {'status': 1, 'inactive_beds': 1}):
+        statuses[document['_id']] = document
+    if full:
+        unrecorded = [row['i'] for row in hospitals if row['i'] not in statuses]
+        if unrecorded:
+            statuses.update(current_statuses(unrecorded))
+    return {
+        'v': version,
+        'full': full,
+        'h': hospitals,
+        's': [compact_status(facility_id, status) for facility_id, status in statuses.items()],
+    }
+
+# (body, content type) for `payload`. msgpack and orjson are optional.
+def encode(payload, prefer_msgpack=False):
+    if prefer_msgpack:
+        try:
+            import msgpack
+        except ImportError:
+            pass
+        else:
+            return msgpack.packb(payload, use_bin_type=True), 'application/msgpack'
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(payload, separators=(',', ':')), 'application/json'
+    return orjson.dumps(payload), 'application/json'
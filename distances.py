@@ -0,0 +1,141 @@
+import json
+import numpy as np
+
+# Many-to-many distances and ETAs from a batch of origins (incident locations) to
+# hospitals, for the dispatch desk. Great-circle distances are computed with NumPy
+# broadcasting, a chunk of origins against every hospital at a time, sized so the
+# temporaries stay within a memory budget. ETAs assume roads ROAD_FACTOR times
+# longer than the straight line, driven at an average speed. Both are returned as
+# integers (metres and seconds), which encode to JSON much faster than floats.
+
+EARTH_RADIUS_KM = 6371.0088
+ROAD_FACTOR = 1.3
+# Bytes of float64 temporaries per (origin, hospital) pair in haversine_km
+PAIR_BYTES = 16
+
+class MatrixError(ValueError):
+    pass
+
+# Hospital coordinates in radians and facility ids, by position in the registry
+# snapshot, rebuilt when the snapshot is replaced. `located` lists the positions
+# of hospitals that have coordinates; the others are left out of every matrix.
+_coordinates = [None, None]  # (snapshot, arrays)
+
+def hospital_arrays(snapshot):
+    if _coordinates[0] is not snapshot:
+        lat = np.array([coordinate(record.latitude) for record in snapshot.records])
+        lon = np.array([coordinate(record.longitude) for record in snapshot.records])
+        located = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        lat, lon = np.radians(lat), np.radians(lon)
+        ids = np.array([str(record.facility_id) for record in snapshot.records], dtype=object)
+        _coordinates[:] = [snapshot, {'lat': lat, 'lon': lon, 'cos_lat': np.cos(lat), 'located': located, 'ids': ids}]
+    return _coordinates[1]
+
+def coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+# Origins from a request: {"lat", "lon"}, [lat, lon], {"zip"} or {"city", "state"},
+# the last two placed with the gazetteer. Returns an (m, 2) array in degrees.
+def parse_origins(items, gazetteer, max_origins):
+    if not isinstance(items, list) or not items:
+        raise MatrixError("Expected a non-empty list of origins.")
+    if len(items) > max_origins:
+        raise MatrixError(f"At most {max_origins} origins per request.")
+    origins = np.empty((len(items), 2))
+    for i, item in enumerate(items):
+        if isinstance(item, (list, tuple)) and len(item) == 2:
+            lat, lon = item
+        elif isinstance(item, dict) and 'lat' in item and 'lon' in item:
+            lat, lon = item['lat'], item['lon']
+        elif isinstance(item, dict) and (item.get('zip') or item.get('city')):
+            lat, lon = gazetteer.locate(item.get('zip'), item.get('city'), item.get('state'))
+            if lat is None:
+                raise MatrixError(f"Origin {i}: location not found.")
+        else:
+            raise MatrixError(f"Origin {i}: expected lat/lon, a ZIP code or a city and state.")
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise MatrixError(f"Origin {i}: lat and lon must be numbers.")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise MatrixError(f"Origin {i}: coordinates out of range.")
+        origins[i] = lat, lon
+    return origins
+
+# Great-circle distances in km from origins (m, 1) to hospitals (n,), all in
+# radians, written to `out` (m, n). Only one other (m, n) temporary is allocated.
+def haversine_km(origin_lat, origin_lon, cos_origin_lat, lat, lon, cos_lat, out):
+    a = np.subtract(lat, origin_lat, out=out)
+    a *= 0.5
+    np.sin(a, out=a)
+    np.square(a, out=a)
+    b = np.subtract(lon, origin_lon)
+    b *= 0.5
+    np.sin(b, out=b)
+    np.square(b, out=b)
+    b *= cos_lat
+    b *= cos_origin_lat
+    a += b
+    np.clip(a, 0.0, 1.0, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * EARTH_RADIUS_KM
+    return a
+
+# Distances from every origin to the hospitals at `indices` of the snapshot.
+# Returns (hospital indices, distances): with top_k, both are (m, k) and hold each
+# origin's k nearest hospitals, nearest first; otherwise indices is (n,) and
+# distances is the full (m, n) matrix.
+def distance_matrix(snapshot, origins, indices=None, top_k=None, memory_budget=32 * 1024 * 1024):
+    arrays = hospital_arrays(snapshot)
+    indices = arrays['located'] if indices is None else np.intersect1d(indices, arrays['located'])
+    lat, lon, cos_lat = arrays['lat'][indices], arrays['lon'][indices], arrays['cos_lat'][indices]
+    m, n = len(origins), len(indices)
+    k = min(top_k, n) if top_k else None
+
+    origin_lat = np.radians(origins[:, :1])
+    origin_lon = np.radians(origins[:, 1:])
+    cos_origin_lat = np.cos(origin_lat)
+    rows = max(1, memory_budget // max(1, n * PAIR_BYTES))
+
+    if k is None:
+        distances = np.empty((m, n))
+        for start in range(0, m, rows):
+            end = start + rows
+            haversine_km(origin_lat[start:end], origin_lon[start:end], cos_origin_lat[start:end],
+                         lat, lon, cos_lat, distances[start:end])
+        return indices, distances
+
+    nearest = np.empty((m, k), dtype=np.intp)
+    nearest_distances = np.empty((m, k))
+    buffer = np.empty((min(rows, m), n))
+    for start in range(0, m, rows):
+        end = min(start + rows, m)
+        chunk = haversine_km(origin_lat[start:end], origin_lon[start:end], cos_origin_lat[start:end],
+                             lat, lon, cos_lat, buffer[:end - start])
+        # Partition out the k nearest, then order just those k
+        candidates = np.argpartition(chunk, k - 1, axis=1)[:, :k] if k < n else np.broadcast_to(np.arange(n), chunk.shape)
+        candidate_distances = np.take_along_axis(chunk, candidates, axis=1)
+        order = np.argsort(candidate_distances, axis=1)
+        nearest[start:end] = indices[np.take_along_axis(candidates, order, axis=1)]
+        nearest_distances[start:end] = np.take_along_axis(candidate_distances, order, axis=1)
+    return nearest, nearest_distances
+
+def distances_m(distances):
+    return np.rint(distances * 1000).astype(np.int32)
+
+def eta_seconds(distances, speed_kmh):
+    return np.rint(distances * (ROAD_FACTOR * 3600.0 / speed_kmh)).astype(np.int32)
+
+# JSON for a response holding NumPy arrays. orjson, which is optional, encodes
+# them directly and several times faster than the standard library.
+def to_json(body):
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps({key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in body.items()},
+                          separators=(',', ':'))
+    return orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY)
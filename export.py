@@ -0,0 +1,247 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+# Bulk export of hospitals with their bed status and review aggregates, streamed
+# from a MongoDB cursor in fixed-size chunks so memory stays flat however many
+# rows are exported. Used by GET /api/export/hospitals and from the command line:
+#
+#   python export.py --format csv --state Alabama --output alabama.csv
+#   python export.py --format csv --output alabama.csv --resume   # continue a cut-off file
+#
+# Rows are ordered by facility_id. An interrupted export is resumed by passing the
+# last facility_id received as `after`; the continuation has no CSV header, so
+# it can be appended to what was already written.
+
+HOSPITAL_FIELDS = (
+    'facility_id', 'name', 'address', 'city', 'state', 'zip_code', 'county', 'telephone',
+    'hospital_type', 'hospital_ownership', 'emergency_services', 'bed_count', 'latitude', 'longitude',
+)
+COLUMNS = HOSPITAL_FIELDS + ('bed_status', 'inactive_beds', 'review_count', 'average_rating')
+FILTERS = ('state', 'city', 'county', 'hospital_type', 'emergency_services')
+DEFAULT_CHUNK_SIZE = 500
+
+class ExportError(ValueError):
+    pass
+
+# Mongo filter from request arguments or CLI options; only the FILTERS fields
+# are honoured and `after` continues past a facility_id
+def build_query(filters, after=None):
+    query = {field: filters[field] for field in FILTERS if filters.get(field)}
+    if after:
+        query['facility_id'] = {'$gt': after}
+    return query
+
+# Review count and average rating per hospital for one chunk of ids. Ratings come
+# from a form as strings, so they are parsed here rather than averaged in Mongo.
+def review_aggregates(db, facility_ids):
+    aggregates = {}
+    for review in db.reviews.find({'hospital_id': {'$in': facility_ids}}, {'_id': 0, 'hospital_id': 1, 'rating': 1}):
+        aggregate = aggregates.setdefault(review['hospital_id'], {'review_count': 0, 'ratings': []})
+        aggregate['review_count'] += 1
+        try:
+            aggregate['ratings'].append(float(review.get('rating')))
+        except (TypeError, ValueError):
+            pass
+    for aggregate in aggregates.values():
+        ratings = aggregate.pop('ratings')
+        aggregate['average_rating'] = sum(ratings) / len(ratings) if ratings else None
+    return aggregates
+
+# Yield lists of up to `chunk_size` export rows. `bed_statuses(ids)` returns
+# {facility_id: {'status', 'inactive_beds'}} for a chunk of ids.
+def export_chunks(db, query, bed_statuses, limit=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    projection = {'_id': 0, **{field: 1 for field in HOSPITAL_FIELDS}}
+    cursor = db.hospitals.find(query, projection).sort('facility_id', 1).batch_size(chunk_size)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    chunk = []
+    for hospital in cursor:
+        chunk.append(hospital)
+        if len(chunk) == chunk_size:
+            yield complete_rows(db, chunk, bed_statuses)
+            chunk = []
+    if chunk:
+        yield complete_rows(db, chunk, bed_statuses)
+
+def complete_rows(db, hospitals, bed_statuses):
+    facility_ids = [hospital['facility_id'] for hospital in hospitals]
+    statuses = bed_statuses(facility_ids)
+    reviews = review_aggregates(db, facility_ids)
+    rows = []
+    for hospital in hospitals:
+        status = statuses.get(hospital['facility_id'], {})
+        review = reviews.get(hospital['facility_id'], {})
+        row = {field: clean(hospital.get(field)) for field in HOSPITAL_FIELDS}
+        row['bed_status'] = status.get('status', 'Unknown')
+        row['inactive_beds'] = clean(status.get('inactive_beds'))
+        row['review_count'] = review.get('review_count', 0)
+        average = review.get('average_rating')
+        row['average_rating'] = None if average is None else round(average, 2)
+        rows.append(row)
+    return rows
+
+# NaN (missing values from the pandas import) and NumPy scalars as plain values
+def clean(value):
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+# Serializers: each turns a stream of row chunks into a stream of bytes
+def csv_stream(chunks, header=True):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    if header:
+        writer.writeheader()
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def ndjson_stream(chunks, header=True):
+    for rows in chunks:
+        yield ''.join(json.dumps(row, default=str, separators=(',', ':')) + '\n' for row in rows).encode()
+
+# Parquet needs pyarrow, which is optional; every chunk becomes one row group
+FLOAT_COLUMNS = ('bed_count', 'latitude', 'longitude', 'average_rating')
+INT_COLUMNS = ('review_count',)
+
+def parquet_stream(chunks, header=True):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (column, pa.float64() if column in FLOAT_COLUMNS else pa.int64() if column in INT_COLUMNS else pa.string())
+        for column in COLUMNS
+    ])
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for rows in chunks:
+            columns = {column: [parquet_value(column, row[column]) for row in rows] for column in COLUMNS}
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()  # The footer is written on close
+
+def parquet_value(column, value):
+    if value is None or column in INT_COLUMNS:
+        return value
+    if column in FLOAT_COLUMNS:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return str(value)
+
+# Write-only file object that hands back whatever was written since the last drain
+class ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+FORMATS = {
+    'csv': ('text/csv', csv_stream),
+    'ndjson': ('application/x-ndjson', ndjson_stream),
+    'parquet': ('application/vnd.apache.parquet', parquet_stream),
+}
+
+# (mimetype, serializer) for a format name, checking optional dependencies
+def get_format(name):
+    if name not in FORMATS:
+        raise ExportError(f"Unknown format {name!r}; expected one of {', '.join(FORMATS)}.")
+    if name == 'parquet' and not parquet_available():
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow).")
+    return FORMATS[name]
+
+# Prepare a cut-off CSV or NDJSON export for appending: drop a trailing partial
+# line and return the last facility_id written (None if no row was)
+def resume_point(path, fmt):
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        start = max(0, f.tell() - 64 * 1024)
+        f.seek(start)
+        tail = f.read()
+        complete = tail.rfind(b'\n') + 1
+        f.truncate(start + complete)
+    lines = [line for line in tail[:complete].splitlines() if line.strip()]
+    if not lines:
+        return None
+    last = lines[-1].decode()
+    if fmt == 'ndjson':
+        return json.loads(last)['facility_id']
+    row = next(csv.reader([last]))
+    return None if row == list(COLUMNS) else row[0]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export hospitals with bed status and ratings")
+    parser.add_argument('--format', default='csv', choices=list(FORMATS))
+    parser.add_argument('--output', help="File to write (default: standard output)")
+    parser.add_argument('--after', help="Only export facilities after this facility_id")
+    parser.add_argument('--resume', action='store_true', help="Append to --output after its last row")
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    for field in FILTERS:
+        parser.add_argument(f'--{field.replace("_", "-")}', dest=field)
+    args = parser.parse_args(argv)
+
+    try:
+        mimetype, serialize = get_format(args.format)
+    except ExportError as e:
+        parser.error(str(e))
+    after = args.after
+    if args.resume:
+        if not args.output or args.format == 'parquet':
+            parser.error("--resume needs --output and a CSV or NDJSON format")
+        if os.path.exists(args.output):
+            after = resume_point(args.output, args.format)
+
+    from app import Config, create_app, export_hospitals
+
+    class ExportConfig(Config):
+        CHANGE_STREAMS = False
+
+    app = create_app(ExportConfig)
+    with app.app_context():
+        stream = export_hospitals(serialize, build_query(vars(args), after), after is None, args.limit, args.chunk_size)
+        out = open(args.output, 'ab' if after and args.resume else 'wb') if args.output else sys.stdout.buffer
+        try:
+            for data in stream:
+                out.write(data)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import csv
+from array import array
+
+# Offline US gazetteer built from data/us_zip_centroids.csv (see build_gazetteer.py).
+# Coordinates live in flat float arrays and every 5-digit ZIP code indexes a dense
+# array of row numbers, so lookups by ZIP, by (city, state) and by state are O(1)
+# and never touch the network. The table loads in a fraction of a second and takes
+# a few MB of memory.
+
+STATE_CODES = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'district of columbia': 'DC',
+    'florida': 'FL', 'georgia': 'GA', 'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL',
+    'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS', 'kentucky': 'KY', 'louisiana': 'LA',
+    'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA', 'michigan': 'MI', 'minnesota': 'MN',
+    'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT', 'nebraska': 'NE', 'nevada': 'NV',
+    'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM', 'new york': 'NY',
+    'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK', 'oregon': 'OR',
+    'pennsylvania': 'PA', 'rhode island': 'RI', 'south carolina': 'SC', 'south dakota': 'SD',
+    'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT', 'virginia': 'VA',
+    'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY',
+    'american samoa': 'AS', 'guam': 'GU', 'northern mariana islands': 'MP', 'puerto rico': 'PR',
+    'virgin islands': 'VI', 'u.s. virgin islands': 'VI',
+}
+
+NO_ROW = -1
+
+# Two-letter code for a state given by name or code ("Alabama", "al" -> "AL")
+def state_code(state):
+    if state is None:
+        return None
+    state = str(state).strip()
+    if len(state) == 2:
+        return state.upper()
+    return STATE_CODES.get(state.lower())
+
+# ZIP code as an int, accepting ints and the forms pandas and users produce:
+# 6105 (leading zero lost), "06105", "06105-1234", "6105.0"
+def zip_number(zip_code):
+    if zip_code is None:
+        return None
+    text = str(zip_code).strip().split('-')[0]
+    if text.endswith('.0'):
+        text = text[:-2]
+    if not text.isdigit() or len(text) > 5:
+        return None
+    return int(text)
+
+class Gazetteer:
+    __slots__ = ('zip_rows', 'zip_lat', 'zip_lon', 'city_rows', 'city_lat', 'city_lon', 'states')
+
+    def __init__(self, csv_path):
+        self.zip_rows = array('i', [NO_ROW]) * 100000
+        self.zip_lat = array('d')
+        self.zip_lon = array('d')
+        sums = {}  # (city, state) -> [lat total, lon total, count]
+        state_sums = {}
+
+        with open(csv_path, newline='') as f:
+            for row in csv.DictReader(f):
+                lat, lon = float(row['latitude']), float(row['longitude'])
+                self.zip_rows[int(row['zip_code'])] = len(self.zip_lat)
+                self.zip_lat.append(lat)
+                self.zip_lon.append(lon)
+                for key, totals in (((row['city'].lower(), row['state']), sums), (row['state'], state_sums)):
+                    total = totals.setdefault(key, [0.0, 0.0, 0])
+                    total[0] += lat
+                    total[1] += lon
+                    total[2] += 1
+
+        # A city's centroid is the mean of its ZIP code centroids
+        self.city_rows = {}
+        self.city_lat = array('d')
+        self.city_lon = array('d')
+        for key, (lat, lon, count) in sums.items():
+            self.city_rows[key] = len(self.city_lat)
+            self.city_lat.append(lat / count)
+            self.city_lon.append(lon / count)
+        self.states = {state: (lat / count, lon / count) for state, (lat, lon, count) in state_sums.items()}
+
+    def __len__(self):
+        return len(self.zip_lat)
+
+    def by_zip(self, zip_code):
+        number = zip_number(zip_code)
+        if number is None:
+            return None
+        row = self.zip_rows[number]
+        if row == NO_ROW:
+            return None
+        return self.zip_lat[row], self.zip_lon[row]
+
+    def by_city(self, city, state):
+        if not city:
+            return None
+        row = self.city_rows.get((str(city).strip().lower(), state_code(state)))
+        if row is None:
+            return None
+        return self.city_lat[row], self.city_lon[row]
+
+    def by_state(self, state):
+        return self.states.get(state_code(state))
+
+    # Most precise centroid available: ZIP code, then city, then state.
+    # Returns (None, None) when nothing matches.
+    def locate(self, zip_code=None, city=None, state=None):
+        location = self.by_zip(zip_code) or self.by_city(city, state) or self.by_state(state)
+        return location or (None, None)
@@ -0,0 +1,39 @@
+# Patch as early as possible: gunicorn loads this file before the preloaded app,
+# so pymongo, redis and geopy all see cooperative sockets and locks
+from gevent import monkey
+monkey.patch_all()
+
+import gc
+import multiprocessing
+import os
+
+# Multi-process deployment: one gevent worker per core, sharing the preloaded app.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+
+bind = os.environ.get('OXYLEAP_BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# gevent worker that also upgrades Socket.IO websocket connections. Clients use the
+# websocket transport only, so no sticky sessions are needed between workers.
+worker_class = 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Every worker already has its own core, so one hashing thread each is enough
+os.environ.setdefault('PASSWORD_HASH_POOL_SIZE', '1')
+
+# Runs in the master after the app is preloaded and before any worker is forked.
+# Freezing moves everything allocated so far out of the garbage collector's reach,
+# so collections in the workers do not write to (and copy) the shared pages.
+def when_ready(server):
+    gc.collect()
+    gc.freeze()
+
+# Runs in each worker right after the fork
+def post_fork(server, worker):
+    from app import connect_datastores
+    from wsgi import app
+    connect_datastores(app)
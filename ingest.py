@@ -0,0 +1,107 @@
+import hmac
+import json
+import math
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from activity import naive_local
+
+# Fields accepted in a bed update and the bed_stats column each one is stored under,
+# matching the columns of the CSV files loaded by preprocess_bed_stats.py
+FIELDS = {
+    'active_beds': 'Active Beds',
+    'inactive_beds': 'Inactive Beds',
+}
+
+# Timestamps accepted, relative to the server's clock: a year of backfill (the
+# most BED_STATS_WINDOW keeps by default) and a little clock skew ahead
+MAX_AGE = timedelta(days=366)
+MAX_AHEAD = timedelta(hours=1)
+
+class IngestError(ValueError):
+    pass
+
+# Check an API key against the configured ones without leaking timing information
+def is_valid_api_key(key, api_keys):
+    if not key:
+        return False
+    return any(hmac.compare_digest(key, valid) for valid in api_keys)
+
+# Decode a request body holding either a JSON array, {"updates": [...]} or NDJSON
+def parse_updates(body, content_type):
+    content_type = (content_type or '').lower()
+    try:
+        if 'ndjson' in content_type or 'jsonlines' in content_type:
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+        payload = json.loads(body)
+    except ValueError as e:
+        raise IngestError(f"Malformed JSON: {e}")
+    if isinstance(payload, dict):
+        payload = payload.get('updates')
+    if not isinstance(payload, list):
+        raise IngestError("Expected a list of updates.")
+    return payload
+
+# Validate updates and group them per facility, keeping their order. Timestamps
+# are stored as naive local time, like the ones the server stamps itself.
+def group_updates(updates, now=None):
+    now = now or datetime.now()
+    grouped = {}
+    for i, update in enumerate(updates):
+        if not isinstance(update, dict) or not update.get('facility_id'):
+            raise IngestError(f"Update {i} has no facility_id.")
+        row = {}
+        for field, column in FIELDS.items():
+            value = update.get(field)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise IngestError(f"Update {i}: {field} must be a number.")
+            if not math.isfinite(value) or value < 0:
+                raise IngestError(f"Update {i}: {field} must be a finite number of beds.")
+            row[column] = value
+        if 'Active Beds' not in row:
+            raise IngestError(f"Update {i} has no active_beds.")
+        timestamp = update.get('timestamp')
+        if timestamp:
+            try:
+                row['Date'] = naive_local(datetime.fromisoformat(str(timestamp)))
+            except ValueError:
+                raise IngestError(f"Update {i}: timestamp must be ISO 8601.")
+            except OverflowError:  # Out of datetime's range once converted
+                row['Date'] = datetime.min
+            if not now - MAX_AGE <= row['Date'] <= now + MAX_AHEAD:
+                raise IngestError(f"Update {i}: timestamp is more than {MAX_AGE.days} days old or in the future.")
+        else:
+            row['Date'] = now
+        grouped.setdefault(str(update['facility_id']), []).append(row)
+    return grouped
+
+# Merge each facility's rows into its series in date order, keeping only the
+# latest `window` entries, so a backfilled row never stands in for the current one
+# (compute_bed_status reads the last row). The whole batch goes to MongoDB as a
+# single unordered bulk_write, or for one facility a find_one_and_update that
+# returns its window with the write. Returns {facility_id: window}.
+def write_updates(db, grouped, window):
+    if not grouped:
+        return {}
+    pushes = {
+        facility_id: {'$push': {'data': {'$each': rows, '$sort': {'Date': 1}, '$slice': -window}}}
+        for facility_id, rows in grouped.items()
+    }
+    if len(pushes) == 1:
+        (facility_id, push), = pushes.items()
+        doc = db.bed_stats.find_one_and_update(
+            {'facility_id': facility_id}, push, projection={'_id': 0, 'data': 1},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return {facility_id: doc['data']}
+    db.bed_stats.bulk_write([
+        UpdateOne({'facility_id': facility_id}, push, upsert=True) for facility_id, push in pushes.items()
+    ], ordered=False)
+
+    # Read back only the bounded windows of the facilities this batch touched
+    cursor = db.bed_stats.find(
+        {'facility_id': {'$in': list(grouped)}},
+        {'_id': 0, 'facility_id': 1, 'data': 1}
+    )
+    return {doc['facility_id']: doc['data'] for doc in cursor}
@@ -0,0 +1,233 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, g, has_request_context, request, before_render_template, template_rendered
+from pymongo import monitoring
+
+# Histogram buckets in seconds, from a cache hit to a full /health_centers render
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus histogram kept in process memory, one series per label set
+class Histogram:
+    def __init__(self, name, description, labelnames):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(BUCKETS) + [0, 0.0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            prefix = label_text + ',' if label_text else ''
+            for bound, count in zip(BUCKETS, values):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-2]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {values[-2]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-1]}')
+        return lines
+
+class Counter:
+    def __init__(self, name, description, labelnames):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for labels, value in sorted(series.items()):
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REQUEST_DURATION = Histogram('oxyleap_request_duration_seconds', "Time spent serving a request.", ('endpoint', 'method', 'status'))
+MONGO_DURATION = Histogram('oxyleap_mongo_command_duration_seconds', "Time spent in MongoDB commands.", ('command',))
+MONGO_FAILURES = Counter('oxyleap_mongo_command_failures_total', "MongoDB commands that failed.", ('command',))
+CACHE_REQUESTS = Counter('oxyleap_cache_requests_total', "Lookups of memoized functions.", ('function', 'result'))
+TEMPLATE_DURATION = Histogram('oxyleap_template_render_duration_seconds', "Time spent rendering templates.", ('template',))
+SECTION_DURATION = Histogram('oxyleap_section_duration_seconds', "Time spent in instrumented code sections.", ('section',))
+COALESCED_REQUESTS = Counter('oxyleap_coalesced_requests_total', "Coalesced page requests, by whether they computed the page or shared it.", ('endpoint', 'result'))
+RATE_LIMITED = Counter('oxyleap_rate_limited_requests_total', "Requests rejected by the rate limiter.", ('endpoint',))
+CIRCUIT_BREAKER_TRIPS = Counter('oxyleap_circuit_breaker_trips_total', "Times a dependency's circuit breaker opened.", ('dependency',))
+STALE_RESPONSES = Counter('oxyleap_stale_responses_total', "Pages served from the last good data while a dependency was failing.", ('endpoint',))
+METRICS = (
+    REQUEST_DURATION, MONGO_DURATION, MONGO_FAILURES, CACHE_REQUESTS, TEMPLATE_DURATION, SECTION_DURATION,
+    COALESCED_REQUESTS, RATE_LIMITED, CIRCUIT_BREAKER_TRIPS, STALE_RESPONSES,
+)
+
+# Timings collected for the current request: name -> [total seconds, count]
+def _request_timings():
+    if not has_request_context():
+        return None
+    if '_timings' not in g:
+        g._timings = {}
+    return g._timings
+
+def _add_timing(name, seconds):
+    timings = _request_timings()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+# Listener handed to MongoClient; pymongo calls it on the thread (or greenlet)
+# that issued the command, so it can attribute time to the current request
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_DURATION.observe(seconds, event.command_name)
+        _add_timing('mongo', seconds)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_DURATION.observe(seconds, event.command_name)
+        MONGO_FAILURES.inc(event.command_name)
+        _add_timing('mongo', seconds)
+
+mongo_listener = MongoCommandListener()
+
+# Time a block of code, e.g. `with timer('folium'):`
+@contextmanager
+def timer(section):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        SECTION_DURATION.observe(seconds, section)
+        _add_timing(section, seconds)
+
+def timed(section):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with timer(section):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# Flag set by the wrapped function when a memoized call had to compute its value
+_misses = threading.local()
+
+# cache.memoize that also counts hits and misses and the time spent talking to
+# the cache backend. The returned function keeps the attributes of the memoized
+# one, so cache.delete_memoized() accepts it as before. `timeout` may be a
+# function, called on each lookup, for a TTL that depends on the running app.
+def memoize(cache, timeout=None):
+    def decorator(f):
+        name = f.__name__
+
+        @wraps(f)
+        def compute(*args, **kwargs):
+            _misses.stack[-1] = True
+            started = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                _misses.computed[-1] += time.perf_counter() - started
+
+        memoized = cache.memoize(timeout=None if callable(timeout) else timeout)(compute)
+
+        @wraps(memoized)
+        def decorated_function(*args, **kwargs):
+            if callable(timeout):
+                memoized.cache_timeout = timeout()
+            if not hasattr(_misses, 'stack'):
+                _misses.stack, _misses.computed = [], []
+            _misses.stack.append(False)
+            _misses.computed.append(0.0)
+            started = time.perf_counter()
+            try:
+                return memoized(*args, **kwargs)
+            finally:
+                missed = _misses.stack.pop()
+                cache_seconds = time.perf_counter() - started - _misses.computed.pop()
+                CACHE_REQUESTS.inc(name, 'miss' if missed else 'hit')
+                _add_timing('cache', cache_seconds)
+                _add_timing('cache_miss' if missed else 'cache_hit', 0.0)
+        return decorated_function
+    return decorator
+
+def _server_timing(timings, total):
+    entries = []
+    for name, (seconds, count) in timings.items():
+        if name in ('cache_hit', 'cache_miss'):
+            continue
+        entries.append(f'{name};dur={seconds * 1000:.2f};desc="{count}x"')
+    hits = timings.get('cache_hit', (0, 0))[1]
+    misses = timings.get('cache_miss', (0, 0))[1]
+    if hits or misses:
+        entries.append(f'cache-lookups;desc="{hits} hit {misses} miss"')
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+def metrics_text():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+# Hook request timing, template timing, the Server-Timing header and /metrics into the app
+def init_instrumentation(app):
+    # A request inside an app context pushed by the caller shares its `g`
+    @app.before_request
+    def start_request_timer():
+        g.pop('_timings', None)
+        g.pop('_template_started', None)
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        REQUEST_DURATION.observe(total, request.endpoint or 'unknown', request.method, response.status_code)
+        response.headers['Server-Timing'] = _server_timing(_request_timings() or {}, total)
+        return response
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault('_template_started', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        stack = g.get('_template_started')
+        if stack:
+            seconds = time.perf_counter() - stack.pop()
+            TEMPLATE_DURATION.observe(seconds, template.name or 'string')
+            _add_timing('template', seconds)
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    def metrics():
+        return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,34 @@
+import os
+import socket
+import redis
+
+# A Redis key held by one owner at a time for a limited number of seconds. The
+# holder renews it by calling acquire() again before it expires. Used to elect
+# the change stream watcher and to keep maintenance jobs from overlapping.
+
+class Lease:
+    # Extend or drop the lease only if this owner still holds it
+    RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+    RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, client, key, seconds, owner=None):
+        self.client = client
+        self.key = key
+        self.seconds = seconds
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+
+    # True if this owner now holds the lease. An unreachable Redis counts as
+    # someone else holding it.
+    def acquire(self):
+        try:
+            if self.client.set(self.key, self.owner, nx=True, ex=self.seconds):
+                return True
+            return bool(self.client.eval(self.RENEW, 1, self.key, self.owner, self.seconds))
+        except redis.RedisError:
+            return False
+
+    def release(self):
+        try:
+            self.client.eval(self.RELEASE, 1, self.key, self.owner)
+        except redis.RedisError:
+            pass
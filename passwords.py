@@ -0,0 +1,93 @@
+import base64
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from werkzeug.security import check_password_hash
+
+# Password hashing is deliberately CPU-expensive. Run it on a small pool of native
+# threads so a login only blocks its own greenlet (or request thread) instead of
+# the whole gevent server; bcrypt releases the GIL while it works.
+_settings = {'rounds': 12, 'pool_size': 4}
+_pools = {}
+_pools_lock = threading.Lock()
+
+def init_passwords(app):
+    configure(app.config['BCRYPT_LOG_ROUNDS'], app.config['PASSWORD_HASH_POOL_SIZE'])
+
+# Change the bcrypt cost or the pool size; a pool size of 0 hashes inline
+def configure(rounds, pool_size):
+    with _pools_lock:
+        _settings['rounds'] = rounds
+        _settings['pool_size'] = pool_size
+        for pool in _pools.values():
+            if hasattr(pool, 'kill'):
+                pool.kill()
+            else:
+                pool.shutdown(wait=False)
+        _pools.clear()
+
+def _in_greenlet():
+    try:
+        import gevent
+    except ImportError:
+        return False
+    return isinstance(gevent.getcurrent(), gevent.Greenlet)
+
+# Pools are created on first use and per process, since threads do not survive a fork
+def _pool(kind):
+    key = (kind, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                if kind == 'gevent':
+                    from gevent.threadpool import ThreadPool
+                    pool = ThreadPool(_settings['pool_size'])
+                else:
+                    pool = ThreadPoolExecutor(_settings['pool_size'], thread_name_prefix='password-hash')
+                _pools[key] = pool
+    return pool
+
+def _offload(fn, *args):
+    if _settings['pool_size'] <= 0:
+        return fn(*args)
+    if _in_greenlet():
+        return _pool('gevent').apply(fn, args)
+    return _pool('threads').submit(fn, *args).result()
+
+# bcrypt only reads the first 72 bytes of a password, so it is given the
+# base64 SHA-256 digest of the password instead (44 bytes, no NUL bytes). Hashes
+# made this way carry PREHASHED in front of the bcrypt hash.
+PREHASHED = 'bcrypt-sha256$'
+BCRYPT_PREFIXES = ('$2a$', '$2b$', '$2y$')
+
+def _prehash(password):
+    return base64.b64encode(hashlib.sha256(password.encode('utf-8')).digest())
+
+def _bcrypt_hash(password, rounds):
+    return PREHASHED + bcrypt.hashpw(_prehash(password), bcrypt.gensalt(rounds)).decode('ascii')
+
+def _bcrypt_check(password, password_hash):
+    if password_hash.startswith(PREHASHED):
+        return bcrypt.checkpw(_prehash(password), password_hash[len(PREHASHED):].encode('ascii'))
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('ascii'))
+
+def hash_password(password):
+    return _offload(_bcrypt_hash, password, _settings['rounds'])
+
+# Check a password against a stored hash. Returns (valid, needs_rehash), where
+# needs_rehash is set for werkzeug hashes from before the switch to bcrypt, for
+# bcrypt hashes of the raw password, and for bcrypt hashes made with a different
+# cost than the configured one.
+def verify_password(password_hash, password):
+    if password_hash.startswith(PREHASHED):
+        valid = _offload(_bcrypt_check, password, password_hash)
+        return valid, valid and int(password_hash[len(PREHASHED):].split('$')[2]) != _settings['rounds']
+    if password_hash.startswith(BCRYPT_PREFIXES):
+        valid = _offload(_bcrypt_check, password, password_hash)
+        return valid, valid
+    valid = _offload(check_password_hash, password_hash, password)
+    return valid, valid
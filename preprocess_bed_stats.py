@@ -5,56 +5,71 @@ from multiprocessing import Pool, cpu_count
 
 # MongoDB Configuration
 MONGO_URI = "mongodb://localhost:27017/oxyleap"
-client = MongoClient(MONGO_URI)
-db = client.oxyleap
+BED_STATS_DIR = 'data/bed_stats'
 
 # Function to process a single CSV file
-def process_file(filename):
-    facility_id = os.path.splitext(filename)[0]
-    
-    # Check if the facility_id already exists in MongoDB
-    if db.bed_stats.find_one({'facility_id': facility_id}):
-        print(f"Data for {facility_id} already exists in MongoDB. Skipping.")
-        return None
-    
-    csv_path = os.path.join('data/bed_stats', filename)
-    
+def process_file(csv_path):
+    facility_id = os.path.splitext(os.path.basename(csv_path))[0]
+
     try:
         df = pd.read_csv(csv_path, sep=',')
-        
+        # Dates as datetimes, like ingested rows, so series sort by them
+        df['Date'] = pd.to_datetime(df['Date'])
+
         # Convert DataFrame to a list of dictionaries for MongoDB
         data = df.to_dict('records')
-        
+
         # Prepare the document to insert
         document = {
             'facility_id': facility_id,
             'data': data
         }
-        
+
         return document
     except Exception as e:
-        print(f"Error processing {filename}: {e}")
+        print(f"Error processing {csv_path}: {e}")
         return None
 
-# Preprocess bed statistics and load into MongoDB
-def preprocess_bed_stats():
-    bed_stats_dir = 'data/bed_stats'
-    files = [f for f in os.listdir(bed_stats_dir) if f.endswith('.csv')]
-    
-    # Use multiprocessing to process files in parallel
-    with Pool(cpu_count()) as pool:
-        documents = pool.map(process_file, files)
-    
-    # Filter out any None results (from skipped or failed processing)
-    documents = [doc for doc in documents if doc is not None]
-    
-    if documents:
-        # Batch insert documents into MongoDB
-        db.bed_stats.insert_many(documents, ordered=False)
-        print(f"Inserted {len(documents)} new documents into MongoDB.")
+# Preprocess bed statistics and load into MongoDB. `workers` processes parse the
+# files (1 parses them in this process, as a Celery worker must); `progress` is
+# called as progress(done, total) while the files are loaded, and `on_insert`
+# with each batch of documents once it is inserted.
+def preprocess_bed_stats(db, bed_stats_dir=BED_STATS_DIR, workers=None, progress=None, batch_size=200, on_insert=None):
+    files = sorted(f for f in os.listdir(bed_stats_dir) if f.endswith('.csv'))
+
+    # Skip facilities whose data already exists in MongoDB
+    existing = set(db.bed_stats.distinct('facility_id'))
+    new_files = [os.path.join(bed_stats_dir, f) for f in files if os.path.splitext(f)[0] not in existing]
+    print(f"{len(files) - len(new_files)} facilities already exist in MongoDB. Skipping.")
+
+    inserted = 0
+    pool = Pool(workers or cpu_count()) if workers != 1 else None
+    try:
+        # Parse and insert in batches so memory stays bounded and progress can be reported
+        for start in range(0, len(new_files), batch_size):
+            batch = new_files[start:start + batch_size]
+            documents = pool.map(process_file, batch) if pool else [process_file(path) for path in batch]
+
+            # Filter out any None results (from failed processing)
+            documents = [doc for doc in documents if doc is not None]
+            if documents:
+                db.bed_stats.insert_many(documents, ordered=False)
+                inserted += len(documents)
+                if on_insert:
+                    on_insert(documents)
+            if progress:
+                progress(start + len(batch), len(new_files))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if inserted:
+        print(f"Inserted {inserted} new documents into MongoDB.")
     else:
         print("No new documents to insert. All data already exists in MongoDB.")
+    return {'inserted': inserted, 'skipped': len(files) - len(new_files)}
 
 if __name__ == '__main__':
-    preprocess_bed_stats()
-
+    client = MongoClient(MONGO_URI)
+    preprocess_bed_stats(client.oxyleap)
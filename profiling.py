@@ -0,0 +1,229 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from flask import current_app, g, request
+from ingest import is_valid_api_key
+
+# Per-request profiling for production. An admin sends X-Profile: 1 (or
+# ?_profile=1) with a key from ADMIN_API_KEYS, and that one request runs under a
+# sampling profiler and tracemalloc. PROFILE_SAMPLE_RATE also profiles that
+# fraction of all requests, with the sampler only, to catch slow requests no one
+# asked about.
+#
+# The sampler is a real OS thread that records the request's stack every
+# PROFILE_INTERVAL seconds, including while it waits on MongoDB, Redis or
+# Nominatim, so the profile shows wall-clock time. Under gevent it samples the
+# request's greenlet wherever it is parked. Profiles are written to PROFILE_DIR
+# in speedscope's format (open them at https://www.speedscope.app), next to a
+# summary of the memory each line allocated during the request. tracemalloc
+# traces every thread, so concurrent requests show up in that summary too.
+#
+# Only the view is profiled: a streamed response body is produced after the
+# profile is saved.
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ARG = '_profile'
+TRACEMALLOC_FRAMES = 25
+TRACEMALLOC_TOP = 30
+
+# The sampler's own allocations are left out of the summary
+OWN_ALLOCATIONS = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+
+# Requests currently tracing allocations; the first starts tracemalloc, the last stops it
+_tracing = {'count': 0, 'started': False, 'lock': threading.Lock()}
+
+# Thread start and sleep that stay real OS primitives when gevent has patched them,
+# so the sampler keeps running while the request's greenlet is busy
+def _originals():
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            return monkey.get_original('_thread', 'start_new_thread'), monkey.get_original('time', 'sleep'), \
+                monkey.get_original('_thread', 'get_ident')
+    import _thread
+    return _thread.start_new_thread, time.sleep, _thread.get_ident
+
+def _current_greenlet():
+    if 'gevent' in sys.modules:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from greenlet import getcurrent
+            return getcurrent()
+    return None
+
+class Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.start_thread, self.sleep, get_ident = _originals()
+        self.thread_id = get_ident()
+        self.greenlet = _current_greenlet()
+        self.frames = {}  # (file, function, line) -> index
+        self.samples = []  # Stacks of frame indices, outermost first
+        self.weights = []  # Seconds each sample stands for
+        self.running = False
+        self.started = self.stopped = None
+
+    def start(self):
+        self.running = True
+        self.started = time.perf_counter()
+        self.start_thread(self.run, ())
+        return self
+
+    def stop(self):
+        self.running = False
+        self.stopped = time.perf_counter()
+        return self
+
+    def run(self):
+        last = time.perf_counter()
+        while self.running:
+            self.sleep(self.interval)
+            now = time.perf_counter()
+            frame = self.current_frame()
+            if frame is not None and self.running:
+                self.samples.append(self.stack(frame))
+                self.weights.append(now - last)
+            last = now
+
+    # The request's innermost frame: a parked greenlet keeps its own, the running
+    # one (or a plain thread) is whatever its OS thread is executing
+    def current_frame(self):
+        if self.greenlet is not None and self.greenlet.gr_frame is not None:
+            return self.greenlet.gr_frame
+        return sys._current_frames().get(self.thread_id)
+
+    def stack(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_name, code.co_firstlineno)
+            index = self.frames.get(key)
+            if index is None:
+                index = self.frames[key] = len(self.frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    # https://www.speedscope.app/file-format-schema.json, one sampled profile
+    def speedscope(self, name):
+        frames = [{'name': function, 'file': filename, 'line': line} for filename, function, line in self.frames]
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'oxyleap',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': (self.stopped or time.perf_counter()) - self.started,
+                'samples': self.samples,
+                'weights': self.weights,
+            }],
+        }
+
+# `api_key` returns the API key sent with the current request
+def init_profiling(app, api_key):
+    @app.before_request
+    def start_profile():
+        config = current_app.config
+        requested = (request.headers.get(PROFILE_HEADER) == '1' or request.args.get(PROFILE_ARG) == '1') \
+            and is_valid_api_key(api_key(), config['ADMIN_API_KEYS'])
+        if requested or (config['PROFILE_SAMPLE_RATE'] and random.random() < config['PROFILE_SAMPLE_RATE']):
+            g._profile = begin_profile(config, requested)
+
+    @app.after_request
+    def save_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            response.headers['X-Profile-Id'] = end_profile(profile, current_app.config, response.status_code)
+        return response
+
+    # Requests that never reached after_request
+    @app.teardown_request
+    def stop_profile(exc):
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            profile['sampler'].stop()
+            if 'before' in profile:
+                stop_tracing()
+
+def begin_profile(config, requested):
+    profile = {'id': uuid.uuid4().hex[:12]}
+    if requested:
+        start_tracing()
+        profile['before'] = tracemalloc.take_snapshot()
+    profile['sampler'] = Sampler(config['PROFILE_INTERVAL']).start()
+    return profile
+
+# Save the profile and return its name
+def end_profile(profile, config, status_code):
+    sampler = profile['sampler'].stop()
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{request.endpoint or 'unknown'}-{profile['id']}"
+    title = f"{request.method} {request.full_path.rstrip('?')} ({status_code})"
+    os.makedirs(config['PROFILE_DIR'], exist_ok=True)
+    with open(os.path.join(config['PROFILE_DIR'], f'{name}.speedscope.json'), 'w') as f:
+        json.dump(sampler.speedscope(title), f, separators=(',', ':'))
+    if 'before' in profile:
+        after = tracemalloc.take_snapshot().filter_traces(OWN_ALLOCATIONS)
+        current, peak = tracemalloc.get_traced_memory()
+        stop_tracing()
+        before = profile['before'].filter_traces(OWN_ALLOCATIONS)
+        with open(os.path.join(config['PROFILE_DIR'], f'{name}.tracemalloc.txt'), 'w') as f:
+            f.write(allocation_summary(title, after.compare_to(before, 'lineno'), current, peak))
+    prune_profiles(config['PROFILE_DIR'], config['PROFILE_MAX_FILES'])
+    return name
+
+def start_tracing():
+    with _tracing['lock']:
+        if _tracing['count'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracing['started'] = True
+        _tracing['count'] += 1
+
+# Leaves tracemalloc running if something else started it
+def stop_tracing():
+    with _tracing['lock']:
+        _tracing['count'] -= 1
+        if _tracing['count'] == 0 and _tracing['started']:
+            tracemalloc.stop()
+            _tracing['started'] = False
+
+def allocation_summary(title, stats, current, peak):
+    lines = [
+        title,
+        f"Traced memory: {current / 1024:.1f} KiB now, {peak / 1024:.1f} KiB peak",
+        f"Top {TRACEMALLOC_TOP} lines by memory allocated during the request and still held at its end:",
+        '',
+    ]
+    stats = [stat for stat in stats if stat.size_diff > 0]
+    stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+    lines.extend(str(stat) for stat in stats[:TRACEMALLOC_TOP])
+    return '\n'.join(lines) + '\n'
+
+# Keep the newest `max_files` files
+def prune_profiles(directory, max_files):
+    files = sorted((entry for entry in os.scandir(directory) if entry.is_file()), key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:max(0, len(files) - max_files)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+# Saved profiles, newest first
+def list_profiles(directory):
+    if not os.path.isdir(directory):
+        return []
+    entries = sorted(os.scandir(directory), key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [{'file': entry.name, 'bytes': entry.stat().st_size,
+             'saved_at': datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec='seconds')}
+            for entry in entries if entry.is_file()]
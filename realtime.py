@@ -0,0 +1,84 @@
+from flask import session
+from flask_socketio import ConnectionRefusedError, SocketIO, join_room, leave_room
+
+# Socket.IO server that pushes bed status changes to open hospital list pages.
+# With a message queue configured, every worker relays events published by any
+# other worker through Redis pub/sub; without one everything stays in-process.
+socketio = SocketIO()
+
+def init_realtime(app):
+    message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if app.testing:
+        message_queue = None  # In-process stand-in for tests, no Redis needed
+    socketio.init_app(
+        app,
+        message_queue=message_queue,
+        # Idle clients only cost a heartbeat every ping interval
+        ping_interval=app.config.get('SOCKETIO_PING_INTERVAL', 25),
+        ping_timeout=app.config.get('SOCKETIO_PING_TIMEOUT', 60),
+        cors_allowed_origins=app.config.get('SOCKETIO_CORS_ALLOWED_ORIGINS'),
+    )
+
+# Rooms a facility's updates are delivered to
+def _rooms_for(hospital):
+    rooms = ['all']
+    if hospital.get('hospital_type'):
+        rooms.append(f"type:{hospital['hospital_type']}")
+    if hospital.get('state'):
+        rooms.append(f"state:{hospital['state']}")
+    return rooms
+
+# Convert numpy scalars coming out of pandas into plain JSON values
+def _plain(value):
+    return value.item() if hasattr(value, 'item') else value
+
+# Push the bed status of several facilities. Callers pass only the ones that
+# changed, as found against the shared bed_statuses collection (see
+# delta_sync.record_statuses), so every worker agrees on what is new.
+# `updates` is an iterable of (hospital, prediction) pairs where hospital carries at
+# least facility_id, hospital_type and state, and prediction is the dictionary
+# returned by predict_bed_availability.
+def publish_bed_statuses(updates):
+    batches = {}
+    for hospital, prediction in updates:
+        facility_id = str(hospital['facility_id'])
+        delta = (prediction.get('status', 'Unknown'), _plain(prediction.get('inactive_beds', 'N/A')))
+        rooms = tuple(_rooms_for(hospital))
+        batches.setdefault(rooms, []).append([facility_id, delta[0], delta[1]])
+
+    # One message per group of rooms; a client subscribed to several of them
+    # still receives each delta once
+    for rooms, rows in batches.items():
+        socketio.emit('bed_status', {'d': rows}, to=list(rooms))
+    return sum(len(rows) for rows in batches.values())
+
+def publish_bed_status(hospital, prediction):
+    return publish_bed_statuses([(hospital, prediction)])
+
+# The pages serving the feed need a signed-in user, and so does the feed
+@socketio.on('connect')
+def on_connect(auth=None):
+    if 'username' not in session:
+        raise ConnectionRefusedError('Sign in to follow bed statuses.')
+
+# Clients choose the scope they want to follow:
+#   {"hospital_types": ["Psychiatric"], "states": ["Texas"]}
+# An empty subscription follows every facility.
+@socketio.on('subscribe')
+def on_subscribe(scope):
+    if 'username' not in session:
+        return {'error': 'Sign in to follow bed statuses.'}
+    scope = scope or {}
+    rooms = [f'type:{t}' for t in scope.get('hospital_types', [])]
+    rooms += [f'state:{s}' for s in scope.get('states', [])]
+    for room in rooms or ['all']:
+        join_room(room)
+    return {'rooms': rooms or ['all']}
+
+@socketio.on('unsubscribe')
+def on_unsubscribe(scope):
+    scope = scope or {}
+    rooms = [f'type:{t}' for t in scope.get('hospital_types', [])]
+    rooms += [f'state:{s}' for s in scope.get('states', [])]
+    for room in rooms or ['all']:
+        leave_room(room)
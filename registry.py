@@ -0,0 +1,167 @@
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+# In-process snapshot of the hospitals collection. The ~5,000 hospitals change
+# rarely, so each process keeps them as slotted records with interned strings,
+# plus index arrays per hospital type and for emergency services. The list routes
+# read the snapshot instead of fetching and decoding every document from MongoDB.
+#
+# The snapshot is immutable. A newer one is built on the side and swapped in with
+# a single reference assignment, so readers never see a half-loaded registry.
+# Writers bump the version in meta/{_id: 'hospitals'} (bump_version), and each
+# process compares that number with its snapshot at most every `check_interval`
+# seconds. The change stream watcher marks the snapshot stale as soon as a
+# hospital document changes, whoever wrote it.
+#
+# Checks and reloads after the first load run on a background thread while
+# readers keep the current snapshot (stale-while-revalidate), so a slow or
+# unreachable MongoDB never holds up a request once a snapshot is loaded.
+
+FIELDS = (
+    'facility_id', 'name', 'address', 'city', 'state', 'zip_code', 'county', 'telephone',
+    'hospital_type', 'hospital_ownership', 'emergency_services', 'bed_count', 'latitude', 'longitude',
+)
+VERSION_ID = 'hospitals'
+
+class HospitalRecord:
+    __slots__ = FIELDS
+
+    def __init__(self, document):
+        for field in FIELDS:
+            value = document.get(field)
+            if isinstance(value, str):
+                value = sys.intern(value)  # Types, states, cities and counties repeat a lot
+            setattr(self, field, value)
+
+    # Records stand in for the Mongo documents, so keep dict-style access working
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+class Snapshot:
+    __slots__ = ('version', 'records', 'ids', 'types', 'emergency')
+
+    def __init__(self, version, documents):
+        self.version = version
+        self.records = tuple(HospitalRecord(document) for document in documents)
+        self.ids = {}
+        self.types = {}
+        self.emergency = array('I')
+        for index, record in enumerate(self.records):
+            self.ids.setdefault(str(record.facility_id), index)
+            self.types.setdefault(record.hospital_type, array('I')).append(index)
+            if record.emergency_services == 'Yes':
+                self.emergency.append(index)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, facility_id):
+        index = self.ids.get(str(facility_id))
+        return None if index is None else self.records[index]
+
+    def by_type(self, hospital_type):
+        return [self.records[index] for index in self.types.get(hospital_type, ())]
+
+    def with_emergency_services(self):
+        return [self.records[index] for index in self.emergency]
+
+    # Records whose fields equal every value in `query`, like a Mongo equality filter
+    def where(self, query):
+        if 'hospital_type' in query:
+            candidates = self.by_type(query['hospital_type'])
+        else:
+            candidates = self.records
+        return [record for record in candidates if all(getattr(record, field, None) == value for field, value in query.items())]
+
+    # Sorted distinct values of a field, skipping missing ones
+    def distinct(self, field):
+        return sorted({value for value in (getattr(record, field) for record in self.records) if isinstance(value, str)})
+
+class HospitalRegistry:
+    def __init__(self):
+        self.snapshot = None
+        self.checked_at = 0.0
+        self.stale = False
+        self.verified_at = None  # When the snapshot was last confirmed current
+        self.failing = False  # The last check or reload failed
+        self.lock = threading.Lock()
+
+    # Build a snapshot from `db` and swap it in
+    def load(self, db):
+        version = current_version(db)
+        documents = db.hospitals.find({}, {'_id': 0, **{field: 1 for field in FIELDS}})
+        self.snapshot = Snapshot(version, documents)
+        self.checked_at = time.monotonic()
+        self.verified_at = datetime.now()
+        return self.snapshot
+
+    # Current snapshot, loading it on first use. When it was marked stale or the
+    # check interval has passed, one caller starts a background refresh and every
+    # caller keeps the current snapshot meanwhile. `call` runs each MongoDB step,
+    # e.g. through a circuit breaker.
+    def get(self, db, check_interval, call=None):
+        call = call or _call
+        snapshot = self.snapshot
+        if snapshot is None:
+            with self.lock:
+                return self.snapshot or call(self.load, db)
+        due = self.stale or time.monotonic() - self.checked_at >= check_interval
+        if due and self.lock.acquire(blocking=False):
+            self.checked_at = time.monotonic()
+            threading.Thread(target=self.refresh, args=(db, snapshot, call), daemon=True).start()
+        return snapshot
+
+    # Reload if the stored version has moved on. Runs with the lock taken by get().
+    def refresh(self, db, snapshot, call):
+        stale, self.stale = self.stale, False  # Changes during the load mark it again
+        try:
+            if stale or call(current_version, db) != snapshot.version:
+                call(self.load, db)
+            else:
+                self.verified_at = datetime.now()
+            self.failing = False
+        except Exception as e:
+            self.stale = self.stale or stale
+            self.failing = True
+            print(f"Hospital registry refresh failed: {e}")
+        finally:
+            self.lock.release()
+
+    # When the snapshot was last confirmed current, if the latest refresh failed
+    def stale_since(self):
+        return self.verified_at if self.failing else None
+
+    # Reload on the next get(). Many invalidations before then cost one reload.
+    def invalidate(self):
+        self.stale = True
+
+def _call(fn, *args):
+    return fn(*args)
+
+def current_version(db):
+    meta = db.meta.find_one({'_id': VERSION_ID})
+    return meta['version'] if meta else 0
+
+# Whether a change stream event on `hospitals` touches a field the snapshot holds;
+# updates to other fields (bed_status, for one) leave it valid
+def affects_snapshot(change):
+    description = change.get('updateDescription')
+    if change['operationType'] != 'update' or description is None:
+        return True
+    changed = list(description.get('updatedFields', {})) + description.get('removedFields', [])
+    return any(field.split('.')[0] in FIELDS for field in changed)
+
+# Call after writing to the hospitals collection
+def bump_version(db):
+    db.meta.update_one({'_id': VERSION_ID}, {'$inc': {'version': 1}}, upsert=True)
+
+hospital_registry = HospitalRegistry()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pymongo import MongoClient
+from pymongo.errors import AutoReconnect, ConnectionFailure, OperationFailure
+
+# Local three-node replica set for trying the read/write split and failover.
+#
+#   python replica_set.py start     # mongod on ports 27017-27019, data in .replset/
+#   python replica_set.py check     # primary writes, secondary reads and a step-down
+#   python replica_set.py stop
+#
+# Point the app at it with
+#   MONGO_URI="mongodb://localhost:27017,localhost:27018,localhost:27019/oxyleap?replicaSet=rs0"
+
+REPLICA_SET = 'rs0'
+DATA_DIR = '.replset'
+
+def replica_set_uri(ports, database='oxyleap'):
+    hosts = ','.join(f'localhost:{port}' for port in ports)
+    return f'mongodb://{hosts}/{database}?replicaSet={REPLICA_SET}'
+
+def wait_for_primary(client, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status = client.admin.command('replSetGetStatus')
+            for member in status['members']:
+                if member['stateStr'] == 'PRIMARY':
+                    return member['name']
+        except (OperationFailure, ConnectionFailure):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("No primary elected.")
+
+def start(ports):
+    for port in ports:
+        dbpath = os.path.join(DATA_DIR, str(port))
+        os.makedirs(dbpath, exist_ok=True)
+        subprocess.run([
+            'mongod', '--replSet', REPLICA_SET, '--port', str(port), '--bind_ip', '127.0.0.1',
+            '--dbpath', dbpath, '--logpath', os.path.join(dbpath, 'mongod.log'), '--fork'
+        ], check=True, stdout=subprocess.DEVNULL)
+
+    client = MongoClient('127.0.0.1', ports[0], directConnection=True)
+    try:
+        client.admin.command('replSetInitiate', {
+            '_id': REPLICA_SET,
+            'members': [
+                {'_id': i, 'host': f'127.0.0.1:{port}', 'priority': 2 if i == 0 else 1}
+                for i, port in enumerate(ports)
+            ],
+        })
+    except OperationFailure as e:
+        if 'already initialized' not in str(e):
+            raise
+    print(f"Primary: {wait_for_primary(client)}")
+    print(f"MONGO_URI={replica_set_uri(ports)}")
+
+def stop(ports):
+    for port in ports:
+        try:
+            MongoClient('127.0.0.1', port, directConnection=True, serverSelectionTimeoutMS=2000).admin.command('shutdown')
+        except (AutoReconnect, ConnectionFailure):
+            pass  # The server closes the connection as it shuts down
+        print(f"Stopped mongod on port {port}")
+
+# Exercise the app's data-access layer: writes go to the primary, listing reads to a
+# secondary, and writes keep working across a primary step-down
+def check(ports):
+    from app import Config, create_app, mongo, read_db
+
+    class ReplicaSetConfig(Config):
+        TESTING = True
+        MONGO_URI = replica_set_uri(ports, 'oxyleap_replset_check')
+        CACHE_TYPE = 'SimpleCache'
+        SOCKETIO_MESSAGE_QUEUE = None
+
+    app = create_app(ReplicaSetConfig)
+    with app.app_context():
+        client = mongo.cx
+        mongo.db.hospitals.drop()
+        mongo.db.hospitals.insert_one({'facility_id': 'check', 'name': 'Replica set check'})
+        print(f"Write went to the primary {client.primary}")
+
+        # Wait for the write to replicate, then read through the secondary-preferred handle
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            cursor = read_db().hospitals.find({'facility_id': 'check'})
+            if list(cursor):
+                print(f"Listing read served by {cursor.address} (secondaries: {sorted(client.secondaries)})")
+                break
+            time.sleep(0.2)
+
+        old_primary = client.primary
+        try:
+            client.admin.command('replSetStepDown', 20, secondaryCatchUpPeriodSecs=10)
+        except (AutoReconnect, ConnectionFailure):
+            pass
+        started = time.time()
+        mongo.db.hospitals.insert_one({'facility_id': 'after-failover'})  # Retried on the new primary
+        print(f"Primary moved from {old_primary} to {client.primary}; "
+              f"first write after the step-down took {time.time() - started:.2f} s")
+        print(f"Reads after failover: {read_db().hospitals.count_documents({})} documents")
+        mongo.db.client.drop_database('oxyleap_replset_check')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local MongoDB replica set")
+    parser.add_argument('command', choices=['start', 'stop', 'check'])
+    parser.add_argument('--ports', type=int, nargs=3, default=[27017, 27018, 27019])
+    args = parser.parse_args(argv)
+    {'start': start, 'stop': stop, 'check': check}[args.command](args.ports)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
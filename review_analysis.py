@@ -0,0 +1,245 @@
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from pymongo import UpdateOne
+
+# Review enrichment, run in the background so add_review() stays a single insert.
+# New reviews (those without `analyzed_at`) are read in chunks and run through
+# spaCy's en_core_web_sm in batches with nlp.pipe. Each review gets
+#
+#   analysis: {sentiment: -1..1, label: positive|neutral|negative, keywords: [service, ...]}
+#
+# and its hospital's totals in `review_insights` are incremented, so aggregates
+# are never recomputed from every review:
+#
+#   {_id: hospital_id, reviews, sentiment_total, positive, neutral, negative, keywords: {service: count}}
+#
+# Each chunk is claimed before it is analysed, by setting `analyzed_at` and an
+# `analysis_claim` token on the reviews still without it, and only the reviews a
+# run still holds are stored and counted. Runs that overlap therefore split the
+# reviews between them instead of counting any twice. Claims of a run that died
+# are released after CLAIM_TIMEOUT.
+#
+# The pipeline is loaded once per process. With more than one process, a pool is
+# started whose workers load it when they start and keep it for every chunk.
+# Runs as the analyze_reviews maintenance job (see tasks.py) or on its own, when
+# it holds the job's lease so scheduled runs are skipped meanwhile:
+#
+#   python review_analysis.py --processes 4
+#   python review_analysis.py --processes 4 --watch 30   # keep polling for new reviews
+
+MODEL = 'en_core_web_sm'
+# Only tokens, POS tags and lemmas are needed; the parser and NER are the slow parts
+DISABLED_COMPONENTS = ('parser', 'ner')
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_CHUNK_SIZE = 1000
+# Far longer than a chunk takes
+CLAIM_TIMEOUT = timedelta(hours=1)
+
+POSITIVE = frozenset((
+    'good', 'great', 'excellent', 'amazing', 'awesome', 'best', 'friendly', 'kind', 'caring', 'helpful',
+    'professional', 'clean', 'quick', 'fast', 'efficient', 'attentive', 'polite', 'nice', 'wonderful',
+    'fantastic', 'compassionate', 'thank', 'thanks', 'recommend', 'comfortable', 'safe', 'happy', 'satisfied',
+    'love', 'perfect', 'smooth', 'organized', 'knowledgeable', 'responsive', 'courteous', 'pleasant',
+))
+NEGATIVE = frozenset((
+    'bad', 'poor', 'terrible', 'horrible', 'awful', 'worst', 'rude', 'slow', 'dirty', 'unprofessional',
+    'long', 'wait', 'delay', 'crowded', 'expensive', 'overpriced', 'careless', 'ignore', 'unhelpful',
+    'disorganized', 'painful', 'unsafe', 'angry', 'disappointed', 'disappointing', 'mistake', 'wrong',
+    'lose', 'complain', 'complaint', 'refuse', 'unclean', 'noisy', 'cold', 'neglect',
+))
+NEGATIONS = frozenset(('not', 'no', "n't", 'never', 'hardly', 'without'))
+# Lemma -> service it is about
+SERVICES = {
+    'emergency': 'emergency', 'er': 'emergency', 'ambulance': 'emergency', 'trauma': 'emergency',
+    'nurse': 'nursing', 'nursing': 'nursing',
+    'doctor': 'doctors', 'physician': 'doctors', 'surgeon': 'doctors', 'specialist': 'doctors',
+    'wait': 'waiting time', 'waiting': 'waiting time', 'queue': 'waiting time', 'delay': 'waiting time',
+    'staff': 'staff', 'receptionist': 'staff', 'reception': 'staff',
+    'bill': 'billing', 'billing': 'billing', 'insurance': 'billing', 'cost': 'billing', 'price': 'billing',
+    'room': 'rooms', 'bed': 'rooms', 'ward': 'rooms', 'icu': 'intensive care',
+    'clean': 'cleanliness', 'cleanliness': 'cleanliness', 'hygiene': 'cleanliness', 'dirty': 'cleanliness',
+    'food': 'food', 'meal': 'food',
+    'parking': 'parking',
+    'pharmacy': 'pharmacy', 'medication': 'pharmacy', 'medicine': 'pharmacy',
+    'surgery': 'surgery', 'operation': 'surgery',
+    'lab': 'laboratory', 'test': 'laboratory', 'scan': 'imaging', 'x-ray': 'imaging', 'mri': 'imaging',
+}
+
+# The spaCy pipeline, loaded on first use in each process
+_nlp = [None]
+
+def load_pipeline():
+    if _nlp[0] is None:
+        import spacy
+        _nlp[0] = spacy.load(MODEL, disable=DISABLED_COMPONENTS)
+    return _nlp[0]
+
+# Sentiment from the share of positive and negative lemmas, a word being flipped
+# by a negation up to three tokens before it; keywords are the services mentioned
+def analyze_doc(doc):
+    positive = negative = 0
+    keywords = set()
+    negated_until = -1
+    for token in doc:
+        lemma = token.lemma_.lower()
+        if lemma in NEGATIONS:
+            negated_until = token.i + 3
+            continue
+        if lemma in SERVICES and token.pos_ in ('NOUN', 'PROPN', 'VERB', 'ADJ'):
+            keywords.add(SERVICES[lemma])
+        polarity = (lemma in POSITIVE) - (lemma in NEGATIVE)
+        if token.i <= negated_until:
+            polarity = -polarity
+        positive += polarity > 0
+        negative += polarity < 0
+    sentiment = (positive - negative) / (positive + negative) if positive + negative else 0.0
+    label = 'positive' if sentiment > 0.25 else 'negative' if sentiment < -0.25 else 'neutral'
+    return {'sentiment': round(sentiment, 3), 'label': label, 'keywords': sorted(keywords)}
+
+# Analyses of a list of texts, in the calling process
+def analyze_texts(texts, batch_size=DEFAULT_BATCH_SIZE):
+    return [analyze_doc(doc) for doc in load_pipeline().pipe(texts, batch_size=batch_size)]
+
+# Analyse every review that has not been yet and add it to its hospital's totals.
+# `progress` is called as progress(done, total).
+def analyze_pending(db, processes=1, batch_size=DEFAULT_BATCH_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    release_stale_claims(db)
+    total = db.reviews.count_documents({'analyzed_at': None})
+    done = 0
+    started = time.perf_counter()
+    pool = Pool(processes, initializer=load_pipeline) if processes > 1 else None
+    try:
+        while True:
+            claim, reviews = claim_reviews(db, chunk_size)
+            if claim is None:
+                break
+            if not reviews:
+                continue  # Another run claimed this chunk first
+            texts = [str(review.get('review') or '') for review in reviews]
+            if pool:
+                # One slice per process, each run through nlp.pipe in its worker
+                step = -(-len(texts) // processes)
+                slices = pool.starmap(analyze_texts, [(texts[i:i + step], batch_size) for i in range(0, len(texts), step)])
+                analyses = [analysis for part in slices for analysis in part]
+            else:
+                analyses = analyze_texts(texts, batch_size)
+            store_analyses(db, claim, reviews, analyses)
+            done += len(reviews)
+            if progress:
+                progress(done, max(total, done))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - started
+    return {'reviews': done, 'seconds': round(elapsed, 3), 'reviews_per_second': round(done / elapsed, 1) if done else 0.0}
+
+# Claim up to `limit` reviews waiting for analysis. Returns (claim, reviews): the
+# claim token and the reviews it won, which may be none if another run got there
+# first, or (None, []) when nothing is waiting.
+def claim_reviews(db, limit):
+    ids = [review['_id'] for review in db.reviews.find({'analyzed_at': None}, {'_id': 1}).sort('_id', 1).limit(limit)]
+    if not ids:
+        return None, []
+    claim = uuid.uuid4().hex
+    db.reviews.update_many(
+        {'_id': {'$in': ids}, 'analyzed_at': None},
+        {'$set': {'analyzed_at': datetime.now(), 'analysis_claim': claim}}
+    )
+    reviews = list(db.reviews.find(
+        {'_id': {'$in': ids}, 'analysis_claim': claim}, {'_id': 1, 'hospital_id': 1, 'review': 1}
+    ).sort('_id', 1))
+    return claim, reviews
+
+# Put reviews claimed by a run that never stored them back in the queue
+def release_stale_claims(db):
+    released = db.reviews.update_many(
+        {'analysis_claim': {'$exists': True}, 'analyzed_at': {'$lt': datetime.now() - CLAIM_TIMEOUT}},
+        {'$set': {'analyzed_at': None}, '$unset': {'analysis_claim': ''}}
+    )
+    if released.modified_count:
+        print(f"Released {released.modified_count} reviews claimed by an analysis run that stopped.")
+
+def store_analyses(db, claim, reviews, analyses):
+    now = datetime.now()
+    # Skip reviews whose claim was released meanwhile, so no run counts them twice
+    held = {review['_id'] for review in db.reviews.find(
+        {'_id': {'$in': [review['_id'] for review in reviews]}, 'analysis_claim': claim}, {'_id': 1}
+    )}
+    stored = [(review, analysis) for review, analysis in zip(reviews, analyses) if review['_id'] in held]
+    if not stored:
+        return
+    db.reviews.bulk_write([
+        UpdateOne({'_id': review['_id'], 'analysis_claim': claim},
+                  {'$set': {'analysis': analysis, 'analyzed_at': now}, '$unset': {'analysis_claim': ''}})
+        for review, analysis in stored
+    ], ordered=False)
+
+    totals = {}
+    for review, analysis in stored:
+        inc = totals.setdefault(str(review.get('hospital_id')), {'reviews': 0, 'sentiment_total': 0.0})
+        inc['reviews'] += 1
+        inc['sentiment_total'] += analysis['sentiment']
+        inc[analysis['label']] = inc.get(analysis['label'], 0) + 1
+        for keyword in analysis['keywords']:
+            inc[f'keywords.{keyword}'] = inc.get(f'keywords.{keyword}', 0) + 1
+    db.review_insights.bulk_write([
+        UpdateOne({'_id': hospital_id}, {'$inc': inc, '$set': {'updated_at': now}}, upsert=True)
+        for hospital_id, inc in totals.items()
+    ], ordered=False)
+
+# A hospital's review totals as averages and the most mentioned services
+def review_insights(db, hospital_id, top=5):
+    insights = db.review_insights.find_one({'_id': str(hospital_id)})
+    if not insights or not insights.get('reviews'):
+        return None
+    keywords = sorted(insights.get('keywords', {}).items(), key=lambda item: -item[1])
+    return {
+        'reviews': insights['reviews'],
+        'sentiment': round(insights['sentiment_total'] / insights['reviews'], 3),
+        'labels': {label: insights.get(label, 0) for label in ('positive', 'neutral', 'negative')},
+        'keywords': dict(keywords[:top]),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse new reviews with spaCy")
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--watch', type=float, help="Keep running, checking for new reviews every WATCH seconds")
+    args = parser.parse_args(argv)
+
+    from app import Config, cache, create_app, get_redis, get_reviews, mongo
+    from locks import Lease
+    from tasks import LEASE_PREFIX, STALE_AFTER
+
+    class AnalysisConfig(Config):
+        CHANGE_STREAMS = False
+
+    app = create_app(AnalysisConfig)
+    with app.app_context():
+        # The analyze_reviews job's lease, renewed after every chunk
+        lease = Lease(get_redis(), LEASE_PREFIX + 'analyze_reviews', int(STALE_AFTER.total_seconds()))
+        try:
+            while True:
+                if lease.acquire():
+                    result = analyze_pending(mongo.db, args.processes, args.batch_size, args.chunk_size,
+                                             progress=lambda done, total: lease.acquire())
+                    if result['reviews']:
+                        cache.delete_memoized(get_reviews)
+                        print(f"Analysed {result['reviews']} reviews at {result['reviews_per_second']} reviews/s.")
+                else:
+                    print("The analyze_reviews job is running; not starting another run.")
+                if not args.watch:
+                    return 0
+                time.sleep(args.watch)
+        finally:
+            lease.release()
+
+if __name__ == '__main__':
+    sys.exit(main())
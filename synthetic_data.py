@@ -0,0 +1,188 @@
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from gazetteer import state_code
+
+# Synthetic data at a multiple of the real dataset's size, for load and scaling
+# tests (see benchmarks/bench_scaling.py). Writes, under output_dir:
+#
+#   hospital_dataset.csv   same columns as data/hospital_dataset.csv
+#   bed_stats/<id>.csv     monthly Date, Active Beds, Inactive Beds series, the
+#                          files preprocess_bed_stats.py loads
+#   reviews.csv            hospital_id, review, rating, timestamp
+#
+#   python synthetic_data.py --scale 100 --months 36 --reviews 5
+#
+# Each synthetic hospital copies the type, ownership, emergency services and
+# size of a real one and is placed in a real ZIP code of the same state, so it
+# lands on the map and in the state filters like a real one would. At scale 1
+# the real rows are kept as they are. Output depends only on the seed and the
+# month it is generated in.
+
+SOURCE_DATASET = 'data/hospital_dataset.csv'
+ZIP_CENTROIDS = 'data/us_zip_centroids.csv'
+COLUMNS = ['facility_id', 'name', 'address', 'city', 'state', 'zip_code', 'county', 'telephone',
+           'hospital_type', 'hospital_ownership', 'emergency_services', 'bed_count']
+
+NAME_SUFFIXES = ('MEDICAL CENTER', 'REGIONAL HOSPITAL', 'COMMUNITY HOSPITAL', 'MEMORIAL HOSPITAL',
+                 'GENERAL HOSPITAL', 'HEALTH CENTER')
+TYPE_NAME_SUFFIXES = {"Children's": ("CHILDREN'S HOSPITAL",), 'Psychiatric': ('BEHAVIORAL HEALTH', 'PSYCHIATRIC HOSPITAL')}
+STREETS = ('MAIN STREET', 'HOSPITAL DRIVE', 'MEDICAL PARKWAY', 'OAK AVENUE', 'STATE ROUTE 9',
+           'BROADWAY', 'PARK AVENUE', 'HIGHWAY 61 NORTH', 'CENTER STREET', 'RIVER ROAD')
+
+# Review sentences by the rating they lean towards
+REVIEW_PHRASES = {
+    1: ("We waited six hours in the emergency room", "Billing was a mess and nobody answered the phone",
+        "Staff at reception were rude", "The room was not clean"),
+    2: ("Parking is expensive and hard to find", "The food was cold", "Nobody told us what was going on"),
+    3: ("Not bad for a small hospital", "The wait was long but the doctor was good",
+        "Average care, nothing special"),
+    4: ("The nurses were kind and attentive", "Doctors explained everything clearly",
+        "Quick admission through the emergency department"),
+    5: ("Great surgery team, quick recovery", "The maternity ward staff were wonderful",
+        "Best pediatric care in the area, thank you"),
+}
+
+# Rows of the real dataset
+def read_source(csv_path=SOURCE_DATASET):
+    with open(csv_path, newline='') as f:
+        return list(csv.DictReader(f))
+
+# {state code: [(zip_code, city)]} from the ZIP centroids
+def zip_codes_by_state(csv_path=ZIP_CENTROIDS):
+    by_state = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            by_state.setdefault(row['state'], []).append((row['zip_code'], row['city']))
+    return by_state
+
+# `count` hospital rows: the real ones first, then synthetic copies of them
+def generate_hospitals(count, rng, source=None, zip_codes=None):
+    source = source or read_source()
+    zip_codes = zip_codes or zip_codes_by_state()
+    rows = [dict(row) for row in source[:count]]
+    for index in range(len(rows), count):
+        template = source[index % len(source)]
+        copy = index // len(source)
+        places = zip_codes.get(state_code(template['state']))
+        zip_code, city = rng.choice(places) if places else (template['zip_code'], template['city'])
+        bed_count = template['bed_count']
+        if bed_count:
+            bed_count = str(max(5, int(float(bed_count) * rng.uniform(0.6, 1.4))))
+        rows.append({
+            'facility_id': f"{template['facility_id']}-{copy}",
+            'name': f"{city.upper()} {rng.choice(TYPE_NAME_SUFFIXES.get(template['hospital_type'], NAME_SUFFIXES))}",
+            'address': f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+            'city': city.upper(),
+            'state': template['state'],
+            'zip_code': zip_code,
+            'county': template['county'],
+            'telephone': f"({rng.randint(201, 989)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            'hospital_type': template['hospital_type'],
+            'hospital_ownership': template['hospital_ownership'],
+            'emergency_services': template['emergency_services'],
+            'bed_count': bed_count,
+        })
+    return rows
+
+# Monthly series ending at `end` (the first of a month): occupancy around a
+# per-hospital level with a winter peak, noise and the odd missing month
+def bed_series(bed_count, months, end, rng):
+    beds = int(float(bed_count)) if bed_count else rng.randint(20, 150)
+    level = rng.uniform(0.5, 0.9)
+    trend = rng.uniform(-0.002, 0.004)
+    series = []
+    for offset in range(months - 1, -1, -1):
+        month_index = end.year * 12 + end.month - 1 - offset
+        year, month = divmod(month_index, 12)
+        winter = 0.08 * math.cos(2 * math.pi * month / 12)  # Peaks in January
+        occupancy = min(1.0, max(0.05, level + winter + trend * (months - offset) + rng.gauss(0, 0.05)))
+        active = round(beds * occupancy)
+        if rng.random() < 0.01:
+            series.append((f'{year}-{month + 1:02d}-01', '', ''))
+        else:
+            series.append((f'{year}-{month + 1:02d}-01', active, beds - active))
+    return series
+
+# A review posted in the three years before `latest`
+def review(rng, latest):
+    rating = rng.choices((1, 2, 3, 4, 5), weights=(10, 10, 15, 30, 35))[0]
+    phrases = REVIEW_PHRASES[rating] + REVIEW_PHRASES[max(1, rating - 1)]
+    text = '. '.join(rng.sample(phrases, rng.randint(1, 3))) + '.'
+    timestamp = latest - timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))
+    return text, str(rating), timestamp.isoformat(timespec='seconds')
+
+# Write the dataset, bed series and reviews for `scale` times the real number of
+# hospitals to output_dir. `progress` is called as progress(done, total).
+def generate(output_dir, scale=1.0, months=24, reviews_per_hospital=2.0, seed=42, progress=None):
+    rng = random.Random(seed)
+    source = read_source()
+    count = max(1, round(len(source) * scale))
+    hospitals = generate_hospitals(count, rng, source)
+
+    bed_stats_dir = os.path.join(output_dir, 'bed_stats')
+    os.makedirs(bed_stats_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'hospital_dataset.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, COLUMNS, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(hospitals)
+
+    today = datetime.now()
+    end = datetime(today.year, today.month, 1)
+    review_count = 0
+    with open(os.path.join(output_dir, 'reviews.csv'), 'w', newline='') as f:
+        reviews = csv.writer(f)
+        reviews.writerow(['hospital_id', 'review', 'rating', 'timestamp'])
+        for i, hospital in enumerate(hospitals, 1):
+            with open(os.path.join(bed_stats_dir, f"{hospital['facility_id']}.csv"), 'w', newline='') as series:
+                writer = csv.writer(series)
+                writer.writerow(['Date', 'Active Beds', 'Inactive Beds'])
+                writer.writerows(bed_series(hospital['bed_count'], months, end, rng))
+
+            # Poisson-distributed count around reviews_per_hospital
+            threshold, n, p = math.exp(-reviews_per_hospital), 0, rng.random()
+            while p > threshold:
+                n += 1
+                p *= rng.random()
+            for _ in range(n):
+                reviews.writerow((hospital['facility_id'],) + review(rng, end))
+            review_count += n
+            if progress and (i % 1000 == 0 or i == len(hospitals)):
+                progress(i, len(hospitals))
+    return {'hospitals': len(hospitals), 'months': months, 'reviews': review_count, 'output_dir': output_dir}
+
+# Review documents as add_review() stores them, `batch_size` at a time
+def read_reviews(csv_path, batch_size=5000):
+    with open(csv_path, newline='') as f:
+        batch = []
+        for row in csv.DictReader(f):
+            row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic hospitals, bed statistics and reviews")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiple of the real number of hospitals")
+    parser.add_argument('--months', type=int, default=24, help="Months of bed statistics per hospital")
+    parser.add_argument('--reviews', type=float, default=2.0, help="Average reviews per hospital")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', help="Defaults to data/synthetic/x<scale>")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output_dir or os.path.join('data', 'synthetic', f'x{args.scale:g}')
+    result = generate(output_dir, args.scale, args.months, args.reviews, args.seed,
+                      progress=lambda done, total: print(f"{done}/{total} hospitals"))
+    print(f"Wrote {result['hospitals']} hospitals, {result['months']} months of bed statistics "
+          f"and {result['reviews']} reviews to {output_dir}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
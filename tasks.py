@@ -0,0 +1,232 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+from celery import Celery, Task, shared_task
+from pymongo.errors import DuplicateKeyError
+from locks import Lease
+
+# Maintenance jobs run by Celery workers off the request path: reloading bed
+# statistics, drawing busy-hour charts, syncing the hospital dataset, refreshing
+# bed statuses, warming caches and analysing reviews. Beat enqueues each one every
+# MAINTENANCE_SCHEDULE seconds, and admins can start one with POST /api/jobs/<name>.
+#
+#   celery -A worker worker --beat --loglevel=info
+#
+# Every run is a document in the `jobs` collection, which is where its state and
+# progress are read from (GET /api/jobs). A unique index on the name of active
+# runs means a job is never queued twice: enqueueing one that is already queued
+# or running returns the existing run. A run also holds a lease in Redis while it
+# works, so a run given up on as abandoned cannot overlap the one replacing it.
+
+LEASE_PREFIX = 'oxyleap:job:'
+# A running job that has not reported progress for this long is presumed dead,
+# and a queued one that no worker picked up in QUEUE_TIMEOUT is dropped
+STALE_AFTER = timedelta(minutes=10)
+QUEUE_TIMEOUT = timedelta(hours=6)
+# Seconds between progress writes
+PROGRESS_INTERVAL = 2
+
+# Create the Celery app for a Flask app. Tasks run inside an app context, so they
+# use the same mongo and cache as the views. Testing apps use an in-memory broker.
+def init_celery(app):
+    class FlaskTask(Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+
+    celery = Celery(app.name, task_cls=FlaskTask)
+    celery.config_from_object(app.config['CELERY'])
+    if app.testing:
+        celery.conf.broker_url = 'memory://'
+    celery.conf.beat_schedule = {
+        f'schedule-{name}': {'task': 'oxyleap.schedule_job', 'schedule': seconds, 'args': (name,)}
+        for name, seconds in app.config['MAINTENANCE_SCHEDULE'].items() if seconds
+    }
+    celery.set_default()
+    app.extensions['celery'] = celery
+    return celery
+
+# Calls progress(done, total) at most every PROGRESS_INTERVAL seconds (and on
+# completion), recording it on the job and renewing the job's lease
+class Progress:
+    def __init__(self, db, job_id, lease):
+        self.db = db
+        self.job_id = job_id
+        self.lease = lease
+        self.reported_at = 0
+
+    def __call__(self, done, total):
+        now = time.monotonic()
+        if done < total and now - self.reported_at < PROGRESS_INTERVAL:
+            return
+        self.reported_at = now
+        if not self.lease.acquire():
+            print(f"Job {self.job_id} could not renew its lease.")
+        self.db.jobs.update_one(
+            {'_id': self.job_id},
+            {'$set': {'progress': {'done': done, 'total': total}, 'heartbeat_at': datetime.now()}}
+        )
+
+# Jobs: each takes a Progress and returns a small summary stored with the run
+def preprocess_bed_stats(progress):
+    from flask import current_app
+    from app import cache_bed_statuses, mongo
+    from delta_sync import record_statuses
+    from preprocess_bed_stats import preprocess_bed_stats as load
+    changed = []
+
+    # New series replace whatever was cached for those facilities, such as an
+    # Unknown status from before they had one
+    def refresh(documents):
+        windows = {document['facility_id']: document['data'] for document in documents}
+        changed.append(len(record_statuses(mongo.db, cache_bed_statuses(windows))))
+
+    # Celery's pool processes cannot start a multiprocessing pool of their own
+    result = load(mongo.db, current_app.config['BED_STATS_DIR'], workers=1, progress=progress, on_insert=refresh)
+    return dict(result, changed=sum(changed))
+
+# Charts of the same activity counters the hospital page shows, for the
+# hospitals that have any
+def busy_hour_charts(progress):
+    from flask import current_app
+    from activity import busy_hours
+    from app import activity_half_life, hospitals_snapshot, mongo
+    from busy_hour_generator import generate_busy_hour_charts
+    snapshot = hospitals_snapshot()
+    half_life = activity_half_life()
+    facility_ids = sorted(facility_id for facility_id in mongo.db.activity.distinct('_id') if facility_id in snapshot.ids)
+    hospitals = ((facility_id, snapshot.records[snapshot.ids[facility_id]].name, busy_hours(mongo.db, facility_id, half_life))
+                 for facility_id in facility_ids)
+    return generate_busy_hour_charts(hospitals, current_app.config['BUSY_HOUR_CHARTS_DIR'], progress)
+
+def sync_hospital_dataset(progress):
+    from flask import current_app
+    from app import sync_hospital_dataset as sync
+    return sync(current_app.config['HOSPITAL_DATASET'], progress)
+
+# Recompute every facility's bed status from its series, which replaces cached
+# predictions that would otherwise live until their TTL, and records the ones
+# that changed for the delta sync API
+def refresh_bed_statuses(progress, batch_size=500):
+    from app import cache_bed_statuses, mongo
+    from delta_sync import record_statuses
+    total = mongo.db.bed_stats.count_documents({})
+    done = changed = 0
+    windows = {}
+    for bed_stat in mongo.db.bed_stats.find({}, {'_id': 0, 'facility_id': 1, 'data': 1}).batch_size(batch_size):
+        windows[bed_stat['facility_id']] = bed_stat.get('data') or []
+        if len(windows) == batch_size:
+            changed += len(record_statuses(mongo.db, cache_bed_statuses(windows)))
+            done += len(windows)
+            windows = {}
+            progress(done, total)
+    if windows:
+        changed += len(record_statuses(mongo.db, cache_bed_statuses(windows)))
+        done += len(windows)
+    progress(done, total)
+    return {'facilities': done, 'changed': changed}
+
+# Fill in the predictions and reviews that are not cached, so the first
+# visitors after a restart or flush do not pay for them
+def warm_caches(progress, batch_size=500):
+    from app import bed_statuses, get_reviews, hospitals_snapshot
+    facility_ids = [record.facility_id for record in hospitals_snapshot().records]
+    for start in range(0, len(facility_ids), batch_size):
+        bed_statuses(facility_ids[start:start + batch_size])
+        progress(min(start + batch_size, len(facility_ids)), len(facility_ids))
+    get_reviews()
+    return {'hospitals': len(facility_ids)}
+
+# New reviews through the spaCy pipeline, which each worker process keeps loaded
+# between runs. For more throughput, run review_analysis.py with --processes
+# instead: Celery's pool processes cannot start a pool of their own.
+def analyze_reviews(progress):
+    from flask import current_app
+    from app import cache, get_reviews, mongo
+    from review_analysis import analyze_pending
+    result = analyze_pending(mongo.db, batch_size=current_app.config['REVIEW_ANALYSIS_BATCH_SIZE'], progress=progress)
+    if result['reviews']:
+        cache.delete_memoized(get_reviews)
+    return result
+
+JOBS = {
+    'preprocess_bed_stats': preprocess_bed_stats,
+    'busy_hour_charts': busy_hour_charts,
+    'sync_hospital_dataset': sync_hospital_dataset,
+    'refresh_bed_statuses': refresh_bed_statuses,
+    'warm_caches': warm_caches,
+    'analyze_reviews': analyze_reviews,
+}
+
+# Queue a run of a job unless one is already queued or running.
+# Returns (job, created), where job is the new run or the existing one.
+def enqueue_job(name, trigger='manual'):
+    from app import mongo
+    if name not in JOBS:
+        raise KeyError(name)
+    db = mongo.db
+    now = datetime.now()
+    # Give up on runs whose worker stopped reporting, so they no longer block new ones
+    db.jobs.update_many(
+        {'name': name, 'active': True, '$or': [
+            {'state': 'queued', 'queued_at': {'$lt': now - QUEUE_TIMEOUT}},
+            {'state': 'running', 'heartbeat_at': {'$lt': now - STALE_AFTER}},
+        ]},
+        {'$set': {'state': 'failed', 'error': "Abandoned: no worker reported on it.", 'finished_at': now},
+         '$unset': {'active': ''}}
+    )
+
+    job = {'_id': uuid.uuid4().hex, 'name': name, 'state': 'queued', 'active': True, 'trigger': trigger, 'queued_at': now}
+    try:
+        db.jobs.insert_one(job)
+    except DuplicateKeyError:
+        return db.jobs.find_one({'name': name, 'active': True}), False
+    try:
+        run_job.apply_async((name, job['_id']), task_id=job['_id'], expires=QUEUE_TIMEOUT.total_seconds())
+    except Exception as e:  # Broker unreachable
+        finish_job(db, job['_id'], 'failed', error=f"Could not be queued: {e}")
+        raise
+    return job, True
+
+def finish_job(db, job_id, state, **fields):
+    db.jobs.update_one(
+        {'_id': job_id, 'active': True},
+        {'$set': dict(fields, state=state, finished_at=datetime.now()), '$unset': {'active': ''}}
+    )
+
+@shared_task(name='oxyleap.schedule_job')
+def schedule_job(name):
+    enqueue_job(name, trigger='schedule')
+
+@shared_task(name='oxyleap.run_job', bind=True)
+def run_job(self, name, job_id):
+    from app import get_redis, mongo
+    db = mongo.db
+    now = datetime.now()
+    started = db.jobs.update_one(
+        {'_id': job_id, 'state': 'queued'},
+        {'$set': {'state': 'running', 'started_at': now, 'heartbeat_at': now, 'worker': self.request.hostname}}
+    )
+    if not started.matched_count:
+        return  # Redelivered after it started, or given up on while queued
+
+    lease = Lease(get_redis(), LEASE_PREFIX + name, int(STALE_AFTER.total_seconds()), owner=job_id)
+    if not lease.acquire():
+        finish_job(db, job_id, 'skipped', error="An earlier run of this job is still working.")
+        return
+    try:
+        result = JOBS[name](Progress(db, job_id, lease))
+    except Exception as e:
+        finish_job(db, job_id, 'failed', error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        lease.release()
+    finish_job(db, job_id, 'succeeded', result=result)
+
+# A run as JSON for the status endpoint
+def job_summary(job):
+    summary = {'id': job['_id']}
+    for key, value in job.items():
+        if key not in ('_id', 'active'):
+            summary[key] = value.isoformat() if isinstance(value, datetime) else value
+    return summary
@@ -0,0 +1,67 @@
+# Tests run against local stand-ins: mongomock for MongoDB, fakeredis for Redis,
+# Celery's in-memory broker and the in-process Socket.IO server.
+#
+#   pip install -r tests/requirements.txt
+#   python -m pytest -q
+
+import os
+import sys
+
+import fakeredis
+import mongomock
+import pytest
+
+# The app reads data/ and templates/ relative to the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import app as oxyleap
+from breakers import BREAKERS
+
+class TestConfig(oxyleap.Config):
+    TESTING = True  # In-memory Celery broker and in-process Socket.IO
+    CHANGE_STREAMS = False
+    SOCKETIO_MESSAGE_QUEUE = None
+    RATE_LIMITING = False
+    INGEST_API_KEYS = ['test-key']
+    ADMIN_API_KEYS = ['admin-key']
+    BCRYPT_LOG_ROUNDS = 4  # bcrypt's minimum, so hashing stays fast
+
+# One app for the session, on mongomock and fakeredis
+@pytest.fixture(scope='session')
+def app():
+    app = oxyleap.create_app(TestConfig)
+    oxyleap.mongo.cx = mongomock.MongoClient()
+    oxyleap.mongo.db = oxyleap.mongo.cx['oxyleap_test']
+    redis_client = fakeredis.FakeStrictRedis()
+    oxyleap.cache.cache._write_client = redis_client
+    oxyleap.cache.cache._read_client = redis_client
+    oxyleap._redis[0] = redis_client
+    return app
+
+# An empty database and Redis with the app's indexes, inside an app context.
+# State the app keeps per process starts over too.
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        for name in oxyleap.mongo.db.list_collection_names():
+            oxyleap.mongo.db[name].drop()
+        oxyleap.get_redis().flushall()
+        oxyleap.ensure_indexes()
+        oxyleap.hospital_registry.snapshot = None
+        oxyleap.recent_statuses.value = oxyleap.recent_statuses.updated_at = None
+        for breaker in BREAKERS:
+            breaker.failed, breaker.opened_at, breaker.probing = 0, None, False
+        yield oxyleap.mongo.db
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+# A test client with a signed-in session
+@pytest.fixture
+def signed_in(client):
+    with client.session_transaction() as session:
+        session['username'] = 'tester'
+    return client
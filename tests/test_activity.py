@@ -0,0 +1,108 @@
+# Forward-decayed busy-hour counters (activity.py)
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import activity
+from activity import EPOCH, REBASE_HALF_LIVES, activity_matrix, busy_hours, cell, current_landmark, record_events
+
+DAY = timedelta(days=1)
+NOW = datetime(2026, 10, 19, 12)  # A Monday, noon
+
+def decayed(db, facility_id, half_life, now):
+    matrix, events = activity_matrix(db, facility_id, half_life, now)
+    return [value for row in matrix for value in row], events
+
+def test_events_decay_by_half_each_half_life(db):
+    record_events(db, [('h', NOW), ('h', NOW - 7 * DAY), ('h', NOW - 14 * DAY)], 7 * DAY, now=NOW)
+    cells, events = decayed(db, 'h', 7 * DAY, NOW)
+    assert events == 3
+    assert cells[cell(NOW)] == pytest.approx(1 + 0.5 + 0.25)
+    assert sum(cells) == pytest.approx(1.75)
+    # A week later, every weight has halved
+    cells, _ = decayed(db, 'h', 7 * DAY, NOW + 7 * DAY)
+    assert cells[cell(NOW)] == pytest.approx(0.875)
+
+def test_matrix_is_day_by_hour(db):
+    record_events(db, [('h', datetime(2026, 10, 18, 23, 30))], 7 * DAY, now=NOW)  # Sunday 11pm
+    matrix, _ = activity_matrix(db, 'h', 7 * DAY, datetime(2026, 10, 18, 23, 30))
+    assert matrix[6][23] == pytest.approx(1)
+    assert sum(map(sum, matrix)) == pytest.approx(1)
+
+def test_busy_hours_scale_to_the_peak(db):
+    record_events(db, [('h', NOW)] * 4 + [('h', NOW - timedelta(hours=1))] * 2, 28 * DAY, now=NOW)
+    busy = busy_hours(db, 'h', 28 * DAY, NOW)
+    assert busy['events'] == 6
+    assert busy['matrix'][0][12] == 100 and busy['matrix'][0][11] == 50
+    assert busy_hours(db, 'other', 28 * DAY, NOW)['matrix'] is None
+
+def test_future_events_count_as_now(db):
+    record_events(db, [('h', datetime(3000, 1, 1))], DAY, now=NOW)
+    cells, _ = decayed(db, 'h', DAY, NOW)
+    assert cells[cell(NOW)] == pytest.approx(1)
+
+def test_landmark_is_rebased_as_time_passes(db):
+    half_life = DAY
+    now = NOW
+    record_events(db, [('h', now)], half_life, now=now)
+    first = db.activity.find_one({'_id': 'h'})['landmark']
+    # Five years at a one-day half-life would overflow weights against one landmark
+    for _ in range(5 * 365 // 9):
+        now += 9 * DAY
+        record_events(db, [('h', now)], half_life, now=now)
+    document = db.activity.find_one({'_id': 'h'})
+    assert document['landmark'] == current_landmark(now, half_life) > first
+    assert max(document['cells'].values()) <= 2 ** REBASE_HALF_LIVES
+    cells, events = decayed(db, 'h', half_life, now)
+    assert events == 5 * 365 // 9 + 1
+    # Events nine half-lives apart: 1 + 2**-9 + 2**-18 + ...
+    assert sum(cells) == pytest.approx(1 / (1 - 2 ** -9))
+
+def test_rebase_keeps_the_decayed_counts(db):
+    half_life = DAY
+    landmark = current_landmark(NOW, half_life)
+    before = landmark - timedelta(hours=1)
+    record_events(db, [('h', before)], half_life, now=before)
+    expected, _ = decayed(db, 'h', half_life, NOW)
+    record_events(db, [('other', NOW)], half_life, now=NOW)
+    record_events(db, [('h', NOW - 30 * DAY)], half_life, now=NOW)  # Moves 'h' to the new landmark
+    assert db.activity.find_one({'_id': 'h'})['landmark'] == landmark
+    cells, _ = decayed(db, 'h', half_life, NOW)
+    assert cells[cell(before)] == pytest.approx(expected[cell(before)] + (2 ** -30 if cell(before) == cell(NOW) else 0))
+
+def test_legacy_document_without_landmark(db):
+    weight = activity.weight(NOW - 28 * DAY, EPOCH, 28 * 86400)
+    db.activity.insert_one({'_id': 'h', 'events': 1, 'cells': {str(cell(NOW)): weight}})
+    record_events(db, [('h', NOW)], 28 * DAY, now=NOW)
+    cells, events = decayed(db, 'h', 28 * DAY, NOW)
+    assert events == 2
+    assert cells[cell(NOW)] == pytest.approx(1.5)
+
+def test_changing_the_half_life_starts_over(db):
+    record_events(db, [('h', NOW - DAY)] * 3, 28 * DAY, now=NOW)
+    record_events(db, [('h', NOW)], 7 * DAY, now=NOW)
+    document = db.activity.find_one({'_id': 'h'})
+    assert document['half_life'] == 7 * 86400
+    assert document['events'] == 1  # Reset along with the cells
+    cells, events = decayed(db, 'h', 7 * DAY, NOW)
+    assert events == 1 and sum(cells) == pytest.approx(1)
+
+def test_write_is_retried_when_another_process_moves_the_landmark(db, monkeypatch):
+    half_life = DAY
+    old = current_landmark(NOW, half_life) - timedelta(hours=1)
+    record_events(db, [('h', old)], half_life, now=old)
+    rebase = activity.rebase
+    moved = []
+
+    # Another process rebases the document between our read and our write
+    def racing_rebase(db, document, landmark, seconds):
+        if not moved:
+            moved.append(rebase(db, dict(document), landmark, seconds))
+        return rebase(db, document, landmark, seconds)
+
+    monkeypatch.setattr(activity, 'rebase', racing_rebase)
+    record_events(db, [('h', NOW)], half_life, now=NOW)
+    cells, events = decayed(db, 'h', half_life, NOW)
+    assert events == 2
+    assert cells[cell(NOW)] == pytest.approx(1 + (2 ** -((NOW - old) / half_life) if cell(old) == cell(NOW) else 0))
@@ -0,0 +1,132 @@
+# Degraded mode (breakers.py): circuit breaker states, and list pages served from
+# the last good bed statuses, or answered 503, while MongoDB fails. Failures are
+# injected into mongomock.
+
+from datetime import datetime
+
+import mongomock
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import app as oxyleap
+import breakers
+from breakers import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breakers.time, 'monotonic', clock)
+    return clock
+
+def failing():
+    raise ServerSelectionTimeoutError("no servers")
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker('test', (ServerSelectionTimeoutError,), failures=3, reset_seconds=10)
+    for _ in range(2):
+        with pytest.raises(ServerSelectionTimeoutError):
+            breaker.call(failing)
+    assert breaker.state == CLOSED
+    assert breaker.call(lambda: 'ok') == 'ok'  # A success resets the count
+    for _ in range(3):
+        with pytest.raises(ServerSelectionTimeoutError):
+            breaker.call(failing)
+    assert breaker.state == OPEN
+    calls = []
+    with pytest.raises(CircuitOpen):
+        breaker.call(calls.append, 'not made')
+    assert calls == []
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker('test', (ServerSelectionTimeoutError,), failures=1, reset_seconds=10)
+    with pytest.raises(ServerSelectionTimeoutError):
+        breaker.call(failing)
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # The trial is still in flight
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+def test_failed_trial_opens_for_another_period(clock):
+    breaker = CircuitBreaker('test', (ServerSelectionTimeoutError,), failures=1, reset_seconds=10)
+    with pytest.raises(ServerSelectionTimeoutError):
+        breaker.call(failing)
+    clock.now += 10
+    with pytest.raises(ServerSelectionTimeoutError):
+        breaker.call(failing)
+    assert breaker.state == OPEN
+    clock.now += 9
+    assert breaker.state == OPEN
+    clock.now += 1
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == CLOSED
+
+def test_caller_errors_do_not_trip_the_breaker(clock):
+    breaker = CircuitBreaker('test', (ServerSelectionTimeoutError,), failures=1)
+    with pytest.raises(KeyError):
+        breaker.call(lambda: {}['missing'])
+    assert breaker.state == CLOSED
+
+@pytest.fixture
+def hospitals(db):
+    db.hospitals.insert_many([
+        {'facility_id': '10001', 'name': 'NORTH HOSPITAL', 'hospital_type': 'Acute Care Hospitals', 'state': 'AL'},
+        {'facility_id': '10002', 'name': 'SOUTH HOSPITAL', 'hospital_type': 'Acute Care Hospitals', 'state': 'TX'},
+    ])
+    db.bed_stats.insert_many([
+        {'facility_id': '10001', 'data': [{'Date': datetime(2026, 1, 1), 'Active Beds': 10, 'Inactive Beds': 7}]},
+        {'facility_id': '10002', 'data': [{'Date': datetime(2026, 1, 1), 'Active Beds': 10, 'Inactive Beds': 3}]},
+    ])
+    oxyleap.hospitals_snapshot()  # Loaded while MongoDB is up
+
+# MongoDB failing every bed_stats read from now on; cached statuses are dropped
+# so the page has to read them
+@pytest.fixture
+def bed_stats_down(monkeypatch):
+    find = mongomock.collection.Collection.find
+    def failing_find(self, *args, **kwargs):
+        if self.name == 'bed_stats':
+            raise ServerSelectionTimeoutError("bed_stats unreachable")
+        return find(self, *args, **kwargs)
+
+    def down():
+        oxyleap.get_redis().flushall()
+        monkeypatch.setattr(mongomock.collection.Collection, 'find', failing_find)
+    return down
+
+def test_page_falls_back_to_last_good_statuses(hospitals, bed_stats_down, signed_in):
+    page = signed_in.get('/health_centers')
+    assert page.status_code == 200
+    assert b'stale-banner' not in page.data
+
+    bed_stats_down()
+    page = signed_in.get('/health_centers')
+    assert page.status_code == 200
+    assert b'stale-banner' in page.data
+    assert b'NORTH HOSPITAL' in page.data and b'SOUTH HOSPITAL' in page.data
+
+def test_fallback_continues_once_the_breaker_opens(app, hospitals, bed_stats_down, signed_in):
+    signed_in.get('/health_centers')
+    bed_stats_down()
+    for _ in range(app.config['CIRCUIT_BREAKER_FAILURES'] + 1):
+        page = signed_in.get('/health_centers')
+        assert page.status_code == 200 and b'stale-banner' in page.data
+    assert breakers.mongo_breaker.state == OPEN
+
+def test_page_without_fallback_is_unavailable(app, hospitals, bed_stats_down, signed_in):
+    bed_stats_down()
+    retry_after = str(int(app.config['CIRCUIT_BREAKER_RESET_SECONDS']))
+    # A MongoDB error before the breaker opens, then the open breaker itself
+    for _ in range(app.config['CIRCUIT_BREAKER_FAILURES'] + 1):
+        page = signed_in.get('/health_centers')
+        assert page.status_code == 503
+        assert page.headers['Retry-After'] == retry_after
+    assert breakers.mongo_breaker.state == OPEN
@@ -0,0 +1,44 @@
+# Cache lifetimes of predictions and reviews, and the statuses refreshed when the
+# preprocess_bed_stats job loads new series
+
+import pytest
+
+import app as oxyleap
+import tasks
+
+class Watcher:
+    def __init__(self, following):
+        self.following = following
+
+def prediction_ttl(facility_id):
+    key = oxyleap.predict_bed_availability.make_cache_key(oxyleap.predict_bed_availability.uncached, facility_id)
+    return oxyleap.get_redis().ttl(oxyleap.cache.cache.key_prefix + key)
+
+@pytest.mark.parametrize('watcher, ttl', [
+    (None, 'PREDICTION_CACHE_TTL'),  # CHANGE_STREAMS=0, or a Celery worker
+    (Watcher(False), 'PREDICTION_CACHE_TTL'),  # Standalone server: the watcher gave up
+    (Watcher(True), 'CHANGE_STREAM_CACHE_TTL'),
+])
+def test_predictions_live_long_only_while_change_streams_run(app, db, monkeypatch, watcher, ttl):
+    if watcher:
+        monkeypatch.setitem(app.extensions, 'change_watcher', watcher)
+    assert oxyleap.cache_ttl('PREDICTION_CACHE_TTL') == app.config[ttl]
+
+    oxyleap.predict_bed_availability('10001')
+    assert app.config[ttl] - 5 < prediction_ttl('10001') <= app.config[ttl]
+    oxyleap.cache_bed_statuses({'10002': []})
+    assert app.config[ttl] - 5 < prediction_ttl('10002') <= app.config[ttl]
+
+def test_default_ttls_are_short_without_change_streams(app):
+    assert app.config['PREDICTION_CACHE_TTL'] <= 3600
+    assert app.config['REVIEWS_CACHE_TTL'] <= 3600
+
+def test_preprocess_job_refreshes_cached_statuses(app, db, monkeypatch, tmp_path):
+    assert oxyleap.predict_bed_availability('10001')['status'] == 'Unknown'  # Cached before the series exists
+    (tmp_path / '10001.csv').write_text('Date,Active Beds,Inactive Beds\n2026-01-01,10,7\n2026-02-01,30,2\n')
+    monkeypatch.setitem(app.config, 'BED_STATS_DIR', str(tmp_path))
+
+    result = tasks.preprocess_bed_stats(lambda done, total: None)
+    assert result['inserted'] == 1 and result['changed'] == 1
+    assert oxyleap.predict_bed_availability('10001') == {'status': 'red', 'inactive_beds': 2}
+    assert db.bed_statuses.find_one({'_id': '10001'})['status'] == 'red'
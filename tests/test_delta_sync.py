@@ -0,0 +1,93 @@
+# Versioned delta sync for the mobile app (delta_sync.py)
+
+import math
+import time
+from types import SimpleNamespace
+
+import delta_sync
+from delta_sync import WRITER_EXPIRY, change_version, changes_since, record_statuses, sync_versions
+
+def no_statuses(facility_ids):
+    return {}
+
+def hospital(db, facility_id, version):
+    db.hospitals.insert_one({'facility_id': facility_id, 'name': facility_id.title(), '_v': version})
+
+def facility_ids(payload):
+    return sorted(row['i'] for row in payload['h'])
+
+def test_empty_database_syncs_everything_at_version_zero(db):
+    assert sync_versions(db) == (0, 0)
+    assert changes_since(db, 0, no_statuses) == {'v': 0, 'full': True, 'h': [], 's': []}
+
+def test_only_later_versions_are_sent(db):
+    for facility_id in ('a', 'b'):
+        with change_version(db) as version:
+            hospital(db, facility_id, version)
+    assert sync_versions(db) == (2, 2)
+    payload = changes_since(db, 1, no_statuses)
+    assert payload['v'] == 2 and not payload['full']
+    assert facility_ids(payload) == ['b']
+    assert facility_ids(changes_since(db, 2, no_statuses)) == []
+
+# A write that finishes before an earlier one must not let clients skip the earlier one
+def test_version_is_held_back_while_an_earlier_write_is_in_flight(db):
+    with change_version(db) as version:
+        hospital(db, 'a', version)
+    slow = change_version(db)
+    slow_version = slow.__enter__()  # Version 2, still landing
+    with change_version(db) as version:
+        hospital(db, 'c', version)  # Version 3, done
+    assert sync_versions(db) == (1, 3)
+    payload = changes_since(db, 1, no_statuses)
+    assert facility_ids(payload) == ['c']
+    assert payload['v'] == 1  # The client asks again from 1 and will not miss version 2
+
+    hospital(db, 'b', slow_version)
+    slow.__exit__(None, None, None)
+    assert sync_versions(db) == (3, 3)
+    payload = changes_since(db, payload['v'], no_statuses)
+    assert facility_ids(payload) == ['b', 'c']
+    assert payload['v'] == 3
+
+def test_crashed_writers_stop_holding_the_version_back(db, monkeypatch):
+    with change_version(db) as version:
+        hospital(db, 'a', version)
+    crashed = change_version(db)
+    crashed.__enter__()  # Never exits
+    with change_version(db) as version:
+        hospital(db, 'c', version)
+    assert sync_versions(db) == (1, 3)
+    later = time.time() + WRITER_EXPIRY + 1
+    monkeypatch.setattr(delta_sync, 'time', SimpleNamespace(time=lambda: later))
+    assert sync_versions(db) == (3, 3)
+
+# A version past the latest means the database was restored or replaced
+def test_unknown_version_gets_a_full_sync(db):
+    with change_version(db) as version:
+        hospital(db, 'a', version)
+    payload = changes_since(db, 7, no_statuses)
+    assert payload['full'] and payload['v'] == 1
+    assert facility_ids(payload) == ['a']
+
+def test_only_changed_statuses_are_recorded(db):
+    hospital(db, 'a', 0)
+    hospital(db, 'b', 0)
+    statuses = {'a': {'status': 'green', 'inactive_beds': 2.0}, 'b': {'status': 'red', 'inactive_beds': math.nan}}
+    assert record_statuses(db, statuses) == statuses
+    changed = {'a': {'status': 'yellow', 'inactive_beds': 2.0}, 'b': {'status': 'red', 'inactive_beds': math.nan}}
+    assert record_statuses(db, changed) == {'a': changed['a']}  # NaN equals NaN here
+    assert sync_versions(db) == (2, 2)
+    assert changes_since(db, 1, no_statuses)['s'] == [['a', 'y', 2]]
+
+def test_full_sync_fills_in_unrecorded_statuses(db):
+    hospital(db, 'a', 0)
+    hospital(db, 'b', 0)
+    record_statuses(db, {'a': {'status': 'green', 'inactive_beds': 1}})
+    asked = []
+    def current_statuses(facility_ids):
+        asked.extend(facility_ids)
+        return {facility_id: {'status': 'Unknown', 'inactive_beds': 'N/A'} for facility_id in facility_ids}
+    payload = changes_since(db, 0, current_statuses)
+    assert asked == ['b']
+    assert sorted(payload['s']) == [['a', 'g', 1], ['b', 'u', None]]
@@ -0,0 +1,94 @@
+# Many-to-many distance matrices (distances.py)
+
+import math
+
+import numpy as np
+import pytest
+
+from distances import PAIR_BYTES, MatrixError, distance_matrix, distances_m, eta_seconds, parse_origins
+from registry import Snapshot
+
+def snapshot(n=60, seed=3):
+    rng = np.random.default_rng(seed)
+    documents = []
+    for i in range(n):
+        document = {'facility_id': str(10000 + i), 'name': f'H{i}',
+                    'latitude': float(rng.uniform(25, 49)), 'longitude': float(rng.uniform(-124, -67))}
+        if i % 10 == 7:
+            document['latitude'] = None  # Not located: left out of every matrix
+        documents.append(document)
+    return Snapshot(1, documents)
+
+def origins(m=23, seed=5):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.uniform(25, 49, m), rng.uniform(-124, -67, m)])
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(a))
+
+def test_full_matrix_matches_haversine():
+    hospitals, points = snapshot(), origins()
+    indices, distances = distance_matrix(hospitals, points)
+    assert distances.shape == (len(points), len(indices))
+    assert all(hospitals.records[i].latitude is not None for i in indices)
+    assert len(indices) == len(hospitals) - 6
+    for row in (0, 11, 22):
+        for column in (0, 17, len(indices) - 1):
+            record = hospitals.records[indices[column]]
+            expected = haversine(points[row, 0], points[row, 1], record.latitude, record.longitude)
+            assert distances[row, column] == pytest.approx(expected, rel=1e-9)
+
+def test_one_degree_along_the_equator():
+    hospitals = Snapshot(1, [{'facility_id': '1', 'latitude': 0.0, 'longitude': 1.0}])
+    _, distances = distance_matrix(hospitals, np.array([[0.0, 0.0]]))
+    assert distances[0, 0] == pytest.approx(111.195, abs=1e-3)
+    assert distances_m(distances)[0, 0] == 111195
+    assert eta_seconds(distances, 60)[0, 0] == round(111.195 * 1.3 * 60)
+
+@pytest.mark.parametrize('k', [1, 5, 54, 100])
+def test_top_k_matches_the_full_matrix(k):
+    hospitals, points = snapshot(), origins()
+    indices, full = distance_matrix(hospitals, points)
+    nearest, nearest_distances = distance_matrix(hospitals, points, top_k=k)
+    k = min(k, len(indices))
+    order = np.argsort(full, axis=1)[:, :k]
+    assert nearest.shape == (len(points), k)
+    assert np.array_equal(nearest, indices[order])
+    assert np.allclose(nearest_distances, np.take_along_axis(full, order, axis=1))
+    assert np.all(np.diff(nearest_distances, axis=1) >= 0)
+
+# Budgets giving 1, 2 and 7 origins per chunk, the last not dividing 23 origins
+@pytest.mark.parametrize('rows', [1, 2, 7, 23, 1000])
+@pytest.mark.parametrize('top_k', [None, 3])
+def test_chunk_boundaries_do_not_change_the_result(rows, top_k):
+    hospitals, points = snapshot(), origins()
+    n = len(distance_matrix(hospitals, points)[0])
+    expected = distance_matrix(hospitals, points, top_k=top_k)
+    result = distance_matrix(hospitals, points, top_k=top_k, memory_budget=rows * n * PAIR_BYTES)
+    assert np.array_equal(result[0], expected[0])
+    assert np.array_equal(result[1], expected[1])
+
+def test_indices_restrict_the_hospitals():
+    hospitals, points = snapshot(), origins()
+    indices, full = distance_matrix(hospitals, points)
+    subset = np.array([0, 3, 7, 12, 40])  # 7 has no coordinates
+    chosen, distances = distance_matrix(hospitals, points, indices=subset)
+    assert list(chosen) == [0, 3, 12, 40]
+    assert np.array_equal(distances, full[:, np.searchsorted(indices, chosen)])
+    nearest, _ = distance_matrix(hospitals, points, indices=subset, top_k=2)
+    assert set(nearest.ravel()) <= {0, 3, 12, 40}
+
+class Gazetteer:
+    def locate(self, zip_code, city, state):
+        return (40.0, -75.0) if zip_code == '19104' else (None, None)
+
+def test_parse_origins():
+    parsed = parse_origins([[10, 20], {'lat': '1.5', 'lon': 2}, {'zip': '19104'}], Gazetteer(), 10)
+    assert parsed.tolist() == [[10, 20], [1.5, 2], [40, -75]]
+
+@pytest.mark.parametrize('items', [[], 'x', [[91, 0]], [{'zip': '00000'}], [{'lat': 'a', 'lon': 1}], [[0, 0]] * 11])
+def test_parse_origins_rejects(items):
+    with pytest.raises(MatrixError):
+        parse_origins(items, Gazetteer(), 10)
@@ -0,0 +1,95 @@
+# Bed count ingestion (ingest.py and POST /api/bed_stats)
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as oxyleap
+from ingest import IngestError, group_updates, write_updates
+
+NOW = datetime(2026, 6, 1, 12, 0)
+
+def update(days_ago, inactive=5, **fields):
+    return dict({'facility_id': '10001', 'active_beds': 10, 'inactive_beds': inactive,
+                 'timestamp': (NOW - timedelta(days=days_ago)).isoformat()}, **fields)
+
+def test_rows_without_a_timestamp_use_now():
+    grouped = group_updates([{'facility_id': 10001, 'active_beds': 3}], now=NOW)
+    assert grouped == {'10001': [{'Active Beds': 3, 'Date': NOW}]}
+
+@pytest.mark.parametrize('bad', [
+    {'active_beds': float('inf')},
+    {'active_beds': -1},
+    {'active_beds': True},
+    {'timestamp': '3000-01-01T00:00:00'},
+    {'timestamp': (NOW - timedelta(days=400)).isoformat()},
+    {'timestamp': 'yesterday'},
+])
+def test_invalid_updates_are_rejected(bad):
+    with pytest.raises(IngestError):
+        group_updates([update(0, **bad)], now=NOW)
+
+def test_backfill_is_merged_in_date_order(db):
+    for days_ago in (30, 20, 0):
+        write_updates(db, group_updates([update(days_ago)], now=NOW), window=3)
+    windows = write_updates(db, group_updates([update(200, inactive=99)], now=NOW), window=3)
+    rows = windows['10001']
+    assert [row['Date'] for row in rows] == sorted(row['Date'] for row in rows)
+    # The latest reading stays last; the backfill is the oldest and falls off the window
+    assert rows[-1]['Date'] == NOW and rows[-1]['Inactive Beds'] == 5
+    assert all(row['Inactive Beds'] != 99 for row in rows)
+
+def test_backfill_does_not_change_the_pushed_status(db, client):
+    headers = {'X-API-Key': 'test-key'}
+    now = datetime.now()
+    def post(days_ago, inactive):
+        timestamp = (now - timedelta(days=days_ago)).isoformat()
+        return client.post('/api/bed_stats', headers=headers, json=[
+            {'facility_id': '10001', 'active_beds': 10, 'inactive_beds': inactive, 'timestamp': timestamp}
+        ]).get_json()
+    for days_ago in (30, 20, 0):
+        post(days_ago, 5)
+    assert post(200, 99)['changed'] == 0
+    assert db.bed_statuses.find_one({'_id': '10001'})['inactive_beds'] == 5
+
+# Records each collection method called, standing in for MongoDB round trips
+class CountingDatabase:
+    def __init__(self, db, calls):
+        self.db = db
+        self.calls = calls
+
+    def with_options(self, **options):
+        return self
+
+    def __getitem__(self, name):
+        return CountingCollection(self.db[name], self.calls)
+
+    def __getattr__(self, name):
+        return self[name]
+
+class CountingCollection:
+    def __init__(self, collection, calls):
+        self.collection = collection
+        self.calls = calls
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+        def call(*args, **kwargs):
+            self.calls.append(f'{self.collection.name}.{name}')
+            return method(*args, **kwargs)
+        return call
+
+@pytest.mark.parametrize('facilities, expected', [(1, 7), (50, 8)])
+def test_ingest_round_trips(db, client, monkeypatch, facilities, expected):
+    headers = {'X-API-Key': 'test-key'}
+    def batch(inactive):
+        return [{'facility_id': str(10000 + i), 'active_beds': 10, 'inactive_beds': inactive} for i in range(facilities)]
+    oxyleap.hospitals_snapshot()  # Loaded before counting, as a running worker has it
+    client.post('/api/bed_stats', headers=headers, json=batch(5))
+
+    calls = []
+    monkeypatch.setattr(oxyleap.mongo, 'db', CountingDatabase(db, calls))
+    monkeypatch.setattr(oxyleap, '_read_db', [None, None])
+    response = client.post('/api/bed_stats', headers=headers, json=batch(6))
+    assert response.get_json()['changed'] == facilities
+    assert len(calls) == expected, calls
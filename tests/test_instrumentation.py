@@ -0,0 +1,18 @@
+# Per-request timings and the Server-Timing header (instrumentation.py)
+
+import re
+
+def timing_counts(response):
+    return dict(re.findall(r'(\w+);dur=[\d.]+;desc="(\d+)x"', response.headers['Server-Timing']))
+
+# The tests run inside one app context, like a caller that pushed its own, so
+# every request shares `g`; its timings must still start from zero
+def test_timings_do_not_carry_over_between_requests(db, signed_in):
+    counts = [timing_counts(signed_in.get('/health_centers')) for _ in range(3)]
+    assert counts[0]['template'] == '1'
+    assert counts[1] == counts[2]
+    assert counts[2]['template'] == '1'
+
+def test_total_is_always_reported(db, client):
+    response = client.get('/metrics')
+    assert re.search(r'total;dur=[\d.]+$', response.headers['Server-Timing'])
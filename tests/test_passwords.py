@@ -0,0 +1,40 @@
+# Password hashing (passwords.py) and the upgrade of older hashes at sign-in
+
+import bcrypt
+from werkzeug.security import generate_password_hash
+
+import passwords
+from passwords import PREHASHED, hash_password, verify_password
+
+LONG = 'correct horse battery staple ' * 3  # Over bcrypt's 72 bytes
+
+def test_hash_round_trip(app):
+    password_hash = hash_password('s3cret')
+    assert password_hash.startswith(PREHASHED)
+    assert verify_password(password_hash, 's3cret') == (True, False)
+    assert verify_password(password_hash, 's3cret!') == (False, False)
+
+def test_long_passwords_do_not_collide_on_their_first_72_bytes(app):
+    password_hash = hash_password(LONG + 'one')
+    assert verify_password(password_hash, LONG + 'one')[0]
+    assert not verify_password(password_hash, LONG + 'two')[0]
+    assert not verify_password(password_hash, LONG.encode()[:72].decode())[0]
+
+def test_raw_bcrypt_hashes_verify_and_need_rehash(app):
+    legacy = bcrypt.hashpw(b's3cret', bcrypt.gensalt(4)).decode('ascii')
+    assert verify_password(legacy, 's3cret') == (True, True)
+    assert verify_password(legacy, 'wrong') == (False, False)
+
+def test_other_cost_needs_rehash(app, monkeypatch):
+    password_hash = hash_password('s3cret')
+    monkeypatch.setitem(passwords._settings, 'rounds', 5)
+    assert verify_password(password_hash, 's3cret') == (True, True)
+
+def test_long_werkzeug_hash_is_upgraded_without_truncation(db, client):
+    db.users.insert_one({'username': 'legacy', 'email': 'legacy@example.com',
+                         'password': generate_password_hash(LONG + 'one')})
+    client.post('/signin', data={'username': 'legacy', 'password': LONG + 'one'})
+    upgraded = db.users.find_one({'username': 'legacy'})['password']
+    assert upgraded.startswith(PREHASHED)
+    assert verify_password(upgraded, LONG + 'one')[0]
+    assert not verify_password(upgraded, LONG + 'two')[0]
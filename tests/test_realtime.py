@@ -0,0 +1,90 @@
+# Bed status push (realtime.py) through Flask-SocketIO's test client, on the
+# in-process server the testing app uses instead of a Redis message queue.
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from realtime import publish_bed_statuses, socketio
+
+HOSPITALS = [
+    {'facility_id': '10001', 'name': 'NORTH HOSPITAL', 'hospital_type': 'Acute Care Hospitals', 'state': 'AL'},
+    {'facility_id': '10002', 'name': 'SOUTH HOSPITAL', 'hospital_type': 'Psychiatric', 'state': 'TX'},
+]
+
+@pytest.fixture
+def hospitals(db):
+    db.hospitals.insert_many([dict(hospital) for hospital in HOSPITALS])
+    return HOSPITALS
+
+def connect(app, client):
+    return socketio.test_client(app, flask_test_client=client)
+
+# The bed_status rows a socket received
+def received_rows(socket):
+    return [row for event in socket.get_received() if event['name'] == 'bed_status' for row in event['args'][0]['d']]
+
+def update(facility_id, active, inactive, minutes_ago=0):
+    timestamp = datetime.now() - timedelta(minutes=minutes_ago)
+    return {'facility_id': facility_id, 'active_beds': active, 'inactive_beds': inactive, 'timestamp': timestamp.isoformat()}
+
+def test_anonymous_sockets_are_refused(app, client):
+    socket = connect(app, client)
+    assert not socket.is_connected()
+
+def test_signed_in_socket_subscribes(app, signed_in):
+    socket = connect(app, signed_in)
+    assert socket.is_connected()
+    assert socket.emit('subscribe', {'states': ['TX']}, callback=True) == {'rooms': ['state:TX']}
+    assert socket.emit('subscribe', {}, callback=True) == {'rooms': ['all']}
+    socket.disconnect()
+
+def test_push_reaches_subscribed_rooms_once(app, signed_in):
+    everything = connect(app, signed_in)
+    everything.emit('subscribe', {})
+    texas = connect(app, signed_in)
+    texas.emit('subscribe', {'states': ['TX'], 'hospital_types': ['Psychiatric']})
+    everything.get_received()
+    texas.get_received()
+
+    with app.app_context():
+        sent = publish_bed_statuses([
+            (HOSPITALS[0], {'status': 'Available', 'inactive_beds': 4}),
+            (HOSPITALS[1], {'status': 'Full', 'inactive_beds': 0}),
+        ])
+    assert sent == 2
+    assert sorted(received_rows(everything)) == [['10001', 'Available', 4], ['10002', 'Full', 0]]
+    # Subscribed to two of the facility's rooms, still one row
+    assert received_rows(texas) == [['10002', 'Full', 0]]
+    everything.disconnect()
+    texas.disconnect()
+
+def test_ingest_pushes_only_changed_statuses(app, signed_in, hospitals):
+    socket = connect(app, signed_in)
+    socket.emit('subscribe', {})
+    socket.get_received()
+    headers = {'X-API-Key': 'test-key'}
+
+    first = signed_in.post('/api/bed_stats', json=[update('10001', 10, 5)], headers=headers)
+    assert first.status_code == 200 and first.get_json()['changed'] == 1
+    assert [row[0] for row in received_rows(socket)] == ['10001']
+
+    # Same status again: recorded as unchanged, nothing pushed
+    again = signed_in.post('/api/bed_stats', json=[update('10001', 10, 5)], headers=headers)
+    assert again.get_json()['changed'] == 0
+    assert received_rows(socket) == []
+    socket.disconnect()
+
+def test_status_changed_by_another_worker_is_pushed_again(app, db, signed_in, hospitals):
+    socket = connect(app, signed_in)
+    socket.emit('subscribe', {})
+    headers = {'X-API-Key': 'test-key'}
+    signed_in.post('/api/bed_stats', json=[update('10001', 10, 5)], headers=headers)
+    socket.get_received()
+
+    # Another worker recorded a different status meanwhile
+    db.bed_statuses.update_one({'_id': '10001'}, {'$set': {'status': 'Other'}})
+    response = signed_in.post('/api/bed_stats', json=[update('10001', 10, 5)], headers=headers)
+    assert response.get_json()['changed'] == 1
+    assert [row[0] for row in received_rows(socket)] == ['10001']
+    socket.disconnect()
@@ -0,0 +1,174 @@
+# Maintenance jobs (tasks.py) against the in-memory Celery broker, mongomock and
+# fakeredis. Job functions are replaced by the two below, so no job does real work.
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import tasks
+from app import get_redis
+from locks import Lease
+from tasks import LEASE_PREFIX, QUEUE_TIMEOUT, STALE_AFTER, Progress, enqueue_job, finish_job, run_job
+
+# Jobs the tests run in place of the real ones
+@pytest.fixture
+def jobs(monkeypatch):
+    calls = []
+
+    def succeed(progress):
+        calls.append('succeed')
+        progress(1, 2)
+        progress(2, 2)
+        return {'rows': 2}
+
+    def fail(progress):
+        calls.append('fail')
+        raise RuntimeError("disk full")
+
+    # app.py shares the dictionary, so the endpoints see these too
+    monkeypatch.setitem(tasks.JOBS, 'succeed', succeed)
+    monkeypatch.setitem(tasks.JOBS, 'fail', fail)
+    return calls
+
+# Reads the messages queued on the in-memory broker since the test started,
+# which no worker consumes
+@pytest.fixture
+def sent(app):
+    celery = app.extensions['celery']
+    queue_name = celery.conf.task_default_queue
+
+    def drain():
+        messages = []
+        with celery.connection_for_write() as connection:
+            queue = connection.SimpleQueue(queue_name)
+            while True:
+                try:
+                    message = queue.get(block=False)
+                except queue.Empty:
+                    break
+                messages.append((message.headers['task'], message.headers['id']))
+                message.ack()
+            queue.close()
+        return messages
+
+    drain()
+    return drain
+
+# Run a queued job in this process, as a worker would
+def run(name, job_id):
+    return run_job.apply(args=(name, job_id))
+
+# The lease runs of a job hold
+def lease_for(name, owner=None):
+    return Lease(get_redis(), LEASE_PREFIX + name, int(STALE_AFTER.total_seconds()), owner=owner)
+
+def test_enqueue_is_deduplicated_while_active(db, jobs, sent):
+    job, created = enqueue_job('succeed')
+    again, created_again = enqueue_job('succeed')
+    assert created and not created_again
+    assert again['_id'] == job['_id']
+    assert db.jobs.count_documents({'name': 'succeed'}) == 1
+    assert sent() == [('oxyleap.run_job', job['_id'])]
+
+def test_unknown_job(db, jobs):
+    with pytest.raises(KeyError):
+        enqueue_job('nope')
+
+def test_finished_run_can_be_queued_again(db, jobs, sent):
+    job, _ = enqueue_job('succeed')
+    finish_job(db, job['_id'], 'succeeded')
+    retry, created = enqueue_job('succeed')
+    assert created and retry['_id'] != job['_id']
+
+def test_stale_runs_are_abandoned(db, jobs, sent):
+    now = datetime.now()
+    db.jobs.insert_one({'_id': 'queued', 'name': 'succeed', 'state': 'queued', 'active': True,
+                        'queued_at': now - QUEUE_TIMEOUT - timedelta(minutes=1)})
+    job, created = enqueue_job('succeed')
+    assert created
+    assert db.jobs.find_one({'_id': 'queued'})['state'] == 'failed'
+
+    db.jobs.insert_one({'_id': 'running', 'name': 'fail', 'state': 'running', 'active': True,
+                        'queued_at': now, 'heartbeat_at': now - STALE_AFTER - timedelta(minutes=1)})
+    job, created = enqueue_job('fail')
+    abandoned = db.jobs.find_one({'_id': 'running'})
+    assert created
+    assert abandoned['state'] == 'failed' and 'active' not in abandoned
+    assert abandoned['error'].startswith('Abandoned')
+
+def test_live_run_is_not_abandoned(db, jobs, sent):
+    now = datetime.now()
+    db.jobs.insert_one({'_id': 'running', 'name': 'succeed', 'state': 'running', 'active': True,
+                        'queued_at': now - QUEUE_TIMEOUT * 2, 'heartbeat_at': now})
+    job, created = enqueue_job('succeed')
+    assert not created and job['_id'] == 'running'
+
+def test_run_records_result_and_progress(db, jobs, sent):
+    job, _ = enqueue_job('succeed')
+    run('succeed', job['_id'])
+    job = db.jobs.find_one({'_id': job['_id']})
+    assert jobs == ['succeed']
+    assert job['state'] == 'succeeded' and 'active' not in job
+    assert job['result'] == {'rows': 2}
+    assert job['progress'] == {'done': 2, 'total': 2}
+    # The lease is released once the run is over
+    assert not lease_for('succeed').client.exists(LEASE_PREFIX + 'succeed')
+
+def test_failed_run_is_recorded_and_can_be_retried(db, jobs, sent):
+    job, _ = enqueue_job('fail')
+    result = run('fail', job['_id'])
+    assert result.failed()
+    failed = db.jobs.find_one({'_id': job['_id']})
+    assert failed['state'] == 'failed' and failed['error'] == "RuntimeError: disk full"
+    retry, created = enqueue_job('fail')
+    assert created and retry['_id'] != job['_id']
+
+def test_run_started_elsewhere_is_not_run_twice(db, jobs, sent):
+    job, _ = enqueue_job('succeed')
+    run('succeed', job['_id'])
+    run('succeed', job['_id'])  # Redelivered
+    assert jobs == ['succeed']
+
+def test_run_is_skipped_while_the_lease_is_held(db, jobs, sent):
+    holder = lease_for('succeed', owner='abandoned-run')
+    assert holder.acquire()
+    job, _ = enqueue_job('succeed')
+    run('succeed', job['_id'])
+    skipped = db.jobs.find_one({'_id': job['_id']})
+    assert jobs == []
+    assert skipped['state'] == 'skipped' and 'active' not in skipped
+    assert holder.client.get(holder.key) == b'abandoned-run'
+
+def test_progress_is_throttled_and_renews_the_lease(db, monkeypatch):
+    db.jobs.insert_one({'_id': 'job', 'name': 'succeed', 'state': 'running', 'active': True})
+    lease = lease_for('succeed', owner='job')
+    assert lease.acquire()
+    lease.client.expire(lease.key, 5)
+    clock = [100.0]
+    monkeypatch.setattr(tasks.time, 'monotonic', lambda: clock[0])
+    progress = Progress(db, 'job', lease)
+
+    progress(1, 10)
+    assert db.jobs.find_one({'_id': 'job'})['progress'] == {'done': 1, 'total': 10}
+    assert lease.client.ttl(lease.key) > 5
+
+    progress(2, 10)  # Too soon after the last write
+    assert db.jobs.find_one({'_id': 'job'})['progress'] == {'done': 1, 'total': 10}
+    progress(10, 10)  # Completion is always recorded
+    assert db.jobs.find_one({'_id': 'job'})['progress'] == {'done': 10, 'total': 10}
+
+    clock[0] += tasks.PROGRESS_INTERVAL
+    progress(3, 10)
+    job = db.jobs.find_one({'_id': 'job'})
+    assert job['progress'] == {'done': 3, 'total': 10}
+    assert job['heartbeat_at'] > datetime.now() - timedelta(seconds=5)
+
+def test_start_job_endpoint(db, jobs, sent, client):
+    assert client.post('/api/jobs/succeed').status_code == 401
+    headers = {'X-API-Key': 'admin-key'}
+    assert client.post('/api/jobs/nope', headers=headers).status_code == 404
+    first = client.post('/api/jobs/succeed', headers=headers)
+    second = client.post('/api/jobs/succeed', headers=headers)
+    assert first.status_code == 202 and second.status_code == 200
+    assert first.get_json()['id'] == second.get_json()['id']
+    assert first.get_json()['state'] == 'queued'
@@ -0,0 +1,149 @@
+# Request coalescing and rate limiting (traffic.py)
+
+import threading
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from fakeredis.commands_mixins import server_mixin
+
+import traffic
+from traffic import LocalBuckets, RateLimiter, SingleFlight
+
+# Runs flights.do(key, fn) on a thread, keeping what it returned or raised
+class Caller(threading.Thread):
+    def __init__(self, flights, key, fn):
+        super().__init__(daemon=True)
+        self.flights, self.key, self.fn = flights, key, fn
+        self.result = self.error = None
+
+    def run(self):
+        try:
+            self.result = self.flights.do(self.key, self.fn)
+        except Exception as e:
+            self.error = e
+
+# A leader blocked in fn() until released, with `followers` callers behind it
+def in_flight(flights, fn, followers=4):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def leader_fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return fn()
+
+    leader = Caller(flights, 'page', leader_fn)
+    leader.start()
+    assert started.wait(5)
+    waiting = [Caller(flights, 'page', leader_fn) for _ in range(followers)]
+    for caller in waiting:
+        caller.start()
+    time.sleep(0.1)  # Followers are now waiting on the leader
+    release.set()
+    for caller in [leader] + waiting:
+        caller.join(5)
+    return leader, waiting, calls
+
+def test_followers_share_the_leaders_result():
+    flights = SingleFlight()
+    leader, followers, calls = in_flight(flights, lambda: 'page')
+    assert len(calls) == 1
+    assert leader.result == ('page', False)
+    assert all(follower.result == ('page', True) for follower in followers)
+    assert flights.calls == {}
+    assert flights.do('page', lambda: 'again') == ('again', False)  # Nothing is cached afterwards
+
+def test_leader_error_reaches_every_follower():
+    flights = SingleFlight()
+    def fail():
+        raise RuntimeError("render failed")
+    leader, followers, calls = in_flight(flights, fail)
+    assert len(calls) == 1
+    assert isinstance(leader.error, RuntimeError)
+    assert all(follower.error is leader.error for follower in followers)
+    assert flights.calls == {}
+
+def test_follower_computes_itself_when_the_leader_is_stuck():
+    flights = SingleFlight(timeout=0.05)
+    release = threading.Event()
+    leader = Caller(flights, 'page', lambda: release.wait(5) and 'late')
+    leader.start()
+    time.sleep(0.02)
+    assert flights.do('page', lambda: 'own') == ('own', False)
+    release.set()
+    leader.join(5)
+    assert leader.result == ('late', False)
+
+def test_different_keys_do_not_wait_for_each_other():
+    flights = SingleFlight()
+    release = threading.Event()
+    leader = Caller(flights, 'a', lambda: release.wait(5))
+    leader.start()
+    time.sleep(0.02)
+    assert flights.do('b', lambda: 'b') == ('b', False)
+    release.set()
+    leader.join(5)
+
+class Clock:
+    def __init__(self):
+        self.now = 1_800_000_000.0
+
+    def __call__(self):
+        return self.now
+
+# One clock for the Lua script's TIME and the local buckets' monotonic time
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(server_mixin, 'time', SimpleNamespace(time=clock))
+    monkeypatch.setattr(traffic, 'time', SimpleNamespace(monotonic=clock))
+    return clock
+
+LIMITS = {'user:ana': (2.0, 5), 'ip:10.0.0.1': (0.5, 8)}
+
+# (seconds to advance, buckets, cost) steps exercising bursts, refills, the
+# stricter of two buckets and a denied take that leaves both untouched
+STEPS = [(0, LIMITS, 1)] * 6 + [(0.25, LIMITS, 1), (0.5, LIMITS, 1), (0.5, LIMITS, 1), (0, LIMITS, 3),
+         (10, LIMITS, 1), (0, {'ip:10.0.0.1': (0.5, 8)}, 2), (0, LIMITS, 1), (100, LIMITS, 5), (0, LIMITS, 1)]
+
+def test_lua_bucket_matches_local_buckets(clock):
+    limiter, local = RateLimiter(), LocalBuckets()
+    client = fakeredis.FakeStrictRedis()
+    outcomes = set()
+    for advance, limits, cost in STEPS:
+        clock.now += advance
+        allowed, wait = limiter.take(client, limits, cost)
+        expected_allowed, expected_wait = local.take(limits, cost)
+        assert allowed == expected_allowed
+        assert wait == pytest.approx(expected_wait, abs=1e-6)
+        outcomes.add(allowed)
+    assert outcomes == {True, False}
+
+def test_burst_then_refill(clock):
+    limiter, client = RateLimiter(), fakeredis.FakeStrictRedis()
+    limits = {'user:ana': (2.0, 3)}
+    assert [limiter.take(client, limits)[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.take(client, limits) == (False, pytest.approx(0.5))
+    clock.now += 0.5
+    assert limiter.take(client, limits)[0]
+
+def test_unreachable_redis_falls_back_to_local_buckets(clock):
+    limiter = RateLimiter()
+    server = fakeredis.FakeServer()
+    server.connected = False  # Every command raises ConnectionError
+    client = fakeredis.FakeStrictRedis(server=server)
+    limits = {'user:ana': (1.0, 2)}
+    assert [limiter.take(client, limits)[0] for _ in range(3)] == [True, True, False]
+    assert limiter.local.buckets
+
+def test_rate_limited_page_answers_429(app, db, signed_in, monkeypatch):
+    monkeypatch.setitem(app.config, 'RATE_LIMITING', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_USER', (0.001, 2))
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_IP', None)
+    codes = [signed_in.get('/health_centers').status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+    response = signed_in.get('/health_centers')
+    assert int(response.headers['Retry-After']) >= 1
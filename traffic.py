@@ -0,0 +1,168 @@
+import threading
+import time
+from functools import wraps
+from flask import current_app, request, session
+import redis
+from breakers import CircuitOpen, redis_breaker
+from instrumentation import COALESCED_REQUESTS, RATE_LIMITED
+
+# Protection for the pages everyone opens at once during an incident.
+#
+# Single-flight coalescing: concurrent identical GET requests to a page share one
+# render. The first request computes it, and the ones arriving while it is in
+# flight wait for it and reuse the result instead of repeating the same queries
+# and predictions. Only for views whose output does not depend on the user.
+#
+# Token-bucket rate limiting per user and per client IP. Buckets live in Redis so
+# every worker enforces the same limit. When Redis is unreachable, each process
+# falls back to buckets of its own until the Redis circuit breaker closes again.
+
+# Concurrent calls with the same key share one execution of fn()
+class SingleFlight:
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    # (result, shared): shared is True when another caller computed the result
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        if not leader:
+            # A leader stuck past the timeout is not waited on any further
+            if call['done'].wait(self.timeout):
+                if call['error'] is not None:
+                    raise call['error']
+                return call['result'], True
+            return fn(), False
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+        return call['result'], False
+
+flights = SingleFlight()
+
+# Share a GET view's rendered page between concurrent requests for the same URL
+def coalesced(view):
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        if request.method != 'GET' or not current_app.config['COALESCE_REQUESTS']:
+            return view(*args, **kwargs)
+        result, shared = flights.do(request.full_path, lambda: view(*args, **kwargs))
+        COALESCED_REQUESTS.inc(request.endpoint, 'shared' if shared else 'computed')
+        return result
+    return decorated_function
+
+# Take `cost` tokens from every bucket in KEYS, or from none if any is short.
+# ARGV holds rate (tokens per second) and burst for each key, then the cost.
+# Returns {allowed, seconds until the request would be allowed}.
+TAKE_TOKENS = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost = tonumber(ARGV[#ARGV])
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or burst
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    tokens[i] = math.min(burst, available + elapsed * rate)
+    if tokens[i] < cost then
+        wait = math.max(wait, (cost - tokens[i]) / rate)
+    end
+end
+local allowed = wait == 0 and 1 or 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tokens[i] - allowed * cost, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {allowed, tostring(wait)}
+"""
+
+# The same buckets in process memory, for when Redis is unreachable
+class LocalBuckets:
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}  # key -> [tokens, updated at]
+
+    def take(self, limits, cost=1):
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) > self.MAX_BUCKETS:
+                self.buckets.clear()  # Everyone starts with a full bucket again
+            tokens = {}
+            wait = 0.0
+            for key, (rate, burst) in limits.items():
+                available, updated = self.buckets.get(key, (burst, now))
+                tokens[key] = min(burst, available + (now - updated) * rate)
+                if tokens[key] < cost:
+                    wait = max(wait, (cost - tokens[key]) / rate)
+            allowed = wait == 0
+            for key in limits:
+                self.buckets[key] = [tokens[key] - (cost if allowed else 0), now]
+        return allowed, wait
+
+class RateLimiter:
+    def __init__(self, prefix='oxyleap:ratelimit:'):
+        self.prefix = prefix
+        self.local = LocalBuckets()
+        self.scripts = {}  # Redis client -> registered script
+
+    # (allowed, retry after in seconds) for {bucket name: (rate, burst)}
+    def take(self, client, limits, cost=1):
+        script = self.scripts.get(client)
+        if script is None:
+            script = self.scripts[client] = client.register_script(TAKE_TOKENS)
+        keys = [self.prefix + name for name in limits]
+        args = [value for limit in limits.values() for value in limit] + [cost]
+        try:
+            allowed, wait = redis_breaker.call(script, keys=keys, args=args)
+        except CircuitOpen:
+            return self.local.take(limits, cost)
+        except redis.RedisError as e:
+            print(f"Rate limiting in process memory; Redis is unavailable: {e}")
+            return self.local.take(limits, cost)
+        return bool(allowed), float(wait)
+
+rate_limiter = RateLimiter()
+
+# Buckets that apply to the current request: the signed-in user and the client IP
+def request_limits(config):
+    limits = {}
+    if 'username' in session and config['RATE_LIMIT_USER']:
+        limits[f"user:{session['username']}"] = config['RATE_LIMIT_USER']
+    if config['RATE_LIMIT_IP']:
+        limits[f"ip:{request.remote_addr}"] = config['RATE_LIMIT_IP']
+    return limits
+
+# Answer 429 with Retry-After once the user or the IP has used up its tokens
+def rate_limited(get_client):
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            config = current_app.config
+            limits = request_limits(config) if config['RATE_LIMITING'] else {}
+            if limits:
+                allowed, wait = rate_limiter.take(get_client(), limits)
+                if not allowed:
+                    RATE_LIMITED.inc(request.endpoint)
+                    retry_after = max(1, int(wait + 0.999))
+                    return f"Too many requests. Please wait {retry_after}s and try again.", 429, {'Retry-After': str(retry_after)}
+            return view(*args, **kwargs)
+        return decorated_function
+    return decorator
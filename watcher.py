@@ -0,0 +1,122 @@
+import threading
+import time
+from datetime import datetime
+import redis
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+from locks import Lease
+
+# Background watcher on MongoDB change streams. It keeps cached data in step with
+# the database as it changes, rather than when a TTL runs out.
+#
+# Every process watches the `local` collections to refresh its own in-process
+# snapshots. Shared Redis entries only need one watcher, so the process holding
+# a short lease in Redis also watches the `shared` collections. That process
+# saves its resume token in meta/{_id: 'change_stream'} and continues from it
+# after a restart. If there is no token, or it has fallen off the oplog, the
+# watcher cannot tell what it missed and calls `on_reset` to drop the shared
+# entries.
+
+TOKEN_ID = 'change_stream'
+LEASE_KEY = 'oxyleap:change-watcher'
+LEASE_SECONDS = 10
+# How often the lease is renewed and the resume token saved
+SAVE_INTERVAL = 3
+
+# Server error codes: the resume token is no longer in the oplog, and change
+# streams are not available on a standalone server
+HISTORY_LOST = (280, 286)
+NOT_REPLICA_SET = 40573
+
+class ChangeWatcher:
+    def __init__(self, app, local, shared, on_reset):
+        self.app = app
+        self.local = local  # {collection: handler(change)} run in every process
+        self.shared = shared  # {collection: handler(change)} run by the lease holder only
+        self.on_reset = on_reset
+        client = redis.Redis.from_url(app.config['REDIS_URL'], socket_timeout=1, socket_connect_timeout=1)
+        self.lease = Lease(client, LEASE_KEY, LEASE_SECONDS)
+        self.stopped = threading.Event()
+        self.following = False  # A stream is open, so cached entries are kept current
+
+    def start(self):
+        # A greenlet under gevent's monkey patching, a daemon thread otherwise
+        threading.Thread(target=self.run, name='change-watcher', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        # The stream waits on the server for the next event, which the client-wide
+        # timeoutMS would cut short, so the watcher gets a client of its own
+        options = dict(self.app.config['MONGO_CLIENT_OPTIONS'])
+        options.pop('timeoutMS', None)
+        client = MongoClient(self.app.config['MONGO_URI'], **options)
+        db = client.get_default_database()
+        with self.app.app_context():
+            while not self.stopped.is_set():
+                try:
+                    self.watch(db, self.lease.acquire())
+                except OperationFailure as e:
+                    if e.code == NOT_REPLICA_SET:
+                        print("Change streams need a replica set; cached entries keep their short TTLs.")
+                        break
+                    if e.code in HISTORY_LOST:
+                        print("Change stream resume token expired; dropping shared cache entries.")
+                        db.meta.delete_one({'_id': TOKEN_ID})
+                        continue
+                    print(f"Change stream failed: {e}")
+                    self.stopped.wait(5)
+                except Exception as e:  # Network errors, or a handler that failed
+                    print(f"Change stream interrupted: {e}")
+                    self.stopped.wait(5)
+        self.lease.release()
+        client.close()
+
+    # Follow the stream until the watcher stops or this process gains or loses the
+    # lease, which changes the collections it has to watch
+    def watch(self, db, leader):
+        handlers = dict(self.local, **self.shared) if leader else dict(self.local)
+        pipeline = [{'$match': {'$or': [
+            {'ns.coll': {'$in': list(handlers)}},
+            {'operationType': {'$in': ['dropDatabase', 'invalidate']}},
+        ]}}]
+
+        token = None
+        if leader:
+            saved = db.meta.find_one({'_id': TOKEN_ID})
+            token = saved['token'] if saved else None
+            if token is None:
+                self.on_reset()
+        saved_token, saved_at = token, time.monotonic()
+
+        with db.watch(pipeline, full_document='updateLookup', resume_after=token, max_await_time_ms=1000) as stream:
+            self.following = True
+            try:
+                while stream.alive and not self.stopped.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        if change['operationType'] in ('dropDatabase', 'invalidate'):
+                            self.on_reset()
+                            for handler in self.local.values():
+                                handler(change)
+                            db.meta.delete_one({'_id': TOKEN_ID})  # A stream cannot resume past an invalidate
+                            return
+                        handlers[change['ns']['coll']](change)
+
+                    if time.monotonic() - saved_at >= SAVE_INTERVAL:
+                        saved_at = time.monotonic()
+                        # The token also advances while nothing changes, which keeps
+                        # it inside the oplog window
+                        if leader and stream.resume_token != saved_token:
+                            saved_token = stream.resume_token
+                            db.meta.update_one(
+                                {'_id': TOKEN_ID},
+                                {'$set': {'token': saved_token, 'saved_at': datetime.now()}},
+                                upsert=True
+                            )
+                        if self.lease.acquire() != leader:
+                            return
+            finally:
+                self.following = False
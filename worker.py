@@ -0,0 +1,28 @@
+from celery.signals import task_prerun, worker_ready
+from app import connect_datastores, create_app, prepare_database
+
+# Entry point for the Celery worker and scheduler of the maintenance jobs in tasks.py:
+#
+#   celery -A worker worker --loglevel=info      # runs jobs, MAINTENANCE_CONCURRENCY at a time
+#   celery -A worker beat --loglevel=info        # enqueues them on MAINTENANCE_SCHEDULE (one per deployment)
+#
+# or both in one process with `celery -A worker worker --beat`.
+app = create_app(connect=False)
+celery = app.extensions['celery']
+
+# The jobs rely on the indexes too (the unique one on active job runs above all),
+# whether or not a web server has started yet. It uses a short-lived client of
+# its own, closed before any task runs.
+@worker_ready.connect
+def prepare_worker(**kwargs):
+    prepare_database(app, import_dataset=False)
+
+# Connect in the process that runs the task, whichever pool the worker uses, so
+# pool processes never inherit MongoDB or Redis clients across a fork
+_connected = [False]
+
+@task_prerun.connect
+def connect_worker(**kwargs):
+    if not _connected[0]:
+        connect_datastores(app, watch=False)
+        _connected[0] = True
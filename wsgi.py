@@ -0,0 +1,23 @@
+from gevent import monkey
+monkey.patch_all()  # Before any other import, so MongoDB, Redis and HTTP calls yield
+
+from app import create_app, prepare_database, warm_reference_data
+
+# Entry point for gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+# and for a single cooperative process: python wsgi.py
+#
+# With preload_app the app and its reference data are built once in the master
+# and shared copy-on-write by the workers. MongoDB and Redis clients are only
+# created in each worker after the fork (post_fork in gunicorn.conf.py). The
+# master also creates the indexes and imports the dataset into an empty
+# database first, so every deployment starts from a prepared one.
+app = create_app(connect=False)
+prepare_database(app)
+warm_reference_data(app)
+
+if __name__ == '__main__':
+    from gevent import pywsgi
+    from geventwebsocket.handler import WebSocketHandler
+    from app import connect_datastores
+    connect_datastores(app)
+    pywsgi.WSGIServer(('', 8080), app, handler_class=WebSocketHandler).serve_forever()